@@ -1,6 +1,7 @@
 import argparse
 import yaml
 
+from src.generate_simulate import run_experiments as re_generate_simulate
 from src.generator import run_experiments as re_generator
 from src.simulator.simulate import run_experiments as re_simulator
 from src.utils import set_rng_seed
@@ -34,6 +35,8 @@ if __name__ == "__main__":
         entrypoint = re_simulator
     elif experiment_type == "generate":
         entrypoint = re_generator
+    elif experiment_type == "generate_simulate":
+        entrypoint = re_generate_simulate
     else:
         raise ValueError(f"Unknown experiment type {experiment_type}")
 
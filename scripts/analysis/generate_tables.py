@@ -1,102 +1,152 @@
-import pandas as pd
-
-# initialise metric considered
-metric = "gain_avg"
-metric_rel = f"{metric}_rel"
-
-# # this is for experiment A
-# csv_path = "data/results_processed/1_2_3_4_5/metrics.csv"
-# required_types = ("series_5", "series_4", "series_1", "series_3", "series_2")
-
-# # this is for experiment B
-# csv_path = "data/results_processed/1_6_7_8_9/metrics.csv"
-# required_types = ("series_9", "series_8", "series_1", "series_7", "series_6")
-
-# this is for experiment C
-csv_path = "data/results_processed/1_10_11_12_13/metrics.csv"
-required_types = ("series_13", "series_12", "series_1", "series_11", "series_10")
-
-# read csv
-df = pd.read_csv(csv_path, index_col=0)
-print(df)
-
-# filter df so that only records reflecting spreading regime common for all network_types are left
-grouped = df.groupby(['protocol', 'probab', 'seed_budget', 'ss_method'])
-filtered_df = grouped.filter(lambda g: set(g['net_type']) == set(required_types))
-print(filtered_df)
-
-# add a column with relative value of the analysed metric to the baseline series
-reference = (
-    filtered_df[filtered_df["net_type"] == "series_1"]
-    .set_index(["protocol", "probab", "seed_budget", "ss_method"])[metric]
-    .rename(f"metric_ref")
-)
-filtered_df = filtered_df.merge(
-    reference,
-    on=["protocol", "probab", "seed_budget", "ss_method"],
-    how="left"
-)
-filtered_df[metric_rel] = (
-    filtered_df[metric] - filtered_df["metric_ref"]
-) / filtered_df["metric_ref"]
-filtered_df = filtered_df.drop("metric_ref", axis=1)
-print(filtered_df)
-
-# # table grouped by protocol
-# a = filtered_df.groupby(["protocol", "ss_method", "net_type"]).mean().reset_index()
-# print(a)
-# b = a[["protocol", "net_type", metric_rel]].pivot(index="protocol", columns="net_type")
-# b = b[[(metric_rel, net_type) for net_type in required_types]]
-# b = b.round(4)
-# print(b)
-
-# # table grouped by pi
-# a = filtered_df.loc[filtered_df["protocol"] == "AND"].drop("protocol", axis=1)  # <- can be OR
-# a = a.groupby(["probab", "ss_method", "net_type"]).mean().reset_index()
-# print(a)
-# b = a[["probab", "net_type", metric_rel]].pivot(index="probab", columns="net_type")
-# b = b[[(metric_rel, net_type) for net_type in required_types]]
-# b = b.round(4)
-# print(b)
-
-# # table grouped by s
-# a = filtered_df.loc[filtered_df["protocol"] == "AND"].drop("protocol", axis=1)  # <- can be OR
-# a = a.groupby(["seed_budget", "ss_method", "net_type"]).mean().reset_index()
-# print(a)
-# b = a[["seed_budget", "net_type", metric_rel]].pivot(index="seed_budget", columns="net_type")
-# b = b[[(metric_rel, net_type) for net_type in required_types]]
-# b = b.round(4)
-# print(b)
-
-# # this is for experiment A
-# a = filtered_df
-# for proto in a["protocol"].unique():
-#     b = a.loc[a["protocol"] == proto]
-#     for s in b["seed_budget"].unique():
-#         c = b.loc[b["seed_budget"] == s]
-#         print(proto, s)
-#         d = c[["net_type", "probab", metric_rel]].pivot(index="probab", columns="net_type")
-#         d = d[[(metric_rel, net_type) for net_type in required_types]]
-#         d = d.round(4)
-#         print(d)
-#         d.to_latex(f"./A-{proto}-{s}.tex")
-
-# # this is for experiment B
-# for proto in ["AND", "OR"]:
-#     a = filtered_df.loc[filtered_df["protocol"] == proto].drop("protocol", axis=1)
-#     a = a.groupby(["probab", "ss_method", "net_type"]).mean().reset_index()
-#     b = a[["probab", "net_type", metric_rel]].pivot(index="probab", columns="net_type")
-#     b = b[[(metric_rel, net_type) for net_type in required_types]]
-#     b = b.round(4)
-#     print(b)
-#     b.to_latex(f"./B-{proto}.tex")
-
-# this is for experiment C
-for proto in ["AND", "OR"]:
-    a = filtered_df.loc[filtered_df["protocol"] == proto].drop("protocol", axis=1)
-    a = a.groupby(["probab", "ss_method", "net_type"]).mean().reset_index()
-    b = a[["probab", "net_type", metric_rel]].pivot(index="probab", columns="net_type")
-    b = b[[(metric_rel, net_type) for net_type in required_types]]
-    b = b.round(4)
-    print(b)
-    b.to_latex(f"./C-{proto}.tex")
\ No newline at end of file
+"""Tables of metrics relative to the baseline series for the paper."""
+
+import argparse
+from dataclasses import dataclass
+from itertools import product
+from pathlib import Path
+from typing import Sequence
+
+from src.aux.results_tables import RelativeMetrics, get_store_metrics_df
+from src.results_store import ResultsStore
+
+
+root_path = Path(__file__).resolve().parent.parent.parent
+
+
+@dataclass(frozen=True)
+class Experiment:
+    series: tuple[str, ...]  # IDs of series which results were processed together
+    required_types: tuple[str, ...]  # network types to compare (columns of tables)
+    split_by: tuple[str, ...]  # a table is saved for each combination of values of these params.
+    index: str = "probab"  # a parameter to be rows of tables
+
+
+EXPERIMENTS = {
+    "A": Experiment(
+        series=("1", "2", "3", "4", "5"),
+        required_types=("series_5", "series_4", "series_1", "series_3", "series_2"),
+        split_by=("protocol", "seed_budget"),
+    ),
+    "B": Experiment(
+        series=("1", "6", "7", "8", "9"),
+        required_types=("series_9", "series_8", "series_1", "series_7", "series_6"),
+        split_by=("protocol",),
+    ),
+    "C": Experiment(
+        series=("1", "10", "11", "12", "13"),
+        required_types=("series_13", "series_12", "series_1", "series_11", "series_10"),
+        split_by=("protocol",),
+    ),
+}
+
+
+def parse_args(*args: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "experiments",
+        help=f"Names of experiments to generate tables for (of: {', '.join(EXPERIMENTS)})",
+        nargs="*",
+        default=list(EXPERIMENTS),
+    )
+    parser.add_argument(
+        "--baseline_type", help="Type of the network to relate metrics to", default="series_1"
+    )
+    parser.add_argument("--metric", help="Metric to tabulate", default="gain_avg")
+    parser.add_argument(
+        "--pivots",
+        help="Additional parameters to print overview tables by (e.g. protocol probab seed_budget)",
+        nargs="*",
+        default=[],
+    )
+    parser.add_argument(
+        "--results_db",
+        help="SQLite database with results to compute metrics from instead of `metrics.csv` files",
+        type=str,
+        default=None,
+    )
+    parser.add_argument("--out_dir", help="Directory to save tables in", type=str, default=".")
+    return parser.parse_args(*args)
+
+
+def save_tables(
+    relative_metrics: RelativeMetrics,
+    name: str,
+    experiment: Experiment,
+    metric: str,
+    out_dir: Path,
+) -> None:
+    """Save a table of the experiment for each combination of values of `split_by` params."""
+    relative_df = relative_metrics.get_relative(experiment.required_types)
+    split_values = [relative_df[column].unique() for column in experiment.split_by]
+    for values in product(*split_values):
+        fixed_values = dict(zip(experiment.split_by, values))
+        table = relative_metrics.get_table(
+            experiment.required_types, experiment.index, metric, **fixed_values
+        )
+        print(name, *values)
+        print(table)
+        table.to_latex(out_dir / f"{'-'.join(map(str, [name, *values]))}.tex")
+
+
+def print_pivots(
+    relative_metrics: RelativeMetrics,
+    experiment: Experiment,
+    metric: str,
+    pivots: list[str],
+) -> None:
+    """Print tables by given parameters, apart from the protocol, separately for each protocol."""
+    relative_df = relative_metrics.get_relative(experiment.required_types)
+    for index in pivots:
+        protocols = [None] if index == "protocol" else relative_df["protocol"].unique()
+        for protocol in protocols:
+            fixed_values = {} if protocol is None else {"protocol": protocol}
+            print(f"by {index}", *fixed_values.values())
+            print(
+                relative_metrics.get_table(
+                    experiment.required_types, index, metric, **fixed_values
+                )
+            )
+
+
+def main(
+    experiments: list[str],
+    baseline_type: str,
+    metric: str,
+    pivots: list[str],
+    results_db: str | None,
+    out_dir: str,
+) -> None:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(exist_ok=True, parents=True)
+
+    # metrics are read once per source and relative metrics are cached by the engine
+    sources = {}  # {metrics source: relative metrics}
+    if results_db is not None:
+        with ResultsStore(results_db) as store:
+            sources[results_db] = RelativeMetrics(get_store_metrics_df(store), baseline_type)
+
+    for name in experiments:
+        experiment = EXPERIMENTS[name]
+        if results_db is None:
+            workdir = root_path / f"data/results_processed/{'_'.join(experiment.series)}"
+            source = workdir / "metrics.csv"
+            if source not in sources:
+                sources[source] = RelativeMetrics.from_csv(source, baseline_type)
+        else:
+            source = results_db
+        print(f"experiment {name}")
+        save_tables(sources[source], name, experiment, metric, out_dir)
+        print_pivots(sources[source], experiment, metric, pivots)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(args)
+    main(
+        experiments=args.experiments,
+        baseline_type=args.baseline_type,
+        metric=args.metric,
+        pivots=args.pivots,
+        results_db=args.results_db,
+        out_dir=args.out_dir,
+    )
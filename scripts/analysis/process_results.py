@@ -1,15 +1,27 @@
 """Statistical analysis of the results."""
 
 import argparse
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Sequence
+from typing import Any, Sequence
 
 import matplotlib.pyplot as plt
 import pandas as pd
-from matplotlib.backends.backend_pdf import PdfPages
+import pypdf
 
+from src.aux.results_aggregates import (
+    CHUNK_SIZE,
+    AggregatesCache,
+    get_metrics_df,
+    stream_cases_aggregates,
+)
 from src.aux.results_plotter import ResultsPlotter
 from src.aux.results_slicer import ResultsSlicer
+from src.result_handler import SUMMARY_FILE, CaseAggregates
+from src.results_store import ResultsStore
 
 
 root_path = Path(__file__).resolve().parent.parent.parent
@@ -34,80 +46,273 @@ def parse_args(*args: Sequence[str]) -> argparse.Namespace:
         default="series_1",
 
     )
+    parser.add_argument(
+        "--results_db",
+        help="SQLite database with results to query instead of loading results of the series",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Nb. of processes to analyse cases with (by default - nb. of CPUs)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Update cached aggregates and figures only with new or modified files of results",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="Stream results in chunks of that many rows instead of loading them into memory",
+        type=int,
+        default=None,
+    )
     return parser.parse_args(*args)
 
 
-def main(series_list: list[str], baseline_type: str) -> None:
-    print("loading data")
-    csv_files = []
-    for series in series_list:
-        series_csvs = (root_path / f"data/results_raw/series_{series}").glob("**/*.csv")
-        csv_files.extend(list(series_csvs))
-    results = ResultsSlicer(results_paths=csv_files, baseline_type=baseline_type)
+def get_case_name(protocol: str, probab: float, seed_budget: int, ss_method: str) -> str:
+    return f"δ={protocol}, π={probab}, s={seed_budget}, φ={ss_method}"
+
+
+def plot_case(
+    records_experiments: dict[str, dict[str, Any]], baseline_type: str, case_name: str
+) -> plt.Figure:
+    fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(4, 5))
+    ResultsPlotter().plot_single_comparison_dynamics(
+        records_experiments=records_experiments,
+        baseline_key=baseline_type,
+        title=case_name,
+        ax=ax,
+    )
+    fig.tight_layout()
+    return fig
+
+
+_results: ResultsSlicer | None = None  # results shared with workers processing cases
+_expositions_recs: dict[tuple[Any, ...], dict[str, Any]] | None = None
 
-    # create out dir
-    workdir = root_path / f"data/results_processed/{'_'.join([s for s in series_list])}"
-    workdir.mkdir(exist_ok=True, parents=True)
 
-    # analyse the results
-    out_pdf = PdfPages(workdir.joinpath(f"expositions.pdf"))
+def init_worker(
+    results: ResultsSlicer | None,
+    expositions_recs: dict[tuple[Any, ...], dict[str, Any]] | None,
+    results_db: str | None,
+    baseline_type: str,
+) -> None:
+    """Set results for the worker; with the database each worker opens its own connection."""
+    global _results, _expositions_recs
+    if results_db is not None:
+        results = ResultsSlicer([], baseline_type, results_store=ResultsStore(results_db))
+    _results = results
+    _expositions_recs = expositions_recs
+
+
+def process_case(
+    case_idx: int, case: tuple[str, float, int, str], pages_dir: Path
+) -> tuple[list[dict[str, Any]], Path | None]:
+    """
+    Compute metrics of the case and plot its spreading dynamics.
+
+    :return: rows of the table with average metrics and a path to the PDF file in `pages_dir`
+        with the plot (None if there are no results for the case)
+    """
+    protocol, probab, seed_budget, ss_method = case
+    case_name = get_case_name(*case)
+    print(case_name)
+
+    # for each case obtain partial raw results
+    records_experiments = {}
     out_csv = []
-    for (protocol, probab, seed_budget, ss_method) in results.get_combinations():
-        case_name = f"δ={protocol}, π={probab}, s={seed_budget}, φ={ss_method}"
-        print(case_name)
-
-        # for each case obtain partial raw results
-        records_experiments = {}
-        for net_type in results.get_net_types():
-            results_slice = results.get_slice(
-                protocol=protocol,
-                probab=probab,
-                seed_budget=seed_budget,
-                ss_method=ss_method,
-                net_type=net_type,
-            )
-            if len(results_slice) == 0:
-                print(f"\tno results found for {net_type}")
-                continue
-
-            # compute mean expositions for the visualisation
-            records_experiments[net_type] = results.mean_expositions_rec(results_slice)
-        
-            # update table with average metrics
-            out_csv.append(
-                {
-                    "protocol": protocol,
-                    "probab": probab,
-                    "seed_budget": seed_budget,
-                    "ss_method": ss_method,
-                    "net_type": net_type,
-                    "gain_avg": results_slice["gain"].mean(),
-                    "gain_std": results_slice["gain"].std(),
-                    "area_avg": results_slice["area"].mean(),
-                    "area_std": results_slice["area"].std(),
-                }
-            )
-
-        # plot spreading dynamics        
-        if len(records_experiments) == 0:
+    for net_type in _results.get_net_types():
+        results_slice = _results.get_slice(
+            protocol=protocol,
+            probab=probab,
+            seed_budget=seed_budget,
+            ss_method=ss_method,
+            net_type=net_type,
+        )
+        if len(results_slice) == 0:
+            print(f"\tno results found for {net_type}")
             continue
-        fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(4, 5))
-        ResultsPlotter().plot_single_comparison_dynamics(
-            records_experiments=records_experiments,
-            baseline_key=results.baseline_type,
-            title=case_name,
-            ax=ax,
+
+        # compute mean expositions for the visualisation
+        if _expositions_recs is None:
+            records_experiments[net_type] = _results.mean_expositions_rec(results_slice)
+        else:
+            records_experiments[net_type] = _expositions_recs[
+                (protocol, probab, seed_budget, ss_method, net_type)
+            ]
+
+        # update table with average metrics
+        out_csv.append(
+            {
+                "protocol": protocol,
+                "probab": probab,
+                "seed_budget": seed_budget,
+                "ss_method": ss_method,
+                "net_type": net_type,
+                "gain_avg": results_slice["gain"].mean(),
+                "gain_std": results_slice["gain"].std(),
+                "area_avg": results_slice["area"].mean(),
+                "area_std": results_slice["area"].std(),
+            }
         )
-        fig.tight_layout()
-        fig.savefig(out_pdf, format="pdf")
-        plt.close(fig)
 
-    # save results
+    # plot spreading dynamics
+    if len(records_experiments) == 0:
+        return out_csv, None
+    fig = plot_case(records_experiments, _results.baseline_type, case_name)
+    page = pages_dir / f"{case_idx:06d}.pdf"
+    fig.savefig(page, format="pdf")
+    plt.close(fig)
+    return out_csv, page
+
+
+def save_aggregated_outputs(
+    aggregates: dict[tuple[Any, ...], CaseAggregates],
+    baseline_type: str,
+    workdir: Path,
+    affected: set[tuple[str, float, int, str]] | None = None,
+) -> None:
+    """
+    Save metrics and pages of cases computed from their aggregates.
+
+    :param affected: cases changed since the last run; if given, pages of other cases are reused
+        from `workdir`
+    """
+    cases = sorted({case[:4] for case in aggregates})
+    cases_aggregates = {}
+    for (*case, net_type), case_aggregates in sorted(aggregates.items()):
+        cases_aggregates.setdefault(tuple(case), {})[net_type] = case_aggregates
+
+    def render_case(case: tuple[str, float, int, str]) -> plt.Figure:
+        records_experiments = {
+            net_type: case_aggregates.get_expositions_rec()
+            for net_type, case_aggregates in cases_aggregates[case].items()
+        }
+        return plot_case(records_experiments, baseline_type, get_case_name(*case))
+
+    pages_dir = workdir / f"pages--{baseline_type}"
+    pages_dir.mkdir(exist_ok=True)
+    pages = {case: pages_dir / f"{'--'.join(map(str, case))}.pdf" for case in cases}
+    for page in set(pages_dir.glob("*.pdf")) - set(pages.values()):
+        page.unlink()
+    out_pdf = pypdf.PdfWriter()
+    for case, page in pages.items():
+        if affected is None or case in affected or not page.exists():
+            fig = render_case(case)
+            fig.savefig(page, format="pdf")
+            plt.close(fig)
+        out_pdf.append(page)
+    out_pdf.write(workdir / "expositions.pdf")
     out_pdf.close()
+
+    get_metrics_df(aggregates).to_csv(workdir / "metrics.csv")
+
+
+def main_incremental(
+    csv_files: list[Path], baseline_type: str, workdir: Path, chunk_size: int = CHUNK_SIZE
+) -> None:
+    """
+    Process results reading only files which are new or were modified since the last run.
+
+    Aggregates of cases are cached per file of raw results (or of summaries saved by the simulator),
+    and pages of cases are cached as well, so that only pages of cases
+    affected by changed files are rendered.
+    """
+    cache = AggregatesCache(workdir / "aggregates.pkl")
+    affected = {case[:4] for case in cache.update(csv_files, chunk_size)}
+    aggregates = cache.get_aggregates()
+    print(f"cases to update: {len(affected)}/{len({case[:4] for case in aggregates})}")
+    save_aggregated_outputs(aggregates, baseline_type, workdir, affected)
+    cache.save()
+
+
+def main(
+    series_list: list[str],
+    baseline_type: str,
+    results_db: str | None = None,
+    workers: int | None = None,
+    incremental: bool = False,
+    chunk_size: int | None = None,
+) -> None:
+    print("loading data")
+    csv_files = []
+    if results_db is None:
+        for series in series_list:
+            series_dir = root_path / f"data/results_raw/series_{series}"
+            # other files (e.g. records of adaptive realisations) are not results of simulations
+            csv_files.extend(list(series_dir.glob("**/results--*.csv")))
+            csv_files.extend(list(series_dir.glob(f"**/{SUMMARY_FILE}")))
+            csv_files.extend(list(series_dir.glob("**/results--*.parquet")))
+    workdir = root_path / f"data/results_processed/{'_'.join([s for s in series_list])}"
+    workdir.mkdir(exist_ok=True, parents=True)
+    summaries = [path for path in csv_files if path.name == SUMMARY_FILE]
+    csv_files = [path for path in csv_files if path.name != SUMMARY_FILE]
+    if incremental or chunk_size is not None:
+        if results_db is not None:
+            raise ValueError("Incremental or chunked processing works only with files of results!")
+        # summaries saved by the simulator replace raw results saved next to them
+        summarised_dirs = {path.parent for path in summaries}
+        csv_files = [path for path in csv_files if path.parent not in summarised_dirs]
+        csv_files = sorted(csv_files + summaries)
+        chunk_size = CHUNK_SIZE if chunk_size is None else chunk_size
+        if incremental:
+            return main_incremental(csv_files, baseline_type, workdir, chunk_size)
+        aggregates = stream_cases_aggregates(csv_files, chunk_size)
+        return save_aggregated_outputs(aggregates, baseline_type, workdir)
+
+    results = ResultsSlicer(
+        results_paths=csv_files,
+        baseline_type=baseline_type,
+        results_store=None if results_db is None else ResultsStore(results_db),
+    )
+
+    # compute mean expositions of all slices at once if the results are loaded to memory
+    expositions_recs = None if results_db is not None else results.mean_expositions_recs()
+
+    # analyse the results; cases are processed in parallel, pages are rendered to separate files
+    # and outputs are merged in order of cases
+    cases = list(results.get_combinations())
+    workers = os.cpu_count() if workers is None else workers
+    init_args = (None if results_db else results, expositions_recs, results_db, baseline_type)
+    out_csv = []
+    out_pdf = pypdf.PdfWriter()
+    with tempfile.TemporaryDirectory(dir=workdir) as pages_dir:
+        if workers > 1:
+            with ProcessPoolExecutor(workers, initializer=init_worker, initargs=init_args) as pool:
+                cases_outputs = list(
+                    pool.map(
+                        process_case,
+                        range(len(cases)),
+                        cases,
+                        repeat(Path(pages_dir)),
+                        chunksize=4,
+                    )
+                )
+        else:
+            init_worker(*init_args)
+            cases_outputs = map(process_case, range(len(cases)), cases, repeat(Path(pages_dir)))
+        for case_csv, case_page in cases_outputs:
+            out_csv.extend(case_csv)
+            if case_page is not None:
+                out_pdf.append(case_page)
+
+        # save results
+        out_pdf.write(workdir / "expositions.pdf")
+        out_pdf.close()
     pd.DataFrame(out_csv).to_csv(workdir / "metrics.csv")
 
 
 if __name__ == "__main__":
     args = parse_args()
     print(args)
-    main(series_list=args.series, baseline_type=args.baseline_type)
+    main(
+        series_list=args.series,
+        baseline_type=args.baseline_type,
+        results_db=args.results_db,
+        workers=args.workers,
+        incremental=args.incremental,
+        chunk_size=args.chunk_size,
+    )
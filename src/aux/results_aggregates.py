@@ -0,0 +1,235 @@
+"""Script with mergeable aggregates of results to process them incrementally or in chunks."""
+
+import os
+import pickle
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src.aux.results_slicer import ResultsSlicer, rename_mlnabcd_networks
+from src.result_handler import (
+    SUMMARY_FILE,
+    SUMMARY_KEYS,
+    CaseAggregates,
+    RaggedArray,
+    merge_summaries,
+    read_results_chunks,
+    read_summary,
+)
+
+
+CHUNK_SIZE = 100_000  # default nb. of rows of results read at once when they're streamed
+AGGREGATED_COLUMNS = [
+    *ResultsSlicer.case_keys,
+    "network_name",
+    "gain",
+    "area",
+    "exposed_nb",
+    "unexposed_nb",
+    "expositions_rec",
+]
+
+
+def get_slices_aggregates(
+    raw_df: pd.DataFrame,
+    expositions: RaggedArray,
+    slices_idx: dict[tuple[Any, ...], np.ndarray],
+) -> dict[tuple[Any, ...], CaseAggregates]:
+    """
+    Compute aggregates of slices of results.
+
+    :param raw_df: results as loaded by `ResultsSlicer`
+    :param expositions: records of expositions aligned with rows of `raw_df`
+    :param slices_idx: positions of rows of slices keyed by values of `ResultsSlicer.case_keys`
+    """
+    groups = np.full(len(raw_df), -1, dtype=np.int64)
+    for group, slice_idx in enumerate(slices_idx.values()):
+        groups[slice_idx] = group
+    groups_nb = len(slices_idx)
+    is_grouped = groups >= 0
+    groups = groups[is_grouped]
+
+    def group_sum(values: np.ndarray) -> np.ndarray:
+        return np.bincount(groups, weights=values[is_grouped], minlength=groups_nb)
+
+    def group_moments(values: np.ndarray, is_defined: np.ndarray) -> tuple[np.ndarray, ...]:
+        values = np.where(is_defined, values, 0.)
+        nb = group_sum(is_defined.astype(float))
+        mean = group_sum(values) / np.maximum(nb, 1)
+        sq_dev = np.where(is_defined[is_grouped], (values[is_grouped] - mean[groups]) ** 2, 0.)
+        m2 = np.bincount(groups, weights=sq_dev, minlength=groups_nb)
+        return nb.astype(int), mean, m2
+
+    gains = raw_df["gain"].to_numpy(dtype=float)
+    _, gain_mean, gain_m2 = group_moments(gains, np.ones(len(gains), dtype=bool))
+    areas = raw_df["area"].to_numpy(dtype=float)
+    area_nb, area_mean, area_m2 = group_moments(areas, ~np.isnan(areas))
+    actors = (raw_df["exposed_nb"] + raw_df["unexposed_nb"]).to_numpy(dtype=float)
+
+    # aggregate curves of expositions over cells of the flattened curves of groups
+    expositions = expositions.take(np.flatnonzero(is_grouped))
+    lengths = expositions.lengths
+    steps_nb = np.zeros(groups_nb, dtype=np.int64)
+    np.maximum.at(steps_nb, groups, lengths)
+    curves_offsets = np.concatenate([[0], np.cumsum(steps_nb)])
+    values_steps = np.arange(len(expositions.values))
+    values_steps -= np.repeat(expositions.offsets[:-1], lengths)
+    cells = curves_offsets[np.repeat(groups, lengths)] + values_steps
+    values = expositions.values.astype(float)
+    runs_nb = np.bincount(groups, minlength=groups_nb)
+    cells_runs_nb = np.repeat(runs_nb, steps_nb)
+    curves_mean = np.bincount(cells, weights=values, minlength=curves_offsets[-1]) / cells_runs_nb
+    padded_nb = cells_runs_nb - np.bincount(cells, minlength=curves_offsets[-1])
+    curves_m2 = np.bincount(
+        cells, weights=(values - curves_mean[cells]) ** 2, minlength=curves_offsets[-1]
+    ) + padded_nb * curves_mean ** 2
+
+    aggregates = zip(
+        runs_nb.tolist(),
+        group_sum(actors).tolist(),
+        gain_mean.tolist(),
+        gain_m2.tolist(),
+        area_nb.tolist(),
+        area_mean.tolist(),
+        area_m2.tolist(),
+        zip(curves_offsets[:-1], curves_offsets[1:]),
+    )
+    return {
+        case: CaseAggregates(
+            runs_nb=runs_nb,
+            actors_sum=actors_sum,
+            gain_mean=gain_mean,
+            gain_m2=gain_m2,
+            area_nb=area_nb,
+            area_mean=area_mean,
+            area_m2=area_m2,
+            curve_mean=curves_mean[start:end],
+            curve_m2=curves_m2[start:end],
+        )
+        for case, (
+            runs_nb, actors_sum, gain_mean, gain_m2, area_nb, area_mean, area_m2, (start, end)
+        ) in zip(slices_idx, aggregates)
+    }
+
+
+def get_cases_aggregates(results: ResultsSlicer) -> dict[tuple[Any, ...], CaseAggregates]:
+    """Compute aggregates of all slices of results loaded into memory (keyed as slices)."""
+    return get_slices_aggregates(results.raw_df, results.expositions, results.slices_idx)
+
+
+def get_summary_cases_aggregates(
+    summary: dict[tuple[Any, ...], CaseAggregates]
+) -> dict[tuple[Any, ...], CaseAggregates]:
+    """Merge aggregates of the summary saved by the simulator into cases keyed as slices."""
+    cases = rename_mlnabcd_networks(pd.DataFrame(list(summary), columns=list(SUMMARY_KEYS)))
+    return merge_summaries(
+        [
+            {tuple(case[key] for key in ResultsSlicer.case_keys): case_aggregates}
+            for case, case_aggregates in zip(cases.to_dict("records"), summary.values())
+        ]
+    )
+
+
+def stream_cases_aggregates(
+    results_paths: list[Path], chunk_size: int = CHUNK_SIZE
+) -> dict[tuple[Any, ...], CaseAggregates]:
+    """
+    Compute aggregates of cases (keyed as slices) folding chunks of files of results into them.
+
+    Only a chunk of rows is kept in memory at once, hence, memory grows with the nb. of cases and
+    not with the nb. of results. Summaries saved by the simulator are merged as they are.
+    """
+    aggregates = {}
+    for path in results_paths:
+        if Path(path).name == SUMMARY_FILE:
+            chunks_aggregates = [get_summary_cases_aggregates(read_summary(path))]
+        else:
+            chunks_aggregates = (
+                get_slices_aggregates(
+                    raw_df=chunk_df,
+                    expositions=RaggedArray.from_column(chunk_df.pop("expositions_rec")),
+                    slices_idx=chunk_df.groupby(ResultsSlicer.case_keys, sort=False).indices,
+                )
+                for chunk_df in map(
+                    rename_mlnabcd_networks,
+                    read_results_chunks(path, chunk_size, AGGREGATED_COLUMNS),
+                )
+            )
+        for chunk_aggregates in chunks_aggregates:
+            aggregates = merge_summaries([aggregates, chunk_aggregates])
+    return aggregates
+
+
+def get_fingerprint(path: Path) -> tuple[int, int]:
+    """Get a fingerprint of the file (its size and a time of the last modification)."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class AggregatesCache:
+    """
+    Aggregates of cases computed separately for each file of raw results, stored on the disk.
+
+    Files are recognised by fingerprints, hence, only new or modified files have to be read again
+    to update aggregates, and contributions of removed files are dropped.
+    """
+
+    def __init__(self, cache_path: Path) -> None:
+        self.cache_path = cache_path
+        self.files = {}  # {path: (fingerprint, {case: aggregates})}
+        if cache_path.exists():
+            with open(cache_path, "rb") as f:
+                self.files = pickle.load(f)
+
+    def update(
+        self, results_paths: list[Path], chunk_size: int = CHUNK_SIZE
+    ) -> set[tuple[Any, ...]]:
+        """
+        Update aggregates with the current set of files of raw results.
+
+        :param results_paths: files of raw results or summaries saved by the simulator
+        :param chunk_size: nb. of rows of results to read at once
+        :return: keys of cases which aggregates were changed
+        """
+        paths = {str(path): path for path in results_paths}
+        affected = set()
+        for path_str in set(self.files) - set(paths):
+            affected.update(self.files.pop(path_str)[1])
+        for path_str, path in paths.items():
+            fingerprint = get_fingerprint(path)
+            if path_str in self.files and self.files[path_str][0] == fingerprint:
+                continue
+            if path_str in self.files:
+                affected.update(self.files[path_str][1])
+            print(f"\taggregating {path}")
+            aggregates = stream_cases_aggregates([path], chunk_size)
+            self.files[path_str] = (fingerprint, aggregates)
+            affected.update(aggregates)
+        return affected
+
+    def get_aggregates(self) -> dict[tuple[Any, ...], CaseAggregates]:
+        """Merge aggregates of all files."""
+        return merge_summaries([file_aggregates for _, file_aggregates in self.files.values()])
+
+    def save(self) -> None:
+        with open(self.cache_path, "wb") as f:
+            pickle.dump(self.files, f)
+
+
+def get_metrics_df(aggregates: dict[tuple[Any, ...], CaseAggregates]) -> pd.DataFrame:
+    """Get a table with average metrics of cases ordered as in `process_results`."""
+    return pd.DataFrame(
+        [
+            {
+                "protocol": protocol,
+                "probab": probab,
+                "seed_budget": seed_budget,
+                "ss_method": ss_method,
+                "net_type": net_type,
+                **aggregates[(protocol, probab, seed_budget, ss_method, net_type)].get_metrics(),
+            }
+            for protocol, probab, seed_budget, ss_method, net_type in sorted(aggregates)
+        ]
+    )
@@ -22,11 +22,9 @@ class ResultsPlotter:
         colour: str | None = None,
         shape: str | None = None,
     ) -> None:
-        y_avg = np.ones(x_max) * record["cdf"][-1]
-        y_avg[:len(record["cdf"])] = record["cdf"]
+        y_avg = np.pad(record["cdf"], (0, x_max - len(record["cdf"])), mode="edge")
         y_avg = y_avg / record["actors_nb"]
-        y_std = np.zeros(x_max)
-        y_std[:len(record["std"])] = record["std"]
+        y_std = np.pad(record["std"], (0, x_max - len(record["std"])))
         y_std = y_std / record["actors_nb"]
         x = np.arange(x_max)
         curve = ax.plot(x, y_avg, label=label, color=colour, linestyle=shape)
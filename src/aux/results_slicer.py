@@ -2,54 +2,144 @@
 
 from itertools import product
 from pathlib import Path
-from typing import Generator
+from typing import Any, Generator
 
 import numpy as np
 import pandas as pd
 
+from src.result_handler import RaggedArray, read_results
+from src.results_store import ResultsStore
+
+
+RAW_ROW = "raw_row"  # name of the index of loaded results, i.e. of positions of their rows
+
+
+def rename_mlnabcd_networks(results_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    For mlnabcd generated nets replace their type by a series they belong to and leave as a name
+    the filename.
+    """
+    is_mlnabcd = results_df["network_type"] == "mlnabcd"
+    name_parts = results_df.loc[is_mlnabcd, "network_name"].str.split("-")
+    results_df.loc[is_mlnabcd, "network_type"] = name_parts.str[0]
+    results_df.loc[is_mlnabcd, "network_name"] = name_parts.str[1]
+    return results_df
+
+
+def get_mean_expositions_recs(
+    expositions: RaggedArray,
+    actors_nb: np.ndarray,
+    groups: np.ndarray,
+    groups_nb: int,
+) -> list[dict[str, Any]]:
+    """
+    Compute mean curves of expositions for many groups of runs in one pass over the records.
+
+    Records shorter than the longest one in the group are treated as padded with zeros.
+
+    :param expositions: records of new activations in subsequent steps of the runs
+    :param actors_nb: nb. of actors in networks of the runs
+    :param groups: index of the group (from 0 to `groups_nb - 1`) of each run
+    :param groups_nb: nb. of groups, each of them has to contain at least one run
+    :return: for each group a record with avg. nb. of actors, mean, std and cdf of expositions
+    """
+    lengths = expositions.lengths
+    values = expositions.values.astype(float)
+    runs_nb = np.bincount(groups, minlength=groups_nb)
+    steps_nb = np.zeros(groups_nb, dtype=np.int64)
+    np.maximum.at(steps_nb, groups, lengths)
+    curves_offsets = np.concatenate([[0], np.cumsum(steps_nb)])
+
+    # each value falls into a cell of the flattened curves at its group's offset shifted by step
+    values_steps = np.arange(len(values)) - np.repeat(expositions.offsets[:-1], lengths)
+    cells = curves_offsets[np.repeat(groups, lengths)] + values_steps
+    cells_nb = curves_offsets[-1]
+    cells_runs_nb = np.repeat(runs_nb, steps_nb)
+    avg = np.bincount(cells, weights=values, minlength=cells_nb) / cells_runs_nb
+    padded_nb = cells_runs_nb - np.bincount(cells, minlength=cells_nb)
+    sq_dev = np.bincount(cells, weights=(values - avg[cells]) ** 2, minlength=cells_nb)
+    std = np.sqrt((sq_dev + padded_nb * avg ** 2) / cells_runs_nb)
+    actors_avg = np.bincount(groups, weights=actors_nb, minlength=groups_nb) / runs_nb
+
+    return [
+        {
+            "actors_nb": actors_avg[group].item(),
+            "avg": avg[start:end].round(3),
+            "std": std[start:end].round(3),
+            "cdf": np.cumsum(avg[start:end]).round(3),
+        }
+        for group, (start, end) in enumerate(zip(curves_offsets[:-1], curves_offsets[1:]))
+    ]
+
 
 class ResultsSlicer:
 
+    case_keys = ["protocol", "probab", "seed_budget", "ss_method", "network_type"]
+    categorical_columns = ["protocol", "ss_method", "network_type", "network_name"]
+
     def __init__(
         self,
         results_paths: list[str],
         baseline_type: str,
-        with_repetition: bool = False
+        with_repetition: bool = False,
+        results_store: ResultsStore | None = None,
     ) -> None:
-        self.raw_df = self.read_raw_df(results_paths, with_repetition)
-        self.protocols = self.raw_df["protocol"].unique().tolist()
-        self.probabs = self.raw_df["probab"].unique().tolist()
-        self.seed_budgets = self.raw_df["seed_budget"].unique().tolist()
-        self.ss_methods = self.raw_df["ss_method"].unique().tolist()
+        """
+        Create the object.
+
+        :param results_paths: files with results to load into memory
+        :param baseline_type: type of the network used as a baseline
+        :param with_repetition: add to results a column with the repetition they come from
+        :param results_store: if given, results are not loaded but queried from the store slice by
+            slice and `results_paths` are ignored
+        """
+        self.results_store = results_store
+        self.with_repetition = with_repetition
+        if results_store is None:
+            self.raw_df, self.expositions = self.read_raw_df(results_paths, with_repetition)
+            self.protocols = self.raw_df["protocol"].unique().tolist()
+            self.probabs = self.raw_df["probab"].unique().tolist()
+            self.seed_budgets = self.raw_df["seed_budget"].unique().tolist()
+            self.ss_methods = self.raw_df["ss_method"].unique().tolist()
+            self.net_types = self.raw_df["network_type"].unique().tolist()
+            self.slices_idx = self.raw_df.groupby(
+                self.case_keys, observed=True, sort=False
+            ).indices
+        else:
+            self.raw_df = None
+            self.expositions = None
+            self.slices_idx = None
+            self.protocols, self.probabs, self.seed_budgets, self.ss_methods = [
+                [value for value, in results_store.get_distinct([col_name])]
+                for col_name in ["protocol", "probab", "seed_budget", "ss_method"]
+            ]
+            self.net_types = rename_mlnabcd_networks(
+                pd.DataFrame(
+                    results_store.get_distinct(["network_type", "network_name"]),
+                    columns=["network_type", "network_name"],
+                )
+            )["network_type"].unique().tolist()
         self.baseline_type = baseline_type
 
-    def read_raw_df(self, raw_result_paths: list[str], with_repetition: bool) -> pd.DataFrame:
+    def read_raw_df(
+        self, raw_result_paths: list[str], with_repetition: bool
+    ) -> tuple[pd.DataFrame, RaggedArray]:
         """
-        for mlnabcd generated nets replace their type by a series they belong to and leave as
-        a name the filename.
+        Load results; records of expositions are kept aside as a ragged array aligned with rows.
         """
         dfs = []
-        split_func = lambda x: [int(xx) for xx in x.split(";")]
+        expositions = []
         for csv_path in raw_result_paths:
-            csv_df = pd.read_csv(csv_path)
-            csv_df["_network_name"] = csv_df.apply(
-                lambda row: row["network_name"].split("-")[1] if row["network_type"] == "mlnabcd"
-                else  row["network_name"],
-                axis=1
-            )
-            csv_df["network_type"] = csv_df.apply(
-                lambda row: row["network_name"].split("-")[0] if row["network_type"] == "mlnabcd"
-                else  row["network_type"],
-                axis=1
-            )
-            csv_df["network_name"] = csv_df["_network_name"]
-            csv_df = csv_df.drop("_network_name", axis=1)
-            csv_df["seed_ids"] = csv_df["seed_ids"].map(split_func)
-            csv_df["expositions_rec"] = csv_df["expositions_rec"].map(split_func)
+            csv_df = read_results(csv_path, raw_columns=("expositions_rec",))
+            csv_df = rename_mlnabcd_networks(csv_df)
+            expositions.append(RaggedArray.from_column(csv_df.pop("expositions_rec")))
             if with_repetition:
                 csv_df["repetition"] = Path(csv_path).stem.split("_")[-1]
             dfs.append(csv_df)
-        return pd.concat(dfs, axis=0, ignore_index=True)
+        raw_df = pd.concat(dfs, axis=0, ignore_index=True)
+        raw_df.index.name = RAW_ROW
+        raw_df = raw_df.astype({col_name: "category" for col_name in self.categorical_columns})
+        return raw_df, RaggedArray.concat(expositions)
 
     def get_combinations(self) -> Generator[tuple[str, str, str, str], None, None]:
         for and_case in product(
@@ -61,15 +151,40 @@ class ResultsSlicer:
             yield and_case
     
     def get_net_types(self) -> Generator[str, None, None]:
-        for net_type in sorted(self.raw_df["network_type"].unique()):
+        for net_type in sorted(self.net_types):
             yield net_type
 
     def get_net_names(self, net_type: str) -> Generator[str, None, None]:
-        for net_name in sorted(
-            self.raw_df.loc[self.raw_df["network_type"] == net_type ]["network_name"].unique()
-        ):
+        if self.results_store is not None:
+            net_names = self.query_slice(net_type)["network_name"]
+        else:
+            net_names = self.raw_df.loc[self.raw_df["network_type"] == net_type]["network_name"]
+        for net_name in sorted(net_names.unique()):
             yield net_name
 
+    def query_slice(
+        self, net_type: str, where: str = "", params: tuple[Any, ...] = ()
+    ) -> pd.DataFrame:
+        """
+        Query the store for results of the type of network, as it's named after loading them.
+
+        :param net_type: type of network (for mlnabcd nets - a series they belong to)
+        :param where: additional SQL condition with `?` placeholders
+        :param params: values of the placeholders
+        """
+        net_type_cond = (
+            "((network_type = ? AND network_type != 'mlnabcd') OR "
+            "(network_type = 'mlnabcd' AND substr(network_name, 1, ?) = ?))"
+        )
+        slice_df = self.results_store.select(
+            where=f"{where} AND {net_type_cond}" if where else net_type_cond,
+            params=(*params, net_type, len(net_type) + 1, f"{net_type}-"),
+        )
+        slice_df = rename_mlnabcd_networks(slice_df)
+        if not self.with_repetition:
+            slice_df = slice_df.drop(columns="repetition")
+        return slice_df
+
     def get_slice(
         self,
         protocol: str,
@@ -79,28 +194,50 @@ class ResultsSlicer:
         net_type: str,
         # net_name: str,
     ) -> pd.DataFrame:
-        slice_df = self.raw_df.loc[
-            (self.raw_df["protocol"] == protocol) &
-            (self.raw_df["probab"] == probab) &
-            (self.raw_df["seed_budget"] == seed_budget) &
-            (self.raw_df["ss_method"] == ss_method) &
-            (self.raw_df["network_type"] == net_type)
-            # (self.raw_df["network_name"] == net_name)
-        ].copy()
-        return slice_df.reindex()
+        if self.results_store is not None:
+            return self.query_slice(
+                net_type=net_type,
+                where="protocol = ? AND probab = ? AND seed_budget = ? AND ss_method = ?",
+                params=(protocol, probab, seed_budget, ss_method),
+            )
+        slice_idx = self.slices_idx.get((protocol, probab, seed_budget, ss_method, net_type), [])
+        return self.raw_df.iloc[slice_idx].copy()
 
     @staticmethod
     def get_actors_nb(slice_df: pd.DataFrame) -> float:
         return (slice_df["exposed_nb"] + slice_df["unexposed_nb"]).mean().item()
 
     def mean_expositions_rec(self, slice_df: pd.DataFrame) -> dict[str, np.array]:
-        max_len = max(slice_df["expositions_rec"].map(lambda x: len(x)))
-        exp_recs_padded = np.zeros([len(slice_df), max_len])
-        for run_idx, step_idx in enumerate(slice_df["expositions_rec"]):
-            exp_recs_padded[run_idx][0:len(step_idx)] = step_idx
-        return {
-            "actors_nb": self.get_actors_nb(slice_df),
-            "avg": np.mean(exp_recs_padded, axis=0).round(3),
-            "std": np.std(exp_recs_padded, axis=0).round(3),
-            "cdf": np.cumsum(np.mean(exp_recs_padded, axis=0)).round(3),
-        }
+        if "expositions_rec" in slice_df:
+            expositions = RaggedArray.from_column(slice_df["expositions_rec"])
+        else:
+            # records of expositions are matched by positions of rows carried in the index, so
+            # they can't be found once the index is replaced (e.g. by `reset_index`)
+            raw_rows = slice_df.index.to_numpy()
+            if slice_df.index.name != RAW_ROW or not (
+                (raw_rows >= 0) & (raw_rows < len(self.raw_df))
+            ).all():
+                raise ValueError("Slice of results is not indexed by rows of loaded results!")
+            expositions = self.expositions.take(raw_rows)
+        return get_mean_expositions_recs(
+            expositions=expositions,
+            actors_nb=(slice_df["exposed_nb"] + slice_df["unexposed_nb"]).to_numpy(),
+            groups=np.zeros(len(slice_df), dtype=np.int64),
+            groups_nb=1,
+        )[0]
+
+    def mean_expositions_recs(self) -> dict[tuple[Any, ...], dict[str, np.array]]:
+        """Compute mean expositions for all slices of loaded results at once (keyed as slices)."""
+        groups = np.full(len(self.raw_df), -1, dtype=np.int64)
+        for group, slice_idx in enumerate(self.slices_idx.values()):
+            groups[slice_idx] = group
+        is_grouped = groups >= 0
+        recs = get_mean_expositions_recs(
+            expositions=self.expositions.take(np.flatnonzero(is_grouped)),
+            actors_nb=(self.raw_df["exposed_nb"] + self.raw_df["unexposed_nb"]).to_numpy()[
+                is_grouped
+            ],
+            groups=groups[is_grouped],
+            groups_nb=len(self.slices_idx),
+        )
+        return dict(zip(self.slices_idx, recs))
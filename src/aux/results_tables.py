@@ -0,0 +1,105 @@
+"""Script with tables of metrics relative to the baseline network type."""
+
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from src.aux.results_slicer import rename_mlnabcd_networks
+from src.results_store import TABLE_NAME, ResultsStore
+
+
+CASE_COLUMNS = ["protocol", "probab", "seed_budget", "ss_method"]
+METRICS = ("gain_avg", "gain_std", "area_avg", "area_std")
+
+
+def get_store_metrics_df(results_store: ResultsStore) -> pd.DataFrame:
+    """Get a table with average metrics of cases as `process_results` saves in `metrics.csv`."""
+    results_df = pd.read_sql_query(
+        f"SELECT {', '.join(CASE_COLUMNS)}, network_type, network_name, gain, area "
+        f"FROM {TABLE_NAME}",
+        results_store.connection,
+    )
+    results_df = rename_mlnabcd_networks(results_df).rename(columns={"network_type": "net_type"})
+    metrics_df = results_df.groupby([*CASE_COLUMNS, "net_type"])[["gain", "area"]].agg(
+        ["mean", "std"]
+    )
+    metrics_df.columns = list(METRICS)
+    return metrics_df.reset_index()
+
+
+class RelativeMetrics:
+    """
+    Metrics of cases relative to the baseline network type, served as pivot tables.
+
+    Relative metrics are computed once for each set of required network types and cached, so that
+    any number of tables (by protocol, by probability, by seed budget, etc.) is obtained from them
+    without recomputation.
+    """
+
+    def __init__(self, metrics_df: pd.DataFrame, baseline_type: str) -> None:
+        """
+        Initialise the object.
+
+        :param metrics_df: average metrics of cases, e.g. read from `metrics.csv`
+        :param baseline_type: a network type to relate metrics of other types to
+        """
+        self.metrics_df = metrics_df
+        self.baseline_type = baseline_type
+        self._relative = {}  # {required_types: relative metrics}
+
+    @classmethod
+    def from_csv(cls, metrics_path: Path | str, baseline_type: str) -> "RelativeMetrics":
+        return cls(pd.read_csv(metrics_path, index_col=0), baseline_type)
+
+    def get_relative(self, required_types: tuple[str, ...]) -> pd.DataFrame:
+        """
+        Get metrics of cases evaluated for exactly the required network types (i.e. spreading
+        regimes common for all of them) with columns of metrics relative to the baseline type.
+        """
+        if required_types in self._relative:
+            return self._relative[required_types]
+        metrics_df = self.metrics_df
+        case_keys = [metrics_df[column] for column in CASE_COLUMNS]
+        is_required = metrics_df["net_type"].isin(required_types)
+        is_other = (~is_required).groupby(case_keys).transform("any")
+        types_nb = metrics_df["net_type"].where(is_required).groupby(case_keys).transform("nunique")
+        relative_df = metrics_df.loc[~is_other & (types_nb == len(set(required_types)))]
+
+        metrics = [metric for metric in METRICS if metric in relative_df]
+        reference = relative_df.loc[relative_df["net_type"] == self.baseline_type]
+        reference = reference.set_index(CASE_COLUMNS)[metrics]
+        relative_df = relative_df.merge(
+            reference, on=CASE_COLUMNS, how="left", suffixes=("", "_ref")
+        )
+        for metric in metrics:
+            relative_df[f"{metric}_rel"] = (
+                relative_df[metric] - relative_df[f"{metric}_ref"]
+            ) / relative_df[f"{metric}_ref"]
+        relative_df = relative_df.drop(columns=[f"{metric}_ref" for metric in metrics])
+        self._relative[required_types] = relative_df
+        return relative_df
+
+    def get_table(
+        self,
+        required_types: tuple[str, ...],
+        index: str,
+        metric: str = "gain_avg",
+        decimals: int = 4,
+        **fixed_values: Any,
+    ) -> pd.DataFrame:
+        """
+        Get a pivot table of the relative metric, averaged over parameters other than the index.
+
+        :param required_types: network types to be columns of the table (in that order)
+        :param index: a parameter of cases to be rows of the table, e.g. `probab`
+        :param metric: a name of the metric, its relative value is tabulated
+        :param decimals: nb. of decimal places to round values to
+        :param fixed_values: values of parameters to restrict cases to, e.g. `protocol="AND"`
+        """
+        metric_rel = f"{metric}_rel"
+        relative_df = self.get_relative(required_types)
+        for column, value in fixed_values.items():
+            relative_df = relative_df.loc[relative_df[column] == value]
+        table = relative_df.groupby([index, "net_type"])[[metric_rel]].mean().unstack("net_type")
+        return table[[(metric_rel, net_type) for net_type in required_types]].round(decimals)
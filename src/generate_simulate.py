@@ -0,0 +1,141 @@
+"""Main runner of simulations on networks streamed from the generator."""
+
+import multiprocessing
+from typing import Any
+
+import yaml
+
+from src import params_handler, result_handler, utils
+from src.generator import generate_into_queue, get_generated_network, get_networks_names
+from src.results_store import ResultsStore
+from src.simulator.simulate import get_engine_and_criterion, run_repetition
+
+
+def run_experiments(config: dict[str, Any]) -> None:
+    """
+    Generate MLNABCD networks and simulate the parameter space on each of them as it's generated.
+
+    Networks are generated in a separate process (which hosts Julia) and passed through a bounded
+    queue, so that the next network is generated while the current one is simulated, and no more
+    than `generator.queue_size` networks wait in memory. Networks are saved only if
+    `generator.out_dir` is given. Results are appended to files after each network is simulated.
+    Generated networks are named as if they were loaded from files of the series (e.g.
+    `mlnabcd^series_1-edges_0`), hence results are processed as usual.
+    """
+    series = config["generator"]["series"]
+    instances_nb = config["generator"]["repetitions"]
+    nets_dir = config["generator"].get("out_dir")
+    nets_dir = None if nets_dir is None else params_handler.create_out_dir(nets_dir)
+    ssms = params_handler.load_seed_selectors(config["parameter_space"]["ss_methods"])
+
+    # get parameters of the simulator
+    repetitions = config["simulator"]["repetitions"]
+    engine, criterion = get_engine_and_criterion(config["simulator"])
+    rng_seed = "_" if config["run"].get("rng_seed") is None else config["run"]["rng_seed"]
+
+    # prepare output directories and determine how to store results
+    out_dir = params_handler.create_out_dir(config["io"]["out_dir"])
+    rnk_dir = out_dir / result_handler.RANKINGS_DIR
+    rnk_dir.mkdir(exist_ok=True, parents=True)
+    results_db = config["io"].get("results_db")
+    raw_results = config["io"].get("raw_results", True)
+    summary = {} if config["io"].get("summary", False) else None
+    if not raw_results and summary is None:
+        raise ValueError("Raw results can be omitted only if their summary is saved!")
+    results_store = None if results_db is None else ResultsStore(results_db)
+
+    # save the config
+    config["git_sha"] = utils.get_recent_git_sha()
+    with open(out_dir / "config.yaml", "w", encoding="utf-8") as f:
+        yaml.dump(config, f)
+
+    # get a start time
+    start_time = utils.get_current_time()
+    print(f"\nExperiments started at {start_time}")
+
+    # results of each repetition are streamed to its own file through all networks
+    versions = {rep: f"{rng_seed}_{rep}" for rep in range(1, repetitions + 1)}
+    results_writers = {
+        rep: result_handler.ResultsWriter(
+            out_path=out_dir / f"results--ver-{ver}.csv",
+            results_format=config["io"].get("results_format", "csv"),
+            buffer_size=config["io"].get("results_buffer"),
+        ) if raw_results else None
+        for rep, ver in versions.items()
+    }
+    rep_records = {rep: [] for rep in versions}
+
+    # start generation of networks in the background
+    context = multiprocessing.get_context("spawn")
+    networks_queue = context.Queue(maxsize=config["generator"].get("queue_size", 2))
+    producer = context.Process(
+        target=generate_into_queue,
+        args=(config, nets_dir, config["generator"].get("batch_size", 1), networks_queue),
+        daemon=True,
+    )
+    producer.start()
+
+    networks_names = get_networks_names(config, range(instances_nb))
+    try:
+        for instance_idx in range(instances_nb):
+            repetition, edges = get_generated_network(networks_queue, producer)
+            print(f"\nNetwork {instance_idx + 1}/{instances_nb}")
+            nets = params_handler.create_generated_networks(
+                series=series,
+                networks_edges={networks_names[repetition][0]: edges},
+                device=config["run"]["device"],
+            )
+            p_space = params_handler.get_parameter_space(
+                protocols=config["parameter_space"]["protocols"],
+                probabs=config["parameter_space"]["probabs"],
+                seed_budgets=config["parameter_space"]["seed_budgets"],
+                ss_methods=config["parameter_space"]["ss_methods"],
+                networks=[(net.n_type, net.n_name) for net in nets],
+            )
+            for rep, ver in versions.items():
+                rep_records[rep].extend(
+                    run_repetition(
+                        config=config,
+                        nets=nets,
+                        ssms=ssms,
+                        p_space=p_space,
+                        rep=rep,
+                        ver=ver,
+                        rnk_dir=rnk_dir,
+                        engine=engine,
+                        criterion=criterion,
+                        results_writer=results_writers[rep],
+                        results_store=results_store,
+                        summary=summary,
+                    )
+                )
+
+            # results of the network are written before the next one, so memory doesn't grow
+            for results_writer in results_writers.values():
+                if results_writer is not None:
+                    results_writer.flush()
+    except BaseException as e:
+        producer.terminate()
+        raise e
+    producer.join()
+
+    # close outputs of all repetitions
+    for rep, ver in versions.items():
+        if results_writers[rep] is not None:
+            results_writers[rep].close()
+        if criterion is not None:
+            result_handler.save_results(
+                rep_records[rep], out_dir / f"realisations--ver-{ver}.csv"
+            )
+    if results_store is not None:
+        results_store.close()
+    if summary is not None:
+        result_handler.save_summary(summary, out_dir / result_handler.SUMMARY_FILE)
+
+    # compress global logs and config
+    if config["io"]["compress_to_zip"]:
+        result_handler.zip_detailed_logs([rnk_dir], rm_logged_dirs=True)
+
+    finish_time = utils.get_current_time()
+    print(f"\nExperiments finished at {finish_time}")
+    print(f"Experiments lasted {utils.get_diff_of_times(start_time, finish_time)} minutes")
@@ -1,29 +1,164 @@
 """Main runner of the generator."""
 
+import math
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Process, Queue
+from pathlib import Path
 from typing import Any
 
-import juliacall
+try:
+    import juliacall  # imported before torch to silent a warning raised by importing both
+except ImportError:  # Julia is not needed by the NumPy backend
+    pass
 import numpy as np
 from tqdm import tqdm
 
-from src.mln_abcd.julia_wrapper import MLNConfig, MLNABCDGraphGenerator
+from src.mln_abcd.mln_config import MLNConfig
+from src.mln_abcd.numpy_generator import MLNABCDNumpyGenerator
 from src.params_handler import create_out_dir
 
 
-def run_experiments(config: dict[str, Any]) -> None:
+def get_networks_names(config: dict[str, Any], repetitions: range) -> list[tuple[str, str]]:
+    """Get names (without suffixes) of files of edges and communities of consecutive networks."""
+    e_name = config["mln_config"]["edges_filename"].split(".")[0]
+    c_name = config["mln_config"]["communities_filename"].split(".")[0]
+    return [(f"{e_name}_{repetition}", f"{c_name}_{repetition}") for repetition in repetitions]
+
+
+def get_networks_filenames(
+    config: dict[str, Any], out_dir: Path, repetitions: range
+) -> list[tuple[str, str]]:
+    """Get paths of files of edges and communities of consecutive networks."""
+    e_stem = config["mln_config"]["edges_filename"].split(".")[1]
+    c_stem = config["mln_config"]["communities_filename"].split(".")[1]
+    return [
+        (str(out_dir / f"{e_name}.{e_stem}"), str(out_dir / f"{c_name}.{c_stem}"))
+        for e_name, c_name in get_networks_names(config, repetitions)
+    ]
+
 
-    _mln_config = config["mln_config"]
+def get_mln_config(config: dict[str, Any]) -> MLNConfig:
+    _mln_config = config["mln_config"].copy()
     _mln_config["seed"] = config["run"]["rng_seed"]
-    mln_config = MLNConfig.from_yaml(_mln_config)
+    return MLNConfig.from_yaml(_mln_config)
+
+
+def get_generator(config: dict[str, Any]) -> Any:
+    """
+    Start a session of the generator of the backend given in `generator.backend`.
+
+    The backend is either `julia` (default), i.e. `MLNABCDGraphGenerator` which hosts a Julia
+    runtime, or `numpy`, i.e. `MLNABCDNumpyGenerator` which has the same interface.
+    """
+    backend = config["generator"].get("backend", "julia")
+    if backend == "julia":
+        from src.mln_abcd.julia_wrapper import MLNABCDGraphGenerator
+        return MLNABCDGraphGenerator()
+    elif backend == "numpy":
+        return MLNABCDNumpyGenerator()
+    raise ValueError(f"Unknown backend of the generator: {backend}!")
+
+
+_generator: Any = None  # session of the generator of the worker
+_mln_config: MLNConfig | None = None
+
+
+def init_worker(config: dict[str, Any]) -> None:
+    """Start a session of the generator (e.g. Julia runtime) in the worker process."""
+    global _generator, _mln_config
+    _mln_config = get_mln_config(config)
+    _generator = get_generator(config)
+
+
+def generate_batch(seeds: list[int], filenames: list[tuple[str, str]]) -> None:
+    _generator.generate_batch(config=_mln_config, filenames=filenames, seeds=seeds)
 
+
+def run_experiments(config: dict[str, Any]) -> None:
+
+    mln_config = get_mln_config(config)
     repetitions = config["generator"]["repetitions"]
+    workers = config["generator"].get("workers", 1)
+    if workers < 1:
+        raise ValueError(f"Incorrect nb. of workers generating networks: {workers}!")
+    batch_size = config["generator"].get("batch_size") or math.ceil(repetitions / workers)
     out_dir = create_out_dir(config["generator"]["out_dir"])
-    e_name, e_stem = config["mln_config"]["edges_filename"].split(".")
-    c_name, c_stem = config["mln_config"]["communities_filename"].split(".")
-
-    p_bar = tqdm(np.arange(repetitions), desc="", leave=False, colour="green")
-    for repetition in p_bar:
-        p_bar.set_description_str("Repetition")
-        mln_config.edges_filename = str(out_dir / f"{e_name}_{repetition}.{e_stem}")
-        mln_config.communities_filename = str(out_dir / f"{c_name}_{repetition}.{c_stem}")
-        MLNABCDGraphGenerator()(config=mln_config)
+
+    # seeds of networks are drawn consecutively from the config before the generation, so
+    # networks don't depend on the size of batches nor on the nb. of workers generating them
+    seeds = mln_config.draw_seeds(repetitions)
+    batches = [
+        (
+            seeds[batch_start:batch_start + batch_size],
+            get_networks_filenames(
+                config, out_dir, range(batch_start, min(batch_start + batch_size, repetitions))
+            ),
+        )
+        for batch_start in range(0, repetitions, batch_size)
+    ]
+
+    # batches are generated by one session of the generator or by a pool of them
+    p_bar = tqdm(total=len(batches), desc="Batch of repetitions", leave=False, colour="green")
+    if workers > 1:
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(config,),
+        ) as pool:
+            for future in as_completed(
+                [pool.submit(generate_batch, *batch) for batch in batches]
+            ):
+                future.result()
+                p_bar.update()
+    else:
+        generator = get_generator(config)
+        for batch_seeds, batch_filenames in batches:
+            generator.generate_batch(mln_config, filenames=batch_filenames, seeds=batch_seeds)
+            p_bar.update()
+    p_bar.close()
+
+
+def generate_into_queue(
+    config: dict[str, Any],
+    out_dir: Path | None,
+    batch_size: int,
+    networks_queue: Queue,
+) -> None:
+    """
+    Generate networks as `run_experiments` does and put their edges into the queue.
+
+    Networks are put as tuples of the repetition and edges (rows of source, target, layer). The
+    queue should be bounded, so that generation is paused while the consumer is busy.
+
+    :param config: config of the experiment with `mln_config` and `generator` sections
+    :param out_dir: if given, networks are also saved into this directory
+    :param batch_size: nb. of networks generated in one call to the generator
+    :param networks_queue: queue to put networks into
+    """
+    mln_config = get_mln_config(config)
+    repetitions = config["generator"]["repetitions"]
+    generator = get_generator(config)
+    for batch_start in range(0, repetitions, batch_size):
+        batch = range(batch_start, min(batch_start + batch_size, repetitions))
+        networks = generator.generate_networks(
+            config=mln_config,
+            nb=len(batch),
+            filenames=None if out_dir is None else get_networks_filenames(config, out_dir, batch),
+        )
+        for repetition, network in zip(batch, networks):
+            networks_queue.put((repetition, network.edges))
+
+
+def get_generated_network(
+    networks_queue: Queue, producer: Process, timeout: float = 1.
+) -> tuple[int, np.ndarray]:
+    """Get the next network from the queue, failing if its producer exited without putting it."""
+    while True:
+        try:
+            return networks_queue.get(timeout=timeout)
+        except queue.Empty:
+            if not producer.is_alive():
+                raise RuntimeError("Generator of networks exited before generating all of them!")
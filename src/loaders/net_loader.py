@@ -7,13 +7,14 @@ from typing import Callable
 
 import network_diffusion as nd
 import networkx as nx
+import numpy as np
 from tqdm import tqdm
 
-from src.loaders.constants import MLN_ABCD_DATA_PATH
+from src.loaders.constants import MLN_ABCD_DATA_PATH, MLNABCD_PREFIX
 from src.loaders.small_artificial import load_small_artificial
 from src.loaders.small_real import load_small_real
 from src.loaders.big_real import load_big_real
-from src.mln_abcd.julia_reader import load_edgelist
+from src.mln_abcd.julia_reader import edges_to_mln, load_edgelist
 
 
 def read_mlnabcd_networks(net_name: str) -> dict[str, nd.MultilayerNetwork]:
@@ -68,3 +69,18 @@ def load_network(net_type: str, net_name: str) -> dict[tuple[str, str], nd.Multi
     if len(networks) == 0:
         raise AttributeError(f"Loaded 0 networks!")    
     return {(net_type, net_name): net_graph for net_name, net_graph in networks.items()}
+
+
+@prepare_network
+def load_generated_networks(
+    series: str, networks_edges: dict[str, np.ndarray]
+) -> dict[tuple[str, str], nd.MultilayerNetwork]:
+    """Create mlnabcd networks from generated edges, named as if they were read from the series."""
+    networks = {}
+    for net_name, edges in networks_edges.items():
+        net_graph = edges_to_mln(edges)
+        if net_graph.get_actors_num() == 0:
+            print(f"\t{series}-{net_name} is an empty network")
+            continue
+        networks[(MLNABCD_PREFIX, f"{series}-{net_name}")] = net_graph
+    return networks
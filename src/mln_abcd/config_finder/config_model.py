@@ -3,7 +3,10 @@
 import warnings
 from typing import Any
 
-import juliacall  # this is added to silent a warning raised by importing both torch an juliacall
+try:
+    import juliacall  # added to silent a warning raised by importing both torch an juliacall
+except ImportError:  # Julia is not needed to infer the config
+    pass
 import networkx as nx
 import network_diffusion as nd
 import numpy as np
@@ -58,8 +58,9 @@ def partitions_correlation(
 
 
 def edges_r(graph_1: nx.Graph, graph_2: nx.Graph) -> float:
-    g1_edges = set(graph_1.edges)
-    g2_edges = set(graph_2.edges)
+    # edges are compared regardless of their orientation which depends on the order of nodes
+    g1_edges = set(map(frozenset, graph_1.edges))
+    g2_edges = set(map(frozenset, graph_2.edges))
     if min(len(g1_edges), len(g2_edges)) == 0:
            return None
     return len(g1_edges.intersection(g2_edges)) / min(len(g1_edges), len(g2_edges))
@@ -4,11 +4,17 @@ from pathlib import Path
 
 import networkx as nx
 import network_diffusion as nd
+import numpy as np
 import pandas as pd
+import torch
+from bidict import bidict
 
 
-def load_edgelist(edgelist_path: Path) -> nd.MultilayerNetwork:
-    edge_list = pd.read_csv(edgelist_path, sep="\t", names=["source", "target", "layer"])
+EDGES_COLUMNS = ["source", "target", "layer"]
+COMMUNITIES_COLUMNS = ["community", "layer"]
+
+
+def edgelist_to_mln(edge_list: pd.DataFrame) -> nd.MultilayerNetwork:
     layer_names = edge_list["layer"].unique()
     layer_graphs = {}
     for layer_name in layer_names:
@@ -17,7 +23,70 @@ def load_edgelist(edgelist_path: Path) -> nd.MultilayerNetwork:
     return nd.MultilayerNetwork(layers=layer_graphs)
 
 
+def load_edgelist(edgelist_path: Path) -> nd.MultilayerNetwork:
+    edge_list = pd.read_csv(edgelist_path, sep="\t", names=EDGES_COLUMNS)
+    return edgelist_to_mln(edge_list)
+
+
+def edges_to_mln(edges: np.ndarray) -> nd.MultilayerNetwork:
+    """Create a network from edges as rows of (source, target, layer), as in files of edges."""
+    return edgelist_to_mln(pd.DataFrame(edges, columns=EDGES_COLUMNS))
+
+
+def edges_to_mlnt(edges: np.ndarray, device: str = "cpu") -> nd.MultilayerNetworkTorch:
+    """
+    Create a tensor representation of the network directly from edges (source, target, layer).
+
+    Self-loops are dropped (as well as nodes which had only them) as in networks prepared by
+    `load_network`. The result is equal to `nd.MultilayerNetworkTorch.from_mln` of the prepared
+    network up to the order of actors, but the network is not built in `networkx` in between.
+    """
+    layer_names, layer_ids = np.unique(edges[:, 2], return_inverse=True)
+    layers_order = pd.unique(edges[:, 2])  # as in the network, i.e. ordered by first occurrence
+    layer_ranks = np.empty(len(layer_names), dtype=np.int64)
+    layer_ranks[np.searchsorted(layer_names, layers_order)] = np.arange(len(layers_order))
+    layer_ids = layer_ranks[layer_ids]
+
+    is_loop = edges[:, 0] == edges[:, 1]
+    layer_ids = layer_ids[~is_loop]
+    actors, actor_ids = np.unique(edges[~is_loop, :2], return_inverse=True)
+    actor_ids = actor_ids.reshape(-1, 2)
+
+    # each edge of an undirected layer is present in the adjacency in both directions
+    indices = np.stack(
+        [
+            np.concatenate([layer_ids, layer_ids]),
+            np.concatenate([actor_ids[:, 0], actor_ids[:, 1]]),
+            np.concatenate([actor_ids[:, 1], actor_ids[:, 0]]),
+        ]
+    )
+    indices = np.unique(indices, axis=1)
+    adjacency_tensor = torch.sparse_coo_tensor(
+        indices=torch.from_numpy(indices),
+        values=torch.ones(indices.shape[1], dtype=torch.int64),
+        size=[len(layers_order), len(actors), len(actors)],
+    ).coalesce()
+
+    nodes_mask = torch.ones([len(layers_order), len(actors)])
+    nodes_mask[indices[0], indices[1]] = 0.
+    mlnt = nd.MultilayerNetworkTorch(
+        adjacency_tensor=adjacency_tensor,
+        layers_order=[str(layer_name) for layer_name in layers_order],
+        actors_map=bidict({actor.item(): idx for idx, actor in enumerate(actors)}),
+        nodes_mask=nodes_mask,
+    )
+    mlnt.device = device
+    return mlnt
+
+
 def load_communities(communities_path: Path) -> pd.DataFrame:
-    communities = pd.read_csv(communities_path, sep="\t", names=["community", "layer"])
+    communities = pd.read_csv(communities_path, sep="\t", names=COMMUNITIES_COLUMNS)
+    communities.index.name = "actor"
+    return communities
+
+
+def communities_to_df(communities: np.ndarray) -> pd.DataFrame:
+    """Create a table of communities from rows of (community, layer), as in files of them."""
+    communities = pd.DataFrame(communities, columns=COMMUNITIES_COLUMNS)
     communities.index.name = "actor"
     return communities
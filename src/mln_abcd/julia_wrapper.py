@@ -1,136 +1,168 @@
 """A Python wrapper to the MLNABCDGraphGenerator Julia package."""
 
 import tempfile
-from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
 
 import numpy as np
-import pandas as pd
 from juliacall import JuliaError
 from juliacall import Main as jl
+from juliacall import convert as jl_convert
+
+from src.mln_abcd.mln_config import GeneratedNetwork, MLNConfig
+
+
+GENERATE_BATCH_JL = """
+function edges_to_matrix(edges)
+    rows = Tuple{Int, Int, Int}[
+        (source, target, layer)
+        for (layer, layer_edges) in enumerate(edges) for (source, target) in layer_edges
+    ]
+    return [getindex.(rows, 1) getindex.(rows, 2) getindex.(rows, 3)]
+end
+
+function communities_to_matrix(coms)
+    rows = Tuple{Int, Int}[
+        (community, layer) for (layer, layer_coms) in enumerate(coms) for community in layer_coms
+    ]
+    return [getindex.(rows, 1) getindex.(rows, 2)]
+end
+
+function generate_mlnabcd_batch(
+    seeds::Vector{Int},
+    n::Int,
+    edges_cor_path::String,
+    layer_params_path::String,
+    d_max_iter::Int,
+    c_max_iter::Int,
+    t::Int,
+    eps::Float64,
+    d::Int,
+    edges_filenames::Vector{String},
+    communities_filenames::Vector{String},
+    write_files::Bool,
+    return_arrays::Bool,
+)
+    networks = Tuple{Matrix{Int}, Matrix{Int}}[]
+    for (seed, edges_filename, communities_filename) in zip(
+        seeds, edges_filenames, communities_filenames
+    )
+        config = MLNABCDGraphGenerator.MLNConfig(
+            seed,
+            n,
+            edges_cor_path,
+            layer_params_path,
+            d_max_iter,
+            c_max_iter,
+            t,
+            eps,
+            d,
+            edges_filename,
+            communities_filename,
+        )
+        active_nodes = MLNABCDGraphGenerator.generate_active_nodes(config)
+        degrees = MLNABCDGraphGenerator.generate_degrees(config, active_nodes, false)
+        com_sizes, coms = MLNABCDGraphGenerator.generate_communities(config, active_nodes)
+        edges = MLNABCDGraphGenerator.generate_abcd(config, degrees, com_sizes, coms)
+        edges = MLNABCDGraphGenerator.map_edges_to_agents(edges, active_nodes)
+        coms = MLNABCDGraphGenerator.map_communities_to_agents(config.n, coms, active_nodes)
+        edges_rewired = MLNABCDGraphGenerator.adjust_edges_correlation(
+            config, edges, coms, active_nodes, false, false
+        )
+        if write_files
+            MLNABCDGraphGenerator.write_edges(config, edges_rewired)
+            MLNABCDGraphGenerator.write_communities(config, coms)
+        end
+        if return_arrays
+            push!(networks, (edges_to_matrix(edges_rewired), communities_to_matrix(coms)))
+        end
+    end
+    return networks
+end
+"""
 
 
-@dataclass
-class MLNConfig:
+class MLNABCDGraphGenerator:
     """
-    A wrapper for class for class for jl.MLNABCDGraphGenerator.MLNConfig.
+    A wrapper class for jl.MLNABCDGraphGenerator.
 
-    TODO: we can get rid of storing a part of the config in files (see commented out code and:
-    https://github.com/KrainskiL/MLNABCDGraphGenerator.jl/blob/main/src/auxiliary.jl#L19)
+    The object is a session of the generator: the Julia package is loaded once, when the object is
+    created, and many networks are generated in a loop on the Julia side, so that the package and
+    the loop are compiled once per session and not for each network.
     """
-    seed: int
-    n: int
-    edges_cor: pd.DataFrame
-    layer_params: pd.DataFrame
-    d_max_iter: int
-    c_max_iter: int
-    t: int
-    eps: float
-    d: int
-    edges_filename: str
-    communities_filename: str
-    # l: int
-    # qs: list[float]
-    # ns: list[int]
-    # taus: list[float]
-    # rs: list[float]
-    # gammas: list[float]
-    # d_mins: list[int]
-    # d_maxs: list[int]
-    # betas: list[float]
-    # c_mins: list[int]
-    # c_maxs: list[int]
-    # xis: list[float]
-    # skip_edges_correlation: bool
-    # edges_cor_matrix: np.ndarray
-
-    def __post_init__(self) -> None:
-        self._rng = np.random.default_rng(seed=self.seed)
-        assert isinstance(self.seed, int)
-        assert isinstance(self.n, int)
-        assert isinstance(self.edges_cor, pd.DataFrame)
-        assert isinstance(self.layer_params, pd.DataFrame)
-        assert isinstance(self.d_max_iter, int)
-        assert isinstance(self.c_max_iter, int)
-        assert isinstance(self.t, int)
-        assert isinstance(self.d, int)
-        assert isinstance(self.eps, float)
-        assert isinstance(self.d, int)
-        assert isinstance(self.edges_filename, str)
-        assert isinstance(self.communities_filename, str)
-
-    @staticmethod
-    def get_layer_params(n: int, lp: dict[str, Any] | str) -> pd.DataFrame:
-        if isinstance(lp, str):
-            df = pd.read_csv(lp)
-        elif isinstance(lp, dict):
-            df = pd.DataFrame(lp)
-        else:
-            raise ValueError(f"LP should be either dict or path to file.")
-        assert all(df["q"].between(0, 1))
-        assert all(df["delta"].between(0, 1))
-        assert all(df["Delta"].between(0, 1))
-        assert all(df["s"].between(0, 1))
-        assert all(df["S"].between(0, 1))
-        df["_q"] = df["q"] * n
-        df["delta"] = (df["delta"] * df["_q"]).round(0).astype(int)
-        df["Delta"] = (df["Delta"] * df["_q"]).round(0).astype(int)
-        df["s"] = (df["s"] * df["_q"]).round(0).astype(int)
-        df["S"] = (df["S"] * df["_q"]).round(0).astype(int)
-        return df[["q", "tau", "r", "gamma", "delta", "Delta", "beta", "s", "S", "xi"]]
-
-    @staticmethod
-    def get_edges_cor(ec: list[list[float]] | str) -> pd.DataFrame:
-        if isinstance(ec, str):
-            return pd.read_csv(ec, index_col=0)
-        elif isinstance(ec, list):
-            return pd.DataFrame(
-                ec,
-                index=range(1, len(ec) + 1),
-                columns=range(1, len(ec[0]) + 1),
-            )
-        raise ValueError(f"EC should be either list or path to file.")
-
-    @classmethod
-    def from_yaml(cls, config: dict[str, Any]) -> "MLNConfig":
-        _config = config.copy()
-        edges_cor = cls.get_edges_cor(config["edges_cor"])
-        _config["edges_cor"] = edges_cor
-        layer_params = cls.get_layer_params(config["n"], config["layer_params"])
-        _config["layer_params"] = layer_params
-        return cls(**_config)
-
-
-class MLNABCDGraphGenerator:
-    """A wrapper class for jl.MLNABCDGraphGenerator."""
 
     edges_filename = "edges.csv"
     layers_filename = "layers.csv"
 
+    def __init__(self) -> None:
+        try:
+            jl.seval("using MLNABCDGraphGenerator")
+        except JuliaError:
+            self.install_julia_dependencies()
+            jl.seval("using MLNABCDGraphGenerator")
+        self._generate_batch = jl.seval(GENERATE_BATCH_JL)
+
     @staticmethod
     def install_julia_dependencies():
         jl.Pkg.add(url="https://github.com/bkamins/ABCDGraphGenerator.jl")
         jl.Pkg.add(url="https://github.com/KrainskiL/MLNABCDGraphGenerator.jl")
 
     def __call__(self, config: MLNConfig) -> None:
-        try:
-            jl.seval("using MLNABCDGraphGenerator")
-        except JuliaError:
-            self.install_julia_dependencies()
-        
+        self.generate_batch(config, [(config.edges_filename, config.communities_filename)])
+
+    def generate_batch(
+        self,
+        config: MLNConfig,
+        filenames: list[tuple[str, str]],
+        seeds: list[int] | None = None,
+    ) -> None:
+        """
+        Generate a network for each pair of names of files to save its edges and communities in.
+
+        :param config: configuration of networks
+        :param filenames: names of files of edges and communities of consecutive networks
+        :param seeds: seeds of networks (if not given, they're drawn from the config's generator)
+        """
+        seeds = config.draw_seeds(len(filenames)) if seeds is None else seeds
+        self._generate(config, seeds, filenames, return_arrays=False)
+
+    def generate_networks(
+        self,
+        config: MLNConfig,
+        nb: int,
+        filenames: list[tuple[str, str]] | None = None,
+        seeds: list[int] | None = None,
+    ) -> list[GeneratedNetwork]:
+        """
+        Generate networks and return their edges and communities as arrays.
+
+        :param config: configuration of networks
+        :param nb: nb. of networks to generate
+        :param filenames: if given, networks are also saved in these files of edges and communities
+        :param seeds: seeds of networks (if not given, they're drawn from the config's generator)
+        """
+        seeds = config.draw_seeds(nb) if seeds is None else seeds
+        return self._generate(config, seeds, filenames, return_arrays=True)
+
+    def _generate(
+        self,
+        config: MLNConfig,
+        seeds: list[int],
+        filenames: list[tuple[str, str]] | None,
+        return_arrays: bool,
+    ) -> list[GeneratedNetwork]:
+        write_files = filenames is not None
+        if not write_files:
+            filenames = [("", "")] * len(seeds)
         with tempfile.TemporaryDirectory() as tmpdir:
 
-            # Save dataframes into temp dir
+            # Save dataframes into temp dir, they're read by the generator for each network
             edges_path = str(Path(tmpdir) / self.edges_filename)
             layers_path = str(Path(tmpdir) / self.layers_filename)
             config.edges_cor.to_csv(edges_path)
             config.layer_params.to_csv(layers_path, index=False)
 
-            # Load config. Since julia is called each time as a new process, we use a following
-            # workaround to generate random, yet repetitive as a sequence, results
-            config = jl.MLNABCDGraphGenerator.MLNConfig(
-                int(config._rng.random() * 1000),
+            networks = self._generate_batch(
+                jl_convert(jl.Vector[jl.Int], seeds),
                 config.n,
                 edges_path,
                 layers_path,
@@ -139,36 +171,17 @@ class MLNABCDGraphGenerator:
                 config.t,
                 config.eps,
                 config.d,
-                config.edges_filename,
-                config.communities_filename,
-            )
-
-            # Active nodes
-            active_nodes = jl.MLNABCDGraphGenerator.generate_active_nodes(config)
-
-            # Degree Sequences
-            degrees = jl.MLNABCDGraphGenerator.generate_degrees(config, active_nodes, False)
-
-            # Sizes of communities
-            com_sizes, coms = jl.MLNABCDGraphGenerator.generate_communities(config, active_nodes)
-
-            # Generate ABCD graphs
-            edges = jl.MLNABCDGraphGenerator.generate_abcd(config, degrees, com_sizes, coms)
-
-            # Map nodes and communities into agents
-            edges = jl.MLNABCDGraphGenerator.map_edges_to_agents(edges, active_nodes)
-            coms = jl.MLNABCDGraphGenerator.map_communities_to_agents(config.n, coms, active_nodes)
-
-            # Adjust edges correlation
-            edges_rewired = jl.MLNABCDGraphGenerator.adjust_edges_correlation(
-                config, edges, coms, active_nodes, False, False
+                jl_convert(jl.Vector[jl.String], [edges for edges, _ in filenames]),
+                jl_convert(jl.Vector[jl.String], [communities for _, communities in filenames]),
+                write_files,
+                return_arrays,
             )
 
-            # Save edges to file
-            jl.MLNABCDGraphGenerator.write_edges(config, edges_rewired)
-
-            # Save communities to file
-            jl.MLNABCDGraphGenerator.write_communities(config, coms)
+            # arrays are copied, so they don't refer to the memory managed by Julia
+            return [
+                GeneratedNetwork(edges=np.array(edges), communities=np.array(communities))
+                for edges, communities in networks
+            ]
 
 
 if __name__ == "__main__":
@@ -195,7 +208,8 @@ if __name__ == "__main__":
         edges_filename=str(out_dir / "edges.dat"),
         communities_filename=str(out_dir / "communities.dat"),
     )
-    MLNABCDGraphGenerator()(config=mln_config)
+    generator = MLNABCDGraphGenerator()
+    generator(config=mln_config)
 
     # or from file
     with open("scripts/configs/example_generate/config.yaml", "r") as file:
@@ -203,4 +217,4 @@ if __name__ == "__main__":
     config = _config["mln_config"]
     config["seed"] = _config["run"]["rng_seed"]
     mln_config = MLNConfig.from_yaml(config)
-    MLNABCDGraphGenerator()(config=mln_config)
+    generator(config=mln_config)
@@ -0,0 +1,129 @@
+"""Configuration of MLNABCD networks and a container of generated ones."""
+
+from dataclasses import dataclass
+from typing import Any
+
+import network_diffusion as nd
+import numpy as np
+import pandas as pd
+
+from src.mln_abcd.julia_reader import communities_to_df, edges_to_mln, edges_to_mlnt
+
+
+@dataclass
+class MLNConfig:
+    """
+    A wrapper for class for class for jl.MLNABCDGraphGenerator.MLNConfig.
+
+    TODO: we can get rid of storing a part of the config in files (see commented out code and:
+    https://github.com/KrainskiL/MLNABCDGraphGenerator.jl/blob/main/src/auxiliary.jl#L19)
+    """
+    seed: int
+    n: int
+    edges_cor: pd.DataFrame
+    layer_params: pd.DataFrame
+    d_max_iter: int
+    c_max_iter: int
+    t: int
+    eps: float
+    d: int
+    edges_filename: str
+    communities_filename: str
+    # l: int
+    # qs: list[float]
+    # ns: list[int]
+    # taus: list[float]
+    # rs: list[float]
+    # gammas: list[float]
+    # d_mins: list[int]
+    # d_maxs: list[int]
+    # betas: list[float]
+    # c_mins: list[int]
+    # c_maxs: list[int]
+    # xis: list[float]
+    # skip_edges_correlation: bool
+    # edges_cor_matrix: np.ndarray
+
+    def __post_init__(self) -> None:
+        self._rng = np.random.default_rng(seed=self.seed)
+        assert isinstance(self.seed, int)
+        assert isinstance(self.n, int)
+        assert isinstance(self.edges_cor, pd.DataFrame)
+        assert isinstance(self.layer_params, pd.DataFrame)
+        assert isinstance(self.d_max_iter, int)
+        assert isinstance(self.c_max_iter, int)
+        assert isinstance(self.t, int)
+        assert isinstance(self.d, int)
+        assert isinstance(self.eps, float)
+        assert isinstance(self.d, int)
+        assert isinstance(self.edges_filename, str)
+        assert isinstance(self.communities_filename, str)
+
+    @staticmethod
+    def get_layer_params(n: int, lp: dict[str, Any] | str) -> pd.DataFrame:
+        if isinstance(lp, str):
+            df = pd.read_csv(lp)
+        elif isinstance(lp, dict):
+            df = pd.DataFrame(lp)
+        else:
+            raise ValueError(f"LP should be either dict or path to file.")
+        assert all(df["q"].between(0, 1))
+        assert all(df["delta"].between(0, 1))
+        assert all(df["Delta"].between(0, 1))
+        assert all(df["s"].between(0, 1))
+        assert all(df["S"].between(0, 1))
+        df["_q"] = df["q"] * n
+        df["delta"] = (df["delta"] * df["_q"]).round(0).astype(int)
+        df["Delta"] = (df["Delta"] * df["_q"]).round(0).astype(int)
+        df["s"] = (df["s"] * df["_q"]).round(0).astype(int)
+        df["S"] = (df["S"] * df["_q"]).round(0).astype(int)
+        return df[["q", "tau", "r", "gamma", "delta", "Delta", "beta", "s", "S", "xi"]]
+
+    @staticmethod
+    def get_edges_cor(ec: list[list[float]] | str) -> pd.DataFrame:
+        if isinstance(ec, str):
+            return pd.read_csv(ec, index_col=0)
+        elif isinstance(ec, list):
+            return pd.DataFrame(
+                ec,
+                index=range(1, len(ec) + 1),
+                columns=range(1, len(ec[0]) + 1),
+            )
+        raise ValueError(f"EC should be either list or path to file.")
+
+    def draw_seeds(self, nb: int) -> list[int]:
+        """
+        Draw seeds of consecutive networks.
+
+        Since the state of Julia's generator doesn't persist between networks, each of them is
+        seeded separately with a number drawn from the config's generator; hence, the sequence of
+        networks is repetitive for the seed of the config.
+        """
+        return [int(self._rng.random() * 1000) for _ in range(nb)]
+
+    @classmethod
+    def from_yaml(cls, config: dict[str, Any]) -> "MLNConfig":
+        _config = config.copy()
+        edges_cor = cls.get_edges_cor(config["edges_cor"])
+        _config["edges_cor"] = edges_cor
+        layer_params = cls.get_layer_params(config["n"], config["layer_params"])
+        _config["layer_params"] = layer_params
+        return cls(**_config)
+
+
+@dataclass(frozen=True)
+class GeneratedNetwork:
+    """A network generated by MLNABCD, held in memory in the layout of files it's written to."""
+
+    edges: np.ndarray  # rows of (source, target, layer)
+    communities: np.ndarray  # rows of (community, layer)
+
+    def to_mln(self) -> nd.MultilayerNetwork:
+        return edges_to_mln(self.edges)
+
+    def to_mlnt(self, device: str = "cpu") -> nd.MultilayerNetworkTorch:
+        """Build the tensor representation directly from edges (see `edges_to_mlnt`)."""
+        return edges_to_mlnt(self.edges, device)
+
+    def get_communities(self) -> pd.DataFrame:
+        return communities_to_df(self.communities)
@@ -0,0 +1,508 @@
+"""A generator of MLNABCD networks implemented in NumPy, i.e. without Julia."""
+
+import numpy as np
+from scipy.stats import norm
+
+from src.mln_abcd.mln_config import GeneratedNetwork, MLNConfig
+
+
+REWIRE_MAX_ITER = 100  # max. nb. of attempts to rewire self-loops and multi-edges of a graph
+REWIRE_PATIENCE = 10  # max. nb. of consecutive attempts which don't decrease their nb.
+
+
+def sample_powerlaw(
+    rng: np.random.Generator, exponent: float, v_min: int, v_max: int, size: int
+) -> np.ndarray:
+    """Sample integers from the power-law distribution truncated to [v_min, v_max]."""
+    support = np.arange(v_min, v_max + 1)
+    weights = support.astype(float) ** -exponent
+    return rng.choice(support, size=size, p=weights / weights.sum())
+
+
+def sample_degrees(
+    rng: np.random.Generator, gamma: float, d_min: int, d_max: int, n: int, max_iter: int
+) -> np.ndarray:
+    """
+    Sample a degree sequence with an even sum, sorted in descending order (as ABCD does).
+
+    The sequence is redrawn up to `max_iter` times, then the largest degree is fixed to even up the
+    sum of degrees.
+    """
+    for _ in range(max_iter):
+        degrees = sample_powerlaw(rng, gamma, d_min, d_max, n)
+        if degrees.sum() % 2 == 0:
+            break
+    else:
+        degrees[np.argmax(degrees)] += 1 if degrees.max() < d_max else -1
+    return np.sort(degrees)[::-1]
+
+
+def sample_communities(
+    rng: np.random.Generator, beta: float, s_min: int, s_max: int, n: int, max_iter: int
+) -> np.ndarray:
+    """
+    Sample sizes of communities which sum up to `n` (as ABCD does).
+
+    Sizes are drawn until they cover `n` and the last one is trimmed to fit it. If the last one
+    becomes smaller than `s_min` in all `max_iter` attempts, it's dropped and its members are
+    spread over random communities.
+    """
+    draws_nb = n // s_min + 1  # enough to cover `n` at once
+    for _ in range(max_iter):
+        sizes = sample_powerlaw(rng, beta, s_min, s_max, draws_nb)
+        sizes = sizes[:np.searchsorted(np.cumsum(sizes), n) + 1]
+        sizes[-1] -= sizes.sum() - n
+        if sizes[-1] >= s_min:
+            return sizes
+    sizes = sizes[:-1] if len(sizes) > 1 else np.zeros(1, dtype=sizes.dtype)
+    np.add.at(sizes, rng.integers(0, len(sizes), n - sizes.sum()), 1)
+    return sizes
+
+
+def sample_points(rng: np.random.Generator, n: int, d: int) -> np.ndarray:
+    """Sample points uniformly from the `d`-dimensional unit ball."""
+    directions = rng.standard_normal((n, d))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return directions * rng.random((n, 1)) ** (1 / d)
+
+
+def assign_points(rng: np.random.Generator, points: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Assign points to communities of given sizes (taken in a random order).
+
+    Each community is formed by the remaining point which is the farthest from the centre and its
+    nearest remaining neighbours.
+
+    :return: labels of communities of points
+    """
+    labels = np.empty(len(points), dtype=np.int64)
+    remaining = np.arange(len(points))
+    dist = np.linalg.norm(points, axis=1)
+    for label, size in enumerate(rng.permutation(sizes)):
+        ref_point = points[remaining[np.argmax(dist)]]
+        dist_ref = np.linalg.norm(points[remaining] - ref_point, axis=1)
+        members = np.argpartition(dist_ref, size - 1)[:size]
+        labels[remaining[members]] = label
+        to_keep = np.ones(len(remaining), dtype=bool)
+        to_keep[members] = False
+        remaining, dist = remaining[to_keep], dist[to_keep]
+    return labels
+
+
+def shuffle_communities(rng: np.random.Generator, r: float, labels: np.ndarray) -> np.ndarray:
+    """Shuffle labels of communities between a random `1 - r` fraction of points."""
+    labels = labels.copy()
+    shuffled = rng.random(len(labels)) >= r
+    labels[shuffled] = rng.permutation(labels[shuffled])
+    return labels
+
+
+def sample_ranking(rng: np.random.Generator, n: int, tau: float) -> np.ndarray:
+    """
+    Sample a ranking of `n` positions with the given Kendall's correlation with their order.
+
+    Scores of positions are their normal quantiles mixed with a normal noise, so that the scores
+    are bivariate normal with correlation `sin(pi * tau / 2)`, which Kendall's tau is `tau`.
+
+    :return: positions ordered by scores, i.e. the first one gets the largest degree
+    """
+    rho = np.sin(np.pi * tau / 2)
+    quantiles = norm.ppf(np.arange(1, n + 1) / (n + 1))
+    scores = rho * quantiles + np.sqrt(1 - rho ** 2) * rng.standard_normal(n)
+    return np.argsort(scores, kind="stable")
+
+
+def generate_active_nodes(rng: np.random.Generator, config: MLNConfig) -> list[np.ndarray]:
+    """Sample (sorted) actors active in each layer."""
+    return [
+        np.sort(rng.choice(config.n, size=round(q * config.n), replace=False))
+        for q in config.layer_params["q"]
+    ]
+
+
+def generate_degrees(
+    rng: np.random.Generator, config: MLNConfig, active_nodes: list[np.ndarray]
+) -> list[np.ndarray]:
+    """Sample degrees of active nodes of each layer, correlated with labels of actors by `tau`."""
+    layers_degrees = []
+    for layer_nodes, (_, params) in zip(active_nodes, config.layer_params.iterrows()):
+        n_layer = len(layer_nodes)
+        d_max = min(int(params["Delta"]), n_layer - 1)
+        d_min = min(max(int(params["delta"]), 1), d_max)
+        degrees_ordered = sample_degrees(
+            rng, params["gamma"], d_min, d_max, n_layer, config.d_max_iter
+        )
+        degrees = np.empty(n_layer, dtype=np.int64)
+        degrees[sample_ranking(rng, n_layer, params["tau"])] = degrees_ordered
+        layers_degrees.append(degrees)
+    return layers_degrees
+
+
+def generate_communities(
+    rng: np.random.Generator, config: MLNConfig, active_nodes: list[np.ndarray]
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    """
+    Sample communities of active nodes of each layer.
+
+    Communities are formed in a latent space shared by all layers, so partitions of layers are
+    correlated, and then a fraction `1 - r` of nodes of each layer is shuffled between them.
+
+    :return: sizes of communities and labels of communities of active nodes of each layer
+    """
+    points = sample_points(rng, config.n, config.d)
+    layers_sizes, layers_labels = [], []
+    for layer_nodes, (_, params) in zip(active_nodes, config.layer_params.iterrows()):
+        n_layer = len(layer_nodes)
+        s_max = min(int(params["S"]), n_layer)
+        s_min = min(max(int(params["s"]), 1), s_max)
+        sizes = sample_communities(
+            rng, params["beta"], s_min, s_max, n_layer, config.c_max_iter
+        )
+        labels = assign_points(rng, points[layer_nodes], sizes)
+        layers_sizes.append(sizes)
+        layers_labels.append(shuffle_communities(rng, params["r"], labels))
+    return layers_sizes, layers_labels
+
+
+def _get_keys(edges: np.ndarray, n: int) -> np.ndarray:
+    """Encode undirected edges as integers."""
+    return edges.min(axis=1) * n + edges.max(axis=1)
+
+
+def _decode_keys(keys: np.ndarray, n: int) -> np.ndarray:
+    return np.stack([keys // n, keys % n], axis=1)
+
+
+def _pair_stubs(rng: np.random.Generator, stubs: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Pair stubs at random within groups (each of an even size) as the configuration model."""
+    return stubs[np.lexsort((rng.random(len(stubs)), groups))].reshape(-1, 2)
+
+
+def _get_bad_edges(edges: np.ndarray, n: int, fixed_keys: np.ndarray) -> np.ndarray:
+    """Get a mask of self-loops and of edges repeated among them or among fixed edges."""
+    keys = _get_keys(edges, n)
+    is_bad = np.ones(len(keys), dtype=bool)
+    is_bad[np.unique(keys, return_index=True)[1]] = False
+    return is_bad | (edges[:, 0] == edges[:, 1]) | np.isin(keys, fixed_keys)
+
+
+def _fix_parity(stubs_nb: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Remove a stub of a node having the most of them in each group with an odd sum of stubs."""
+    stubs_nb = stubs_nb.copy()
+    is_odd = np.bincount(groups, weights=stubs_nb).astype(np.int64) % 2 == 1
+    order = np.lexsort((-stubs_nb, groups))
+    firsts = order[np.unique(groups[order], return_index=True)[1]]
+    stubs_nb[firsts[is_odd[groups[firsts]]]] -= 1
+    return stubs_nb
+
+
+def _rewire_bad_edges(
+    rng: np.random.Generator, edges: np.ndarray, labels: np.ndarray, fixed_keys: np.ndarray
+) -> np.ndarray:
+    """
+    Rewire self-loops and multi-edges together with as many random edges (within groups of nodes
+    given by labels), and drop ones which are still bad when their nb. stops decreasing (e.g. in
+    communities too small for degrees of their nodes) or after `REWIRE_MAX_ITER` attempts.
+    """
+    edges = edges.copy()
+    n_nodes = len(labels)
+    min_bad_nb, stalled_nb = len(edges) + 1, 0
+    for _ in range(REWIRE_MAX_ITER):
+        is_bad = _get_bad_edges(edges, n_nodes, fixed_keys)
+        bad_nb = is_bad.sum()
+        if bad_nb == 0:
+            return edges
+        stalled_nb = stalled_nb + 1 if bad_nb >= min_bad_nb else 0
+        if stalled_nb == REWIRE_PATIENCE:
+            return edges[~is_bad]
+        min_bad_nb = min(bad_nb, min_bad_nb)
+
+        # each bad edge is rewired with a random good edge of its group (if there's any)
+        edges_labels = labels[edges[:, 0]]
+        good_idx = np.flatnonzero(~is_bad)
+        good_idx = good_idx[np.argsort(edges_labels[good_idx], kind="stable")]
+        good_starts = np.searchsorted(edges_labels[good_idx], np.arange(labels.max() + 1))
+        good_nb = np.diff(np.append(good_starts, len(good_idx)))
+        bad_labels = edges_labels[is_bad]
+        has_partner = good_nb[bad_labels] > 0
+        partners = good_idx[
+            good_starts[bad_labels[has_partner]]
+            + (rng.random(has_partner.sum()) * good_nb[bad_labels[has_partner]]).astype(np.int64)
+        ]
+        rewired = np.concatenate([np.flatnonzero(is_bad), np.unique(partners)])
+        stubs = edges[rewired].ravel()
+        edges[rewired] = _pair_stubs(rng, stubs, labels[stubs])
+    return edges[~_get_bad_edges(edges, n_nodes, fixed_keys)]
+
+
+def generate_abcd_layer(
+    rng: np.random.Generator, degrees: np.ndarray, labels: np.ndarray, xi: float
+) -> np.ndarray:
+    """
+    Wire a layer as ABCD: a graph of each community and a background graph over all nodes.
+
+    Each node has a `1 - xi` fraction of its degree (rounded at random) wired inside its community,
+    and the rest in the background graph. If it exceeds the size of the community, the excess is
+    taken over by other members of the community, as far as their degrees and the size allow, so
+    that the fraction of edges inside communities is kept. Both graphs are configuration models
+    with self-loops and multi-edges rewired; stubs of ones which couldn't be rewired inside
+    communities are moved to the background graph.
+
+    :return: edges as rows of (source, target) of nodes, i.e. positions in `degrees`
+    """
+    n_layer = len(degrees)
+    max_internal = np.minimum(np.bincount(labels)[labels] - 1, degrees)
+    internal = np.minimum((1 - xi) * degrees, max_internal)
+    excess = np.bincount(labels, weights=(1 - xi) * degrees - internal)
+    slack = np.bincount(labels, weights=max_internal - internal)
+    internal += (max_internal - internal) * np.minimum(excess / np.maximum(slack, 1), 1)[labels]
+    internal = np.floor(internal).astype(np.int64) + (rng.random(n_layer) < internal % 1)
+    internal = _fix_parity(internal, labels)
+
+    # graphs of communities
+    stubs = np.repeat(np.arange(n_layer), internal)
+    com_edges = _pair_stubs(rng, stubs, labels[stubs])
+    com_edges = _rewire_bad_edges(rng, com_edges, labels, np.empty(0, dtype=np.int64))
+
+    # background graph
+    external = degrees - np.bincount(com_edges.ravel(), minlength=n_layer)
+    background = np.zeros(n_layer, dtype=np.int64)
+    stubs = np.repeat(np.arange(n_layer), _fix_parity(external, background))
+    bg_edges = _pair_stubs(rng, stubs, background[stubs])
+    bg_edges = _rewire_bad_edges(
+        rng, bg_edges, background, np.unique(_get_keys(com_edges, n_layer))
+    )
+    return np.concatenate([com_edges, bg_edges])
+
+
+def generate_abcd(
+    rng: np.random.Generator,
+    config: MLNConfig,
+    degrees: list[np.ndarray],
+    coms: list[np.ndarray],
+) -> list[np.ndarray]:
+    """Wire each layer (see `generate_abcd_layer`)."""
+    return [
+        generate_abcd_layer(rng, layer_degrees, layer_coms, xi)
+        for layer_degrees, layer_coms, xi in zip(degrees, coms, config.layer_params["xi"])
+    ]
+
+
+def map_edges_to_agents(
+    edges: list[np.ndarray], active_nodes: list[np.ndarray]
+) -> list[np.ndarray]:
+    return [layer_nodes[layer_edges] for layer_edges, layer_nodes in zip(edges, active_nodes)]
+
+
+def map_communities_to_agents(
+    n: int, coms: list[np.ndarray], active_nodes: list[np.ndarray]
+) -> list[np.ndarray]:
+    """Get communities of all actors in each layer (1-based, -1 for inactive actors)."""
+    agents_coms = np.full((len(coms), n), -1, dtype=np.int64)
+    for layer_idx, (layer_coms, layer_nodes) in enumerate(zip(coms, active_nodes)):
+        agents_coms[layer_idx, layer_nodes] = layer_coms + 1
+    return list(agents_coms)
+
+
+def get_edges_overlaps(
+    keys: np.ndarray, layers_keys: list[np.ndarray], active_masks: np.ndarray, n: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get overlaps of edges of the layer with all layers.
+
+    :return: nb. of edges of the layer between actors active in each layer and nb. of edges common
+        with each layer
+    """
+    sources, targets = keys // n, keys % n
+    restricted_nb = (active_masks[:, sources] & active_masks[:, targets]).sum(axis=1)
+    common_nb = np.array(
+        [len(np.intersect1d(keys, other_keys, assume_unique=True)) for other_keys in layers_keys]
+    )
+    return restricted_nb, common_nb
+
+
+def adjust_edges_correlation(
+    rng: np.random.Generator,
+    config: MLNConfig,
+    edges: list[np.ndarray],
+    coms: list[np.ndarray],
+) -> list[np.ndarray]:
+    """
+    Rewire edges of layers (of actors) towards the desired correlations of edges between layers.
+
+    A correlation is measured as by `config_finder`: the nb. of common edges by the nb. of edges of
+    the smaller layer, both layers restricted to actors active in both of them. In each of `t`
+    batches, for each layer, at most an `eps` fraction of its edges is replaced. Layer's edges
+    missing to reach the correlation with another layer are copied from it in place of random
+    edges (not common with such layers), and edges in excess of the correlation are rewired with as
+    many random edges. The gap is closed in halves, since each pair of layers is adjusted from both
+    sides, until it's within an edge.
+    Edges inside communities of the layer are replaced and rewired only by such edges (and so are
+    edges between communities), hence the level of noise is kept.
+
+    :param coms: communities of actors in each layer (-1 for inactive actors)
+    """
+    n = config.n
+    edges_cor = config.edges_cor.to_numpy()
+    active_masks = np.stack(coms) != -1
+    layers_keys = [np.unique(_get_keys(layer_edges, n)) for layer_edges in edges]
+    overlaps = [get_edges_overlaps(keys, layers_keys, active_masks, n) for keys in layers_keys]
+    restricted_nb = np.stack([restricted for restricted, _ in overlaps])
+    common_nb = np.stack([common for _, common in overlaps])
+
+    for _ in range(config.t):
+        adjusted = False
+        for layer_idx, keys in enumerate(layers_keys):
+            sizes = np.minimum(restricted_nb[layer_idx], restricted_nb[:, layer_idx])
+            gaps = edges_cor[layer_idx] * sizes - common_nb[layer_idx]
+            gaps[(np.abs(gaps) <= 1) | (np.arange(len(gaps)) == layer_idx)] = 0.
+            to_copy = np.round(np.maximum(gaps, 0) / 2).astype(np.int64)
+            to_rewire = np.round(np.maximum(-gaps, 0) / 2).astype(np.int64)
+            budget = int(np.ceil(config.eps * len(keys)))
+            changes_nb = to_copy.sum() + to_rewire.sum()
+            if changes_nb == 0:
+                continue
+            if changes_nb > budget:
+                to_copy = np.floor(to_copy * budget / changes_nb).astype(np.int64)
+                to_rewire = np.floor(to_rewire * budget / changes_nb).astype(np.int64)
+
+            # select edges in excess and edges to copy (free edges aren't common with their layers)
+            is_free = np.ones(len(keys), dtype=bool)
+            removed, copied = [], []
+            for other_idx, other_keys in enumerate(layers_keys):
+                if to_rewire[other_idx] > 0:
+                    common = np.flatnonzero(np.isin(keys, other_keys, assume_unique=True))
+                    removed.append(rng.permutation(common)[:to_rewire[other_idx]])
+                if to_copy[other_idx] > 0:
+                    is_free &= ~np.isin(keys, other_keys, assume_unique=True)
+                    candidates = other_keys[
+                        active_masks[layer_idx, other_keys // n]
+                        & active_masks[layer_idx, other_keys % n]
+                        & ~np.isin(other_keys, keys, assume_unique=True)
+                    ]
+                    copied.append(rng.permutation(candidates)[:to_copy[other_idx]])
+            removed = np.unique(np.concatenate([np.empty(0, dtype=np.int64), *removed]))
+            copied = np.unique(np.concatenate([np.empty(0, dtype=np.int64), *copied]))
+            is_free[removed] = False
+
+            # communities of edges (or -1 for edges between communities)
+            layer_coms = coms[layer_idx]
+            edges_coms = layer_coms[_decode_keys(keys, n)]
+            edges_coms = np.where(edges_coms[:, 0] == edges_coms[:, 1], edges_coms[:, 0], -1)
+
+            # edges in excess are rewired together with as many free ones
+            partners = rng.permutation(np.flatnonzero(is_free))[:len(removed)]
+            is_free[partners] = False
+            removed = np.concatenate([removed, partners])
+            stubs = _decode_keys(keys[removed], n).ravel()
+            rewired = _get_keys(_pair_stubs(rng, stubs, np.repeat(edges_coms[removed], 2)), n)
+            rewired = rewired[rewired // n != rewired % n]
+
+            # copied edges replace free ones, of the same kind as regards communities
+            is_internal = edges_coms != -1
+            is_copied_internal = layer_coms[copied // n] == layer_coms[copied % n]
+            replaced = np.concatenate(
+                [
+                    rng.permutation(np.flatnonzero(is_free & is_internal))[
+                        :is_copied_internal.sum()
+                    ],
+                    rng.permutation(np.flatnonzero(is_free & ~is_internal))[
+                        :(~is_copied_internal).sum()
+                    ],
+                ]
+            )
+            kept = np.ones(len(keys), dtype=bool)
+            kept[removed] = False
+            kept[replaced] = False
+            keys = np.unique(np.concatenate([keys[kept], copied, rewired]))
+            layers_keys[layer_idx] = keys
+            restricted_nb[layer_idx], common_nb[layer_idx] = get_edges_overlaps(
+                keys, layers_keys, active_masks, n
+            )
+            common_nb[:, layer_idx] = common_nb[layer_idx]
+            adjusted = True
+        if not adjusted:
+            break
+
+    return [_decode_keys(keys, n) for keys in layers_keys]
+
+
+def generate_network(config: MLNConfig, seed: int) -> GeneratedNetwork:
+    """Generate a network following phases of `MLNABCDGraphGenerator.jl`."""
+    rng = np.random.default_rng(seed)
+    active_nodes = generate_active_nodes(rng, config)
+    degrees = generate_degrees(rng, config, active_nodes)
+    _, coms = generate_communities(rng, config, active_nodes)
+    edges = generate_abcd(rng, config, degrees, coms)
+    edges = map_edges_to_agents(edges, active_nodes)
+    coms = map_communities_to_agents(config.n, coms, active_nodes)
+    edges_rewired = adjust_edges_correlation(rng, config, edges, coms)
+
+    # actors and layers are 1-based, as in files written by the Julia generator
+    return GeneratedNetwork(
+        edges=np.concatenate(
+            [
+                np.column_stack([layer_edges + 1, np.full(len(layer_edges), layer_idx)])
+                for layer_idx, layer_edges in enumerate(edges_rewired, 1)
+            ]
+        ),
+        communities=np.concatenate(
+            [
+                np.column_stack([layer_coms, np.full(len(layer_coms), layer_idx)])
+                for layer_idx, layer_coms in enumerate(coms, 1)
+            ]
+        ),
+    )
+
+
+class MLNABCDNumpyGenerator:
+    """
+    A generator of MLNABCD networks in NumPy, with the interface of `MLNABCDGraphGenerator`.
+
+    The generator follows phases of the Julia package: actors active in layers, degree sequences
+    correlated with labels of actors, communities in a latent space, ABCD wiring of layers, mapping
+    nodes to actors and adjusting the correlation of edges between layers. Networks are not
+    identical to ones generated by Julia for the same seed, but their properties, measured as by
+    `config_finder`, match the config. The generator needs no Julia runtime, hence it starts
+    instantly and scales to many processes at no cost.
+    """
+
+    def __call__(self, config: MLNConfig) -> None:
+        self.generate_batch(config, [(config.edges_filename, config.communities_filename)])
+
+    def generate_batch(
+        self,
+        config: MLNConfig,
+        filenames: list[tuple[str, str]],
+        seeds: list[int] | None = None,
+    ) -> None:
+        """
+        Generate a network for each pair of names of files to save its edges and communities in.
+
+        :param config: configuration of networks
+        :param filenames: names of files of edges and communities of consecutive networks
+        :param seeds: seeds of networks (if not given, they're drawn from the config's generator)
+        """
+        self.generate_networks(config, len(filenames), filenames, seeds)
+
+    def generate_networks(
+        self,
+        config: MLNConfig,
+        nb: int,
+        filenames: list[tuple[str, str]] | None = None,
+        seeds: list[int] | None = None,
+    ) -> list[GeneratedNetwork]:
+        """
+        Generate networks and return their edges and communities as arrays.
+
+        :param config: configuration of networks
+        :param nb: nb. of networks to generate
+        :param filenames: if given, networks are also saved in these files of edges and communities
+        :param seeds: seeds of networks (if not given, they're drawn from the config's generator)
+        """
+        seeds = config.draw_seeds(nb) if seeds is None else seeds
+        networks = [generate_network(config, seed) for seed in seeds]
+        for network, (edges_filename, communities_filename) in zip(networks, filenames or []):
+            np.savetxt(edges_filename, network.edges, fmt="%d", delimiter="\t")
+            np.savetxt(communities_filename, network.communities, fmt="%d", delimiter="\t")
+        return networks
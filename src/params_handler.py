@@ -9,9 +9,11 @@ from pathlib import Path
 from typing import Any
 
 import network_diffusion as nd
+import numpy as np
 
-from src.loaders.net_loader import load_network
+from src.loaders.net_loader import load_generated_networks, load_network
 from src.loaders.constants import SEPARATOR
+from src.mln_abcd.julia_reader import edges_to_mlnt
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -133,6 +135,23 @@ def load_networks(networks: list[str], device: str) -> list[Network]:
     return nets
 
 
+def create_generated_networks(
+    series: str, networks_edges: dict[str, np.ndarray], device: str
+) -> list[Network]:
+    """Create networks from edges generated by mlnabcd without reading them from files."""
+    nets = []
+    for (net_type, net_name), net_graph in load_generated_networks(series, networks_edges).items():
+        nets.append(
+            Network(
+                n_type=net_type,
+                n_name=net_name,
+                n_graph_nx=net_graph,
+                n_graph_pt=edges_to_mlnt(networks_edges[net_name[len(series) + 1:]], device),
+            )
+        )
+    return nets
+
+
 def load_seed_selectors(ss_methods: list[str]) -> list[SeedSelector]:
     ssms = []
     for ssm_name in ss_methods:
@@ -141,6 +160,11 @@ def load_seed_selectors(ss_methods: list[str]) -> list[SeedSelector]:
     return ssms
 
 
+def get_ranking_name(ss_name: str, net_rich_name: str, version: str) -> str:
+    """Get a name of the ranking file (without the suffix)."""
+    return f"ss-{ss_name}--net-{net_rich_name}--ver-{version}"
+
+
 def compute_rankings(
     seed_selectors: list[SeedSelector],
     networks: list[Network],
@@ -156,7 +180,7 @@ def compute_rankings(
 
         for s_idx, ssm in enumerate(seed_selectors):
             print(f"Using method: {ssm.name} ({s_idx+1}/{len(seed_selectors)})")   
-            ss_ranking_name = Path(f"ss-{ssm.name}--net-{net.rich_name}--ver-{version}.json")
+            ss_ranking_name = Path(f"{get_ranking_name(ssm.name, net.rich_name, version)}.json")
 
             # obtain ranking for given ssm and net
             ranking = []
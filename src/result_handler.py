@@ -1,19 +1,30 @@
 """A script with functions facilitating saving the results."""
 
+import json
 import shutil
-from dataclasses import dataclass, asdict
+import warnings
+import zipfile
+from dataclasses import dataclass, asdict, fields
+from functools import lru_cache
 from pathlib import Path
+from types import NoneType, UnionType
+from typing import Any, Iterator, get_args, get_type_hints
 
+import numpy as np
 import pandas as pd
 
 
 DET_LOGS_DIR = "detailed_logs"
 RANKINGS_DIR = "rankings"
+LIST_COLUMNS = {"seed_ids": str, "expositions_rec": int}  # columns aggr. into strings sep. by ;
+RANKING_REF_PREFIX = "@"  # marks seed ids stored as a reference to the ranking they come from
+SUMMARY_FILE = "summary.csv"
+SUMMARY_KEYS = ("network_type", "network_name", "ss_method", "seed_budget", "protocol", "probab")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SimulationPartialResult:
-    seed_ids: str  # IDs of actors that were seeds aggr. into string (sep. by ;)
+    seed_ids: str  # IDs of actors that were seeds aggr. into string (sep. by ;) or ranking's ref.
     gain: float  # gain obtained using this seed set
     area: float | None  # area under normalised expositions curve reflecting diffusion dynamics
     simulation_length: int  # nb. of simulation steps
@@ -23,7 +34,7 @@ class SimulationPartialResult:
     expositions_rec: str  # record of new activations aggr. into string (sep. by ;)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SimulationFullResult(SimulationPartialResult):
     network_type: str  # network's type
     network_name: str  # network's name
@@ -61,11 +72,476 @@ class SimulationFullResult(SimulationPartialResult):
         )
 
 
-def save_results(result_list: list[SimulationFullResult], out_path: Path) -> None:
+@dataclass(frozen=True, slots=True)
+class SimulationRealisationsRecord:
+    network_type: str  # network's type
+    network_name: str  # network's name
+    ss_method: str  # seed selection method's name
+    seed_budget: float  # a value of the maximal seed budget
+    protocol: str  # protocols's (aggragation function) name
+    probab: float  # a value of the activation probability
+    realisations_nb: int  # nb. of realisations simulated for the case
+    gain_ci: float  # half-width of the confidence interval of the mean gain
+    area_ci: float  # half-width of the confidence interval of the mean area
+    converged: bool  # whether both intervals got narrower than targets before reaching the cap
+
+
+def save_results(
+    result_list: list[SimulationFullResult | SimulationRealisationsRecord], out_path: Path
+) -> None:
     me_dict_all = [asdict(me) for me in result_list]
     pd.DataFrame(me_dict_all).to_csv(out_path, index=False)
 
 
+def get_arrow_schema(record_type: type) -> Any:
+    """Create `pyarrow` schema for the dataclass of results; aggregated columns become lists."""
+    import pyarrow as pa
+    arrow_types = {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_()}
+    type_hints = get_type_hints(record_type)
+    schema_fields = []
+    for field in fields(record_type):
+        if field.name in LIST_COLUMNS:
+            arrow_type = pa.list_(arrow_types[LIST_COLUMNS[field.name]])
+        elif isinstance(type_hints[field.name], UnionType):
+            arrow_type = arrow_types[
+                [t for t in get_args(type_hints[field.name]) if t is not NoneType][0]
+            ]
+        else:
+            arrow_type = arrow_types[type_hints[field.name]]
+        schema_fields.append(pa.field(field.name, arrow_type))
+    return pa.schema(schema_fields)
+
+
+def split_list_columns(record: dict[str, Any]) -> dict[str, Any]:
+    """Convert columns aggregated into strings to lists."""
+    for col_name, col_type in LIST_COLUMNS.items():
+        if col_name in record:
+            raw_value = record[col_name]
+            record[col_name] = [col_type(v) for v in raw_value.split(";")] if raw_value else []
+    return record
+
+
+class ResultsWriter:
+    """
+    Writer which appends results to a file in batches, so that the size of its buffer is bounded.
+
+    Results are written to Parquet (if `pyarrow` is installed) with `seed_ids` and
+    `expositions_rec` stored as list columns, or to CSV which is appended chunk by chunk. If the
+    buffer size is not given, all results are written at once, exactly as with `save_results`.
+    """
+
+    def __init__(
+        self,
+        out_path: Path,
+        record_type: type = SimulationFullResult,
+        results_format: str = "csv",
+        buffer_size: int | None = None,
+    ) -> None:
+        """
+        Create the object.
+
+        :param out_path: path to the file to write; its suffix is replaced to match the format
+        :param record_type: a dataclass of written results
+        :param results_format: "csv" or "parquet" (CSV is used if `pyarrow` is unavailable)
+        :param buffer_size: nb. of results kept in memory before they're appended to the file
+        """
+        if results_format not in {"csv", "parquet"}:
+            raise ValueError(f"Unknown format of results: {results_format}!")
+        if results_format == "parquet":
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                warnings.warn("pyarrow is not installed, results will be saved to csv.")
+                results_format = "csv"
+        assert buffer_size is None or buffer_size > 0, f"incorrect buffer size: {buffer_size}!"
+        self.out_path = out_path.with_suffix(f".{results_format}")
+        self.record_type = record_type
+        self.results_format = results_format
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._flushes_nb = 0
+        self._parquet_writer = None
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(self, results: list[Any]) -> None:
+        """Add results to the buffer and append it to the file if it's full."""
+        self._buffer.extend(results)
+        if self.buffer_size is not None and len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append the buffered results to the file (if there are any)."""
+        if len(self._buffer) > 0:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        if self.results_format == "parquet":
+            self._flush_parquet()
+        else:
+            pd.DataFrame([asdict(me) for me in self._buffer]).to_csv(
+                self.out_path,
+                mode="w" if self._flushes_nb == 0 else "a",
+                header=self._flushes_nb == 0,
+                index=False,
+            )
+        self._buffer = []
+        self._flushes_nb += 1
+
+    def _flush_parquet(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = get_arrow_schema(self.record_type)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.out_path, schema)
+        table = pa.Table.from_pylist(
+            [split_list_columns(asdict(me)) for me in self._buffer], schema=schema
+        )
+        self._parquet_writer.write_table(table)
+
+    def close(self) -> None:
+        """Write the remaining results and close the file (it's created even if it's empty)."""
+        if len(self._buffer) > 0 or self._flushes_nb == 0:
+            self._write_buffer()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+@dataclass(frozen=True)
+class RaggedArray:
+    """
+    Rows of different lengths (e.g. records of expositions) stored as one flat array of values and
+    offsets of rows in it, i.e. the row `i` is `values[offsets[i]:offsets[i + 1]]`.
+    """
+
+    values: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def from_column(cls, column: pd.Series, dtype: type = int) -> "RaggedArray":
+        """Parse a column of strings joined with ; (as in CSV files) or of lists or arrays."""
+        column = column.fillna("")
+        if len(column) == 0 or isinstance(column.iloc[0], str):
+            joined = column.astype(str)
+            non_empty = joined[joined != ""]
+            lengths = joined.str.count(";").to_numpy() + (joined != "").to_numpy()
+            values = ";".join(non_empty).split(";") if len(non_empty) > 0 else []
+        else:
+            return cls.from_lists(column.tolist(), dtype)
+        return cls(
+            values=np.asarray(values, dtype=dtype),
+            offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+        )
+
+    @classmethod
+    def from_lists(cls, rows: list[list[Any] | np.ndarray], dtype: type = int) -> "RaggedArray":
+        lengths = [len(row) for row in rows]
+        return cls(
+            values=(
+                np.concatenate([np.asarray(row, dtype=dtype) for row in rows]) if len(rows) > 0
+                else np.array([], dtype=dtype)
+            ),
+            offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+        )
+
+    @classmethod
+    def concat(cls, arrays: list["RaggedArray"]) -> "RaggedArray":
+        shifts = np.cumsum([0] + [len(array.values) for array in arrays[:-1]])
+        return cls(
+            values=np.concatenate([array.values for array in arrays]),
+            offsets=np.concatenate(
+                [[0]] + [array.offsets[1:] + shift for array, shift in zip(arrays, shifts)]
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def take(self, rows: np.ndarray) -> "RaggedArray":
+        """Select rows of the array."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths[rows]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        values_idx = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - self.offsets[rows], lengths)
+        return RaggedArray(values=self.values[values_idx], offsets=offsets)
+
+    def tolist(self) -> list[list[Any]]:
+        values = self.values.tolist()
+        offsets = self.offsets.tolist()
+        return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def get_ranking_ref(ranking_name: str) -> str:
+    """Get a reference to the ranking to store in results instead of ids of seeds."""
+    return f"{RANKING_REF_PREFIX}{ranking_name}"
+
+
+@lru_cache(maxsize=32)
+def load_ranking_ids(ranking_name: str, rankings_dir: Path) -> list[str]:
+    """Load ids of actors from the ranking saved in the directory or in its zip archive."""
+    ranking_file = f"{ranking_name}.json"
+    if (rankings_dir / ranking_file).exists():
+        with open(rankings_dir / ranking_file, "r") as f:
+            ranking = json.load(f)
+    else:
+        with zipfile.ZipFile(rankings_dir.with_suffix(".zip")) as zf:
+            with zf.open(ranking_file) as f:
+                ranking = json.load(f)
+    return [str(actor["actor_id"]) for actor in ranking]
+
+
+def expand_seed_ids(seed_ids: list[str], seed_nb: int, rankings_dir: Path) -> list[str]:
+    """If seed ids are given as a reference to the ranking, obtain them from its top."""
+    if len(seed_ids) != 1 or not seed_ids[0].startswith(RANKING_REF_PREFIX):
+        return seed_ids
+    ranking_ids = load_ranking_ids(seed_ids[0][len(RANKING_REF_PREFIX):], rankings_dir)
+    return sorted(ranking_ids[:seed_nb])
+
+
+def read_results(results_path: Path | str, raw_columns: tuple[str, ...] = ()) -> pd.DataFrame:
+    """
+    Read results from CSV or Parquet file; `seed_ids` and `expositions_rec` become lists.
+
+    Seed ids stored as references to rankings are expanded with rankings saved next to results.
+
+    :param results_path: path to the file with results
+    :param raw_columns: list columns to leave as read from the file (i.e. joined strings for CSV,
+        arrays for Parquet), e.g. to parse them later to `RaggedArray` all at once
+    """
+    if Path(results_path).suffix == ".parquet":
+        results_df = pd.read_parquet(results_path)
+        for col_name, col_type in LIST_COLUMNS.items():
+            if col_name not in raw_columns:
+                results_df[col_name] = results_df[col_name].map(lambda x: [col_type(v) for v in x])
+    else:
+        results_df = pd.read_csv(results_path, dtype={col_name: str for col_name in LIST_COLUMNS})
+        results_df = split_joined_lists(results_df, raw_columns)
+    rankings_dir = Path(results_path).parent / RANKINGS_DIR
+    results_df["seed_ids"] = [
+        expand_seed_ids(seed_ids, seed_nb, rankings_dir)
+        for seed_ids, seed_nb in zip(results_df["seed_ids"], results_df["seed_nb"])
+    ]
+    return results_df
+
+
+def read_results_chunks(
+    results_path: Path | str, chunk_size: int, columns: list[str] | None = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Read results from CSV or Parquet file in chunks of rows, so that memory doesn't grow with the
+    file; list columns are left as read from the file and seed ids are not expanded.
+
+    :param results_path: path to the file with results
+    :param chunk_size: max. nb. of rows of a chunk
+    :param columns: columns to read (all if not given)
+    """
+    if Path(results_path).suffix == ".parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(results_path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    with pd.read_csv(
+        results_path,
+        usecols=columns,
+        dtype={col_name: str for col_name in LIST_COLUMNS},
+        chunksize=chunk_size,
+    ) as reader:
+        yield from reader
+
+
+def split_joined_lists(
+    results_df: pd.DataFrame, raw_columns: tuple[str, ...] = ()
+) -> pd.DataFrame:
+    """Convert list columns aggregated into strings (sep. by ;) to lists, except `raw_columns`."""
+    for col_name, col_type in LIST_COLUMNS.items():
+        if col_name not in raw_columns:
+            results_df[col_name] = RaggedArray.from_column(results_df[col_name], col_type).tolist()
+    return results_df
+
+
+def merge_moments(
+    nb_a: int, mean_a: Any, m2_a: Any, nb_b: int, mean_b: Any, m2_b: Any
+) -> tuple[int, Any, Any]:
+    """
+    Merge counts, means and sums of squared deviations from means of two samples (Chan et al.).
+
+    Means and sums of squared deviations can be floats or arrays (then they're merged elementwise).
+    """
+    nb = nb_a + nb_b
+    if nb_a == 0 or nb_b == 0:
+        return (nb, mean_a, m2_a) if nb_b == 0 else (nb, mean_b, m2_b)
+    delta = mean_b - mean_a
+    return nb, mean_a + delta * nb_b / nb, m2_a + m2_b + delta ** 2 * nb_a * nb_b / nb
+
+
+@dataclass(frozen=True)
+class CaseAggregates:
+    """
+    Mergeable aggregates of metrics of runs of the case.
+
+    Gains, areas, and curves of expositions are summarised with Welford-style accumulators, i.e.
+    means and sums of squared deviations from them. Curves are aggregated as if records of
+    expositions were padded with zeros to the longest one, thus, extending a curve with zeros keeps
+    it valid for already aggregated runs.
+    """
+
+    runs_nb: int
+    actors_sum: float
+    gain_mean: float
+    gain_m2: float
+    area_nb: int  # nb. of runs with the area defined
+    area_mean: float
+    area_m2: float
+    curve_mean: np.ndarray
+    curve_m2: np.ndarray
+
+    @classmethod
+    def from_results(cls, results: list[SimulationFullResult]) -> "CaseAggregates":
+        gains = np.array([result.gain for result in results], dtype=float)
+        areas = np.array([np.nan if r.area is None else r.area for r in results], dtype=float)
+        areas = areas[~np.isnan(areas)]
+        expositions = RaggedArray.from_column(pd.Series([r.expositions_rec for r in results]))
+        lengths = expositions.lengths
+        rows = np.repeat(np.arange(len(results)), lengths)
+        steps = np.arange(len(expositions.values)) - np.repeat(expositions.offsets[:-1], lengths)
+        padded = np.zeros([len(results), lengths.max(initial=0)])
+        padded[rows, steps] = expositions.values
+        return cls(
+            runs_nb=len(results),
+            actors_sum=float(sum(r.exposed_nb + r.unexposed_nb for r in results)),
+            gain_mean=gains.mean().item(),
+            gain_m2=((gains - gains.mean()) ** 2).sum().item(),
+            area_nb=len(areas),
+            area_mean=areas.mean().item() if len(areas) > 0 else 0.,
+            area_m2=((areas - areas.mean()) ** 2).sum().item() if len(areas) > 0 else 0.,
+            curve_mean=padded.mean(axis=0),
+            curve_m2=((padded - padded.mean(axis=0)) ** 2).sum(axis=0),
+        )
+
+    def __add__(self, other: "CaseAggregates") -> "CaseAggregates":
+        steps_nb = max(len(self.curve_mean), len(other.curve_mean))
+
+        def pad(curve: np.ndarray) -> np.ndarray:
+            return np.pad(curve, (0, steps_nb - len(curve)))
+
+        runs_nb, gain_mean, gain_m2 = merge_moments(
+            self.runs_nb, self.gain_mean, self.gain_m2,
+            other.runs_nb, other.gain_mean, other.gain_m2,
+        )
+        area_nb, area_mean, area_m2 = merge_moments(
+            self.area_nb, self.area_mean, self.area_m2,
+            other.area_nb, other.area_mean, other.area_m2,
+        )
+        _, curve_mean, curve_m2 = merge_moments(
+            self.runs_nb, pad(self.curve_mean), pad(self.curve_m2),
+            other.runs_nb, pad(other.curve_mean), pad(other.curve_m2),
+        )
+        return CaseAggregates(
+            runs_nb=runs_nb,
+            actors_sum=self.actors_sum + other.actors_sum,
+            gain_mean=gain_mean,
+            gain_m2=gain_m2,
+            area_nb=area_nb,
+            area_mean=area_mean,
+            area_m2=area_m2,
+            curve_mean=curve_mean,
+            curve_m2=curve_m2,
+        )
+
+    @staticmethod
+    def _mean_std(nb: int, mean: float, m2: float) -> tuple[float, float]:
+        """Get mean and sample std (as `pd.Series.mean` and `pd.Series.std`)."""
+        if nb == 0:
+            return np.nan, np.nan
+        return mean, np.sqrt(m2 / (nb - 1)) if nb > 1 else np.nan
+
+    def get_metrics(self) -> dict[str, float]:
+        gain_avg, gain_std = self._mean_std(self.runs_nb, self.gain_mean, self.gain_m2)
+        area_avg, area_std = self._mean_std(self.area_nb, self.area_mean, self.area_m2)
+        return {
+            "gain_avg": gain_avg, "gain_std": gain_std, "area_avg": area_avg, "area_std": area_std
+        }
+
+    def get_expositions_rec(self) -> dict[str, Any]:
+        """Get mean expositions as `ResultsSlicer.mean_expositions_rec`."""
+        return {
+            "actors_nb": self.actors_sum / self.runs_nb,
+            "avg": self.curve_mean.round(3),
+            "std": np.sqrt(self.curve_m2 / self.runs_nb).round(3),
+            "cdf": np.cumsum(self.curve_mean).round(3),
+        }
+
+
+def update_summary(
+    summary: dict[tuple[Any, ...], CaseAggregates], results: list[SimulationFullResult]
+) -> None:
+    """Add results to aggregates of cases they belong to (cases are keyed by `SUMMARY_KEYS`)."""
+    cases_results = {}
+    for result in results:
+        case = tuple(getattr(result, key) for key in SUMMARY_KEYS)
+        cases_results.setdefault(case, []).append(result)
+    for case, case_results in cases_results.items():
+        case_aggregates = CaseAggregates.from_results(case_results)
+        summary[case] = summary[case] + case_aggregates if case in summary else case_aggregates
+
+
+def save_summary(summary: dict[tuple[Any, ...], CaseAggregates], out_path: Path) -> None:
+    """Save aggregates of cases to CSV; curves are aggregated into strings (sep. by ;)."""
+    pd.DataFrame(
+        [
+            {
+                **dict(zip(SUMMARY_KEYS, case)),
+                **{
+                    field.name: (
+                        ";".join(map(repr, getattr(case_aggregates, field.name).tolist()))
+                        if field.name in {"curve_mean", "curve_m2"}
+                        else getattr(case_aggregates, field.name)
+                    )
+                    for field in fields(CaseAggregates)
+                },
+            }
+            for case, case_aggregates in summary.items()
+        ]
+    ).to_csv(out_path, index=False)
+
+
+def read_summary(summary_path: Path | str) -> dict[tuple[Any, ...], CaseAggregates]:
+    """Read aggregates of cases saved with `save_summary`."""
+    summary_df = pd.read_csv(summary_path, dtype={"curve_mean": str, "curve_m2": str})
+    for col_name in ["curve_mean", "curve_m2"]:
+        curves = RaggedArray.from_column(summary_df[col_name], float)
+        summary_df[col_name] = [
+            curves.values[start:end] for start, end in zip(curves.offsets[:-1], curves.offsets[1:])
+        ]
+    return {
+        tuple(record[key] for key in SUMMARY_KEYS): CaseAggregates(
+            **{field.name: record[field.name] for field in fields(CaseAggregates)}
+        )
+        for record in summary_df.to_dict("records")
+    }
+
+
+def merge_summaries(
+    summaries: list[dict[tuple[Any, ...], CaseAggregates]]
+) -> dict[tuple[Any, ...], CaseAggregates]:
+    """Merge aggregates of cases, e.g. computed by many workers."""
+    merged = {}
+    for summary in summaries:
+        for case, case_aggregates in summary.items():
+            merged[case] = merged[case] + case_aggregates if case in merged else case_aggregates
+    return merged
+
+
 def zip_detailed_logs(logged_dirs: list[Path], rm_logged_dirs: bool = True) -> None:
     if len(logged_dirs) == 0:
         print("No directories provided to create archive from.")
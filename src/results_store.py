@@ -0,0 +1,156 @@
+"""A store of simulation results in SQLite database with indexed lookup of cases."""
+
+import sqlite3
+from dataclasses import asdict, fields
+from pathlib import Path
+from types import NoneType, UnionType
+from typing import Any, get_args, get_type_hints
+
+import pandas as pd
+
+from src.result_handler import (
+    LIST_COLUMNS,
+    SimulationFullResult,
+    expand_seed_ids,
+    read_results,
+    split_joined_lists,
+)
+
+
+TABLE_NAME = "results"
+INDEX_COLUMNS = (
+    "protocol",
+    "probab",
+    "seed_budget",
+    "ss_method",
+    "network_type",
+    "network_name",
+    "repetition",
+)
+
+
+def get_sql_columns(record_type: type) -> dict[str, str]:
+    """Map fields of the dataclass of results to types of SQLite columns."""
+    sql_types = {str: "TEXT", int: "INTEGER", float: "REAL", bool: "INTEGER"}
+    type_hints = get_type_hints(record_type)
+    sql_columns = {}
+    for field in fields(record_type):
+        field_type = type_hints[field.name]
+        if isinstance(field_type, UnionType):
+            field_type = [t for t in get_args(field_type) if t is not NoneType][0]
+        sql_columns[field.name] = sql_types[field_type]
+    return sql_columns
+
+
+class ResultsStore:
+    """
+    Results of simulations stored in SQLite database.
+
+    Rows are indexed by parameters of the case and its repetition, so that slices of results are
+    read without loading the whole database. The database works in WAL mode, hence many writers
+    (e.g. simulations of different series) can append to it concurrently with readers.
+    """
+
+    def __init__(self, db_path: Path | str, timeout: float = 60.) -> None:
+        """
+        Open the store (the database is created if it doesn't exist).
+
+        :param db_path: path to the database file
+        :param timeout: seconds to wait for a lock held by another writer
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self.columns = {
+            **get_sql_columns(SimulationFullResult),
+            "repetition": "TEXT",
+            "version": "TEXT",
+            "rankings_dir": "TEXT",  # where to look for rankings if seeds are stored as refs.
+        }
+        self.connection = sqlite3.connect(self.db_path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} "
+                f"({', '.join(f'{name} {sql_type}' for name, sql_type in self.columns.items())})"
+            )
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_case_idx "
+                f"ON {TABLE_NAME} ({', '.join(INDEX_COLUMNS)})"
+            )
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(
+        self,
+        results: list[SimulationFullResult],
+        version: str,
+        rankings_dir: Path | None = None,
+    ) -> None:
+        """
+        Append results of the repetition to the store in a single transaction.
+
+        :param results: results to write
+        :param version: version of the repetition as in names of result files (e.g. `1959_1`), its
+            last part is stored as the repetition
+        :param rankings_dir: a directory with rankings which seed ids can refer to
+        """
+        repetition = version.split("_")[-1]
+        rankings_dir = None if rankings_dir is None else str(rankings_dir)
+        rows = [
+            (*asdict(result).values(), repetition, version, rankings_dir) for result in results
+        ]
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO {TABLE_NAME} ({', '.join(self.columns)}) "
+                f"VALUES ({', '.join(['?'] * len(self.columns))})",
+                rows,
+            )
+
+    def import_results(self, results_path: Path | str) -> None:
+        """Import results saved in a file by the simulator (e.g. from the archive of series)."""
+        results_df = read_results(results_path)
+        for col_name in LIST_COLUMNS:
+            results_df[col_name] = results_df[col_name].map(lambda x: ";".join(map(str, x)))
+        self.write(
+            results=[
+                SimulationFullResult(**record)
+                for record in results_df[list(get_sql_columns(SimulationFullResult))].to_dict(
+                    "records"
+                )
+            ],
+            version=Path(results_path).stem.split("--ver-")[-1],
+        )
+
+    def select(self, where: str = "", params: tuple[Any, ...] = ()) -> pd.DataFrame:
+        """
+        Read results matching the condition; as in `read_results` list columns become lists.
+
+        :param where: SQL condition (without `WHERE`) with `?` placeholders
+        :param params: values of the placeholders
+        """
+        query = f"SELECT * FROM {TABLE_NAME}" + (f" WHERE {where}" if where else "")
+        query += " ORDER BY rowid"  # i.e. in order of writing, as when results are loaded
+        results_df = split_joined_lists(pd.read_sql_query(query, self.connection, params=params))
+        results_df["seed_ids"] = [
+            seed_ids if rankings_dir is None
+            else expand_seed_ids(seed_ids, seed_nb, Path(rankings_dir))
+            for seed_ids, seed_nb, rankings_dir in zip(
+                results_df["seed_ids"], results_df["seed_nb"], results_df["rankings_dir"]
+            )
+        ]
+        return results_df.drop(columns=["version", "rankings_dir"])
+
+    def get_distinct(self, columns: list[str]) -> list[tuple[Any, ...]]:
+        """Get distinct combinations of values of the columns."""
+        cursor = self.connection.execute(
+            f"SELECT DISTINCT {', '.join(columns)} FROM {TABLE_NAME}"
+        )
+        return cursor.fetchall()
+
+    def close(self) -> None:
+        self.connection.close()
@@ -1 +1 @@
-"""A module with code to execute simulations of MLTM spreading on networks."""
+"""A module with code to execute simulations of MICM and MLTM spreading on networks."""
@@ -0,0 +1,108 @@
+"""Step handler which repeats simulations of the case until its metrics are estimated precisely."""
+
+from dataclasses import dataclass
+from math import inf, sqrt
+from statistics import NormalDist, stdev
+from typing import Any
+
+import network_diffusion as nd
+
+from src.params_handler import Network
+from src.result_handler import SimulationFullResult, SimulationRealisationsRecord
+from src.simulator import ranking_runner
+from src.simulator.engine import SimulationEngine
+
+
+@dataclass(frozen=True)
+class StoppingCriterion:
+    batch_size: int  # nb. of realisations run between consecutive checks of the criterion
+    max_realisations: int  # maximal nb. of realisations of a single case
+    gain_ci: float  # target half-width of the confidence interval of gain
+    area_ci: float  # target half-width of the confidence interval of area
+    confidence: float = 0.95  # confidence level of the intervals
+
+    def __post_init__(self) -> None:
+        assert self.batch_size > 0, f"incorrect batch size: {self.batch_size}!"
+        assert self.max_realisations >= 2, f"incorrect cap: {self.max_realisations}!"
+        assert 0 < self.confidence < 1, f"incorrect confidence level: {self.confidence}!"
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any] | None) -> "StoppingCriterion | None":
+        """Create the criterion from `simulator.adaptive` section of the config (if provided)."""
+        if not config:
+            return None
+        return cls(**config)
+
+    def is_met(self, gain_ci: float, area_ci: float) -> bool:
+        return gain_ci <= self.gain_ci and area_ci <= self.area_ci
+
+
+def ci_half_width(values: list[float], confidence: float) -> float:
+    """Compute half-width of the normal approximation of a confidence interval of the mean."""
+    if len(values) < 2:
+        return inf
+    z_score = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return z_score * stdev(values) / sqrt(len(values))
+
+
+def handle_step(
+    proto: str,
+    p: float,
+    budget: tuple[float, float],
+    ss_method: str,
+    net: Network,
+    ranking: list[nd.MLNetworkActor],
+    max_epochs_num: int,
+    criterion: StoppingCriterion,
+    engine: SimulationEngine | None = None,
+    ranking_ref: str | None = None,
+) -> tuple[list[SimulationFullResult], SimulationRealisationsRecord]:
+    """
+    Simulate the case in batches of realisations until confidence intervals are narrow enough.
+
+    After each batch half-widths of confidence intervals of mean gain and area are computed. The
+    case is finished when both of them fall below targets or when the cap of realisations is
+    reached. Realisations that didn't produce the area (too short simulations) are not used to
+    compute its interval.
+
+    :return: results of all realisations and a record summarising the stopping of the case
+    """
+    engine = SimulationEngine() if engine is None else engine
+    case_results = []
+    gain_ci, area_ci = inf, inf
+    while len(case_results) < criterion.max_realisations:
+        batch_size = min(criterion.batch_size, criterion.max_realisations - len(case_results))
+        for _ in range(batch_size):
+            case_results.extend(
+                ranking_runner.handle_step(
+                    proto=proto,
+                    p=p,
+                    budget=budget,
+                    ss_method=ss_method,
+                    net=net,
+                    ranking=ranking,
+                    max_epochs_num=max_epochs_num,
+                    engine=engine,
+                    ranking_ref=ranking_ref,
+                )
+            )
+        gain_ci = ci_half_width([cr.gain for cr in case_results], criterion.confidence)
+        area_ci = ci_half_width(
+            [cr.area for cr in case_results if cr.area is not None], criterion.confidence
+        )
+        if criterion.is_met(gain_ci=gain_ci, area_ci=area_ci):
+            break
+
+    case_record = SimulationRealisationsRecord(
+        network_type=net.n_type,
+        network_name=net.n_name,
+        ss_method=ss_method,
+        seed_budget=budget[1],
+        protocol=proto,
+        probab=p,
+        realisations_nb=len(case_results),
+        gain_ci=gain_ci,
+        area_ci=area_ci,
+        converged=criterion.is_met(gain_ci=gain_ci, area_ci=area_ci),
+    )
+    return case_results, case_record
@@ -0,0 +1,159 @@
+"""Optional features of the engine which simulates spreading."""
+
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable
+
+import network_diffusion as nd
+import torch
+
+from src.simulator.torch_compact import CompactNetwork, TorchMICModelCompact
+from src.simulator.torch_micm import TorchMICModel, TorchMultilayerModel
+from src.simulator.torch_micm_compiled import TorchMICModelCompiled
+from src.simulator.torch_micm_dense import TorchMICModelDense, get_density, to_dense_adjacency
+from src.simulator.torch_mltm import TorchMLTModel
+from src.simulator.torch_pruning import ReachabilityPruner
+from src.simulator.torch_rng import RandomChunks, get_case_seed
+
+
+class ConvertedNetsCache:
+    """
+    Cache of the most recently used networks converted to another form.
+
+    Entries are keyed by ids of networks which aren't referenced by the cache, so that they can be
+    freed, and are dropped as soon as it happens (then their ids can be reused).
+    """
+
+    def __init__(self) -> None:
+        """Create the object."""
+        self._converted: OrderedDict[int, tuple[Any, weakref.finalize]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._converted)
+
+    def get(
+        self,
+        net: nd.MultilayerNetworkTorch,
+        convert: Callable[[nd.MultilayerNetworkTorch], Any],
+        max_size: int,
+    ) -> Any:
+        """
+        Get the network in another form; convert it only for a net seen for the first time.
+
+        :param net: a network to convert
+        :param convert: a function converting the network
+        :param max_size: a number of converted networks stored for reuse
+        :return: the converted network
+        """
+        net_key = id(net)
+        if net_key not in self._converted:
+            self._converted[net_key] = (
+                convert(net), weakref.finalize(net, self._converted.pop, net_key, None)
+            )
+            if len(self._converted) > max_size:
+                _, (_, finalizer) = self._converted.popitem(last=False)
+                finalizer.detach()
+        self._converted.move_to_end(net_key)
+        return self._converted[net_key][0]
+
+
+@dataclass(frozen=True)
+class SimulationEngine:
+    model: str = "micm"  # spreading model: "micm" or "mltm" (then probabs are thresholds)
+    pruner: ReachabilityPruner | None = None  # if given, nets are pruned to seeds' components
+    compile_step: bool = False  # whether to use the compiled simulation step
+    dense_threshold: float | None = None  # min. density of the net to simulate in its dense form
+    compact: bool = False  # whether to simulate on compact node-indexed networks
+    rng_chunk_realisations: int | None = None  # if given, random numbers are drawn in chunks
+    random_chunks: RandomChunks | None = None  # random numbers of currently simulated cases
+    max_cached_nets: int = 8  # nb. of converted networks (of each form) stored for reuse
+    _dense_adjacencies: ConvertedNetsCache = field(
+        default_factory=ConvertedNetsCache, repr=False, compare=False
+    )
+    _compact_nets: ConvertedNetsCache = field(
+        default_factory=ConvertedNetsCache, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        if self.model not in {"micm", "mltm"}:
+            raise ValueError(f"Unknown spreading model: {self.model}!")
+        if self.model == "mltm" and (
+            self.compact or self.compile_step or self.dense_threshold is not None
+        ):
+            raise ValueError("MLTM can't be combined with compact nets, compiled or dense steps!")
+        if self.compact and (self.compile_step or self.dense_threshold is not None):
+            raise ValueError("Compact networks can't be combined with compiled or dense steps!")
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> "SimulationEngine":
+        """Create the engine from `simulator` section of the config."""
+        return cls(
+            model=config.get("model", "micm"),
+            pruner=ReachabilityPruner() if config.get("prune_unreachable") else None,
+            compile_step=bool(config.get("compile_step", False)),
+            dense_threshold=config.get("dense_threshold"),
+            compact=bool(config.get("compact_networks", False)),
+            rng_chunk_realisations=config.get("rng_chunk_realisations"),
+        )
+
+    def for_stream(self, stream_name: str) -> "SimulationEngine":
+        """
+        Get the engine to simulate cases which share a stream of random numbers.
+
+        If random numbers are drawn in chunks, the engine gets a dedicated generator seeded with
+        a value derived from the stream's name (which should also contain the version of
+        experiments). Consecutive cases simulated with the returned engine consume the same chunks,
+        so that numbers left by one cascade are used by the next one. Otherwise, the engine itself
+        is returned.
+        """
+        if self.rng_chunk_realisations is None:
+            return self
+        return replace(
+            self,
+            random_chunks=RandomChunks(
+                seed=get_case_seed(stream_name), realisations=self.rng_chunk_realisations
+            ),
+        )
+
+    def get_dense_adjacency(self, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+        """Get dense adjacency tensor of the network."""
+        return self._dense_adjacencies.get(net, to_dense_adjacency, self.max_cached_nets)
+
+    def get_compact_network(self, net: nd.MultilayerNetworkTorch) -> CompactNetwork:
+        """Get compact node-indexed representation of the network."""
+        return self._compact_nets.get(net, CompactNetwork.from_net, self.max_cached_nets)
+
+    def get_model(
+        self, protocol: str, p: float, net: nd.MultilayerNetworkTorch
+    ) -> TorchMultilayerModel:
+        """
+        Initialise the spreading model to simulate in the given network.
+
+        For MLTM, `p` is used as the threshold. For MICM, the dense model is used if the network is
+        denser than `dense_threshold`. Otherwise, the compact, the compiled, or the eager sparse
+        model is used. MICM models draw random numbers from chunks of the current stream if they
+        are assigned to the engine (MLTM is deterministic).
+        """
+        if self.model == "mltm":
+            return TorchMLTModel(protocol=protocol, threshold=p)
+        if self.dense_threshold is not None and get_density(net) > self.dense_threshold:
+            model = TorchMICModelDense(
+                protocol=protocol, probability=p, adjacency=self.get_dense_adjacency(net)
+            )
+        elif self.compact:
+            model = TorchMICModelCompact(protocol=protocol, probability=p)
+        elif self.compile_step:
+            model = TorchMICModelCompiled(protocol=protocol, probability=p)
+        else:
+            model = TorchMICModel(protocol=protocol, probability=p)
+        model.random_chunks = self.random_chunks
+        return model
+
+    def prune(
+        self, net: nd.MultilayerNetworkTorch, seed_set: set[Any]
+    ) -> nd.MultilayerNetworkTorch:
+        """Get a network to simulate in; it's compacted to seeds' components if requested."""
+        if self.pruner is None:
+            return net
+        return self.pruner.prune(net, seed_set)
@@ -4,7 +4,8 @@ import network_diffusion as nd
 
 from src.params_handler import Network
 from src.result_handler import SimulationFullResult
-from src.simulator.simulation_step import experiment_step
+from src.simulator.engine import SimulationEngine
+from src.simulator.simulation_step import experiment_step, packed_experiment_step
 
 
 def handle_step(
@@ -15,6 +16,8 @@ def handle_step(
     net: Network,
     ranking: list[nd.MLNetworkActor],
     max_epochs_num: int,
+    engine: SimulationEngine | None = None,
+    ranking_ref: str | None = None,
 ) -> list[SimulationFullResult]:
     """The easiest way to handle case basing only on the ranking."""
     step_spr = experiment_step(
@@ -24,6 +27,8 @@ def handle_step(
         net=net,
         ranking=ranking,
         max_epochs_num=max_epochs_num,
+        engine=engine,
+        ranking_ref=ranking_ref,
     )
     step_sfr = SimulationFullResult.enhance_SPR(
         SPR=step_spr,
@@ -35,3 +40,39 @@ def handle_step(
         ss_method=ss_method,
     )
     return [step_sfr]
+
+
+def handle_packed_step(
+    proto: str,
+    p: float,
+    cases: list[tuple[tuple[float, float], str, Network]],
+    rankings: dict[tuple[str, str], list[nd.MLNetworkActor]],
+    max_epochs_num: int,
+    engine: SimulationEngine | None = None,
+    ranking_refs: dict[tuple[str, str], str] | None = None,
+) -> list[SimulationFullResult]:
+    """Handle many cases sharing the spreading model by simulating them in one packed network."""
+    steps_spr = packed_experiment_step(
+        protocol=proto,
+        p=p,
+        budgets=[budget for budget, _, _ in cases],
+        nets=[net for _, _, net in cases],
+        rankings=[rankings[(net.rich_name, ss_method)] for _, ss_method, net in cases],
+        max_epochs_num=max_epochs_num,
+        engine=engine,
+        ranking_refs=None if ranking_refs is None else [
+            ranking_refs[(net.rich_name, ss_method)] for _, ss_method, net in cases
+        ],
+    )
+    return [
+        SimulationFullResult.enhance_SPR(
+            SPR=step_spr,
+            network_type=net.n_type,
+            network_name=net.n_name,
+            protocol=proto,
+            probab=p,
+            seed_budget=budget[1],
+            ss_method=ss_method,
+        )
+        for step_spr, (budget, ss_method, net) in zip(steps_spr, cases)
+    ]
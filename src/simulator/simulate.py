@@ -1,12 +1,245 @@
 """Main runner of the simulator."""
 
 import yaml
+from pathlib import Path
 from typing import Any
 
 from tqdm import tqdm
 
 from src import params_handler, result_handler, utils
-from src.simulator import ranking_runner
+from src.results_store import ResultsStore
+from src.simulator import adaptive_runner, ranking_runner
+from src.simulator.engine import SimulationEngine
+
+
+def get_packs(
+    p_space: list[tuple[str, tuple[float, float], float, tuple[str, str], str]],
+    nets: list[params_handler.Network],
+    max_actors: int,
+) -> list[tuple[str, float, list[tuple[int, tuple[float, float], str, params_handler.Network]]]]:
+    """
+    Group cases which share the spreading model into packs of networks to be simulated together.
+
+    Packs are filled in the order of the parameter space until the total number of actors exceeds
+    `max_actors`. A network bigger than that forms a pack on its own.
+
+    :return: list of packs as tuples: protocol, probability, and cases in a form of the index in
+        the parameter space, the seed budget, the seed selection method, and the network
+    """
+    nets_dict = {(net.n_type, net.n_name): net for net in nets}
+    model_groups = {}
+    for idx, (proto, budget, p, net_type_name, ss_method) in enumerate(p_space):
+        model_groups.setdefault((proto, p), []).append(
+            (idx, budget, ss_method, nets_dict[net_type_name])
+        )
+
+    packs = []
+    for (proto, p), cases in model_groups.items():
+        pack, pack_actors = [], 0
+        for case in cases:
+            case_actors = len(case[3].n_graph_pt.actors_map)
+            if len(pack) > 0 and pack_actors + case_actors > max_actors:
+                packs.append((proto, p, pack))
+                pack, pack_actors = [], 0
+            pack.append(case)
+            pack_actors += case_actors
+        packs.append((proto, p, pack))
+    return packs
+
+
+def save_step_results(
+    step_results: list[result_handler.SimulationFullResult],
+    results_writer: result_handler.ResultsWriter | None,
+    results_store: ResultsStore | None,
+    summary: dict[tuple[Any, ...], result_handler.CaseAggregates] | None,
+    version: str,
+    rankings_dir: Path,
+) -> None:
+    """Pass results of the step to outputs of the simulator which are enabled."""
+    if results_writer is not None:
+        results_writer.write(step_results)
+    if results_store is not None:
+        results_store.write(step_results, version=version, rankings_dir=rankings_dir)
+    if summary is not None:
+        result_handler.update_summary(summary, step_results)
+
+
+def run_packed_cases(
+    p_space: list[tuple[str, tuple[float, float], float, tuple[str, str], str]],
+    nets: list[params_handler.Network],
+    rankings: dict[tuple[str, str], list[Any]],
+    max_epochs_num: int,
+    max_actors: int,
+    desc_prefix: str,
+    engine: SimulationEngine | None = None,
+    version: str = "",
+    ranking_refs: dict[tuple[str, str], str] | None = None,
+) -> list[result_handler.SimulationFullResult]:
+    """Simulate all cases of the parameter space in packs and return results in its order."""
+    engine = SimulationEngine() if engine is None else engine
+    results = [None] * len(p_space)
+    packs_engine = engine.for_stream(f"packs--ver-{version}")
+    p_bar = tqdm(get_packs(p_space, nets, max_actors), desc="", leave=False, colour="green")
+    for proto, p, pack in p_bar:
+        p_bar.set_description_str(
+            f"{desc_prefix}--proto-{proto}--p-{round(p, 3)}--nets-{len(pack)}"
+        )
+        try:
+            pack_results = ranking_runner.handle_packed_step(
+                proto=proto,
+                p=p,
+                cases=[(budget, ss_method, net) for _, budget, ss_method, net in pack],
+                rankings=rankings,
+                max_epochs_num=max_epochs_num,
+                engine=packs_engine,
+                ranking_refs=ranking_refs,
+            )
+        except BaseException as e:
+            print("\nExperiment failed for a pack of cases:")
+            for _, budget, ss_method, net in pack:
+                base_name = utils.get_case_name_base(proto, p, budget[1], ss_method, net.rich_name)
+                print(f"\t{base_name}")
+            raise e
+        for (idx, _, _, _), case_result in zip(pack, pack_results):
+            results[idx] = case_result
+    return results
+
+
+def get_engine_and_criterion(
+    simulator_config: dict[str, Any]
+) -> tuple[SimulationEngine, adaptive_runner.StoppingCriterion | None]:
+    """Get the engine and the criterion of adaptive repetitions, checking if they fit packing."""
+    criterion = adaptive_runner.StoppingCriterion.from_config(simulator_config.get("adaptive"))
+    packing = simulator_config.get("packing")
+    if packing is not None and criterion is not None:
+        raise ValueError("Adaptive repetitions can't be combined with packing of networks!")
+    engine = SimulationEngine.from_config(simulator_config)
+    if packing is not None and engine.compact:
+        raise ValueError("Compact networks can't be combined with packing of networks!")
+    return engine, criterion
+
+
+def run_repetition(
+    config: dict[str, Any],
+    nets: list[params_handler.Network],
+    ssms: list[params_handler.SeedSelector],
+    p_space: list[tuple[str, tuple[float, float], float, tuple[str, str], str]],
+    rep: int,
+    ver: str,
+    rnk_dir: Path,
+    engine: SimulationEngine,
+    criterion: adaptive_runner.StoppingCriterion | None,
+    results_writer: result_handler.ResultsWriter | None,
+    results_store: ResultsStore | None,
+    summary: dict[tuple[Any, ...], result_handler.CaseAggregates] | None,
+) -> list[result_handler.SimulationRealisationsRecord]:
+    """
+    Compute rankings for networks and simulate cases of the parameter space in one repetition.
+
+    :return: records of realisations of cases if they're repeated adaptively (otherwise empty)
+    """
+    repetitions = config["simulator"]["repetitions"]
+    rep_records = []
+
+    # for each network ans ss method compute a ranking and save it
+    rankings = params_handler.compute_rankings(
+        seed_selectors=ssms,
+        networks=nets,
+        out_dir=rnk_dir,
+        version=ver,
+        ranking_path=config["io"].get("ranking_path"),
+    )
+    ranking_refs = {
+        (net_name, ss_name): result_handler.get_ranking_ref(
+            params_handler.get_ranking_name(ss_name, net_name, ver)
+        )
+        for net_name, ss_name in rankings
+    } if config["io"].get("compact_seed_ids", False) else None
+
+    # start simulations
+    packing = config["simulator"].get("packing")
+    if packing is not None:
+        packed_results = run_packed_cases(
+            p_space=p_space,
+            nets=nets,
+            rankings=rankings,
+            max_epochs_num=config["simulator"]["max_epochs_num"],
+            max_actors=packing["max_actors"],
+            desc_prefix=f"repet-{rep}/{repetitions}",
+            engine=engine,
+            version=ver,
+            ranking_refs=ranking_refs,
+        )
+        save_step_results(packed_results, results_writer, results_store, summary, ver, rnk_dir)
+    else:
+        # cases of the network share a stream of random numbers (if they're drawn in chunks)
+        nets_engines = {
+            net.rich_name: engine.for_stream(f"{net.rich_name}--ver-{ver}") for net in nets
+        }
+        p_bar = tqdm(p_space, desc="", leave=False, colour="green")
+        for idx, investigated_case in enumerate(p_bar):
+            proto, budget, p, net_type_name, ss_method = investigated_case
+            try:
+                net = [
+                    net for net in nets if 
+                    net.n_type == net_type_name[0] and net.n_name == net_type_name[1]
+                ][0]
+                p_bar.set_description_str(
+                    utils.get_case_name_rich(
+                        rep_idx=rep,
+                        reps_nb=repetitions,
+                        case_idx=idx,
+                        cases_nb=len(p_bar),
+                        protocol=proto,
+                        probab=p,
+                        budget=budget[1],
+                        net_name=net.rich_name,
+                        ss_name=ss_method,
+                    )
+                )
+                ranking_ref = (
+                    None if ranking_refs is None
+                    else ranking_refs[(net.rich_name, ss_method)]
+                )
+                if criterion is None:
+                    investigated_case_results = ranking_runner.handle_step(
+                        proto=proto, 
+                        p=p,
+                        budget=budget,
+                        ss_method=ss_method,
+                        net=net,
+                        ranking=rankings[(net.rich_name, ss_method)],
+                        max_epochs_num=config["simulator"]["max_epochs_num"],
+                        engine=nets_engines[net.rich_name],
+                        ranking_ref=ranking_ref,
+                    )
+                else:
+                    investigated_case_results, case_record = adaptive_runner.handle_step(
+                        proto=proto, 
+                        p=p,
+                        budget=budget,
+                        ss_method=ss_method,
+                        net=net,
+                        ranking=rankings[(net.rich_name, ss_method)],
+                        max_epochs_num=config["simulator"]["max_epochs_num"],
+                        criterion=criterion,
+                        engine=nets_engines[net.rich_name],
+                        ranking_ref=ranking_ref,
+                    )
+                    rep_records.append(case_record)
+                save_step_results(
+                    investigated_case_results,
+                    results_writer,
+                    results_store,
+                    summary,
+                    ver,
+                    rnk_dir,
+                )
+            except BaseException as e:
+                base_name = utils.get_case_name_base(proto, p, budget[1], ss_method, net.rich_name)
+                print(f"\nExperiment failed for case: {base_name}--ver-{ver}")
+                raise e
+    return rep_records
 
 
 def run_experiments(config: dict[str, Any]) -> None:
@@ -26,8 +259,8 @@ def run_experiments(config: dict[str, Any]) -> None:
     )
 
     # get parameters of the simulator
-    ranking_path = config["io"].get("ranking_path")
     repetitions = config["simulator"]["repetitions"]
+    engine, criterion = get_engine_and_criterion(config["simulator"])
     rng_seed = "_"if config["run"].get("rng_seed") is None else config["run"]["rng_seed"]
 
     # prepare output directories and determine how to store results
@@ -35,6 +268,14 @@ def run_experiments(config: dict[str, Any]) -> None:
     rnk_dir = out_dir / result_handler.RANKINGS_DIR
     rnk_dir.mkdir(exist_ok=True, parents=True)
     compress_to_zip = config["io"]["compress_to_zip"]
+    results_format = config["io"].get("results_format", "csv")
+    results_buffer = config["io"].get("results_buffer")
+    results_db = config["io"].get("results_db")
+    raw_results = config["io"].get("raw_results", True)
+    summary = {} if config["io"].get("summary", False) else None
+    if not raw_results and summary is None:
+        raise ValueError("Raw results can be omitted only if their summary is saved!")
+    results_store = None if results_db is None else ResultsStore(results_db)
 
     # save the config
     config["git_sha"] = utils.get_recent_git_sha()
@@ -48,57 +289,38 @@ def run_experiments(config: dict[str, Any]) -> None:
     # repeat main loop for given number of times
     for rep in range(1, repetitions + 1):
         print(f"\nRepetition {rep}/{repetitions}\n")
-        rep_results = []
         ver = f"{rng_seed}_{rep}"
+        results_writer = result_handler.ResultsWriter(
+            out_path=out_dir / f"results--ver-{ver}.csv",
+            results_format=results_format,
+            buffer_size=results_buffer,
+        ) if raw_results else None
 
-        # for each network ans ss method compute a ranking and save it
-        rankings = params_handler.compute_rankings(
-            seed_selectors=ssms,
-            networks=nets,
-            out_dir=rnk_dir,
-            version=ver,
-            ranking_path=ranking_path,
+        rep_records = run_repetition(
+            config=config,
+            nets=nets,
+            ssms=ssms,
+            p_space=p_space,
+            rep=rep,
+            ver=ver,
+            rnk_dir=rnk_dir,
+            engine=engine,
+            criterion=criterion,
+            results_writer=results_writer,
+            results_store=results_store,
+            summary=summary,
         )
 
-        # start simulations
-        p_bar = tqdm(p_space, desc="", leave=False, colour="green")
-        for idx, investigated_case in enumerate(p_bar):
-            proto, budget, p, net_type_name, ss_method = investigated_case
-            try:
-                net = [
-                    net for net in nets if 
-                    net.n_type == net_type_name[0] and net.n_name == net_type_name[1]
-                ][0]
-                p_bar.set_description_str(
-                    utils.get_case_name_rich(
-                        rep_idx=rep,
-                        reps_nb=repetitions,
-                        case_idx=idx,
-                        cases_nb=len(p_bar),
-                        protocol=proto,
-                        probab=p,
-                        budget=budget[1],
-                        net_name=net.rich_name,
-                        ss_name=ss_method,
-                    )
-                )
-                investigated_case_results = ranking_runner.handle_step(
-                    proto=proto, 
-                    p=p,
-                    budget=budget,
-                    ss_method=ss_method,
-                    net=net,
-                    ranking=rankings[(net.rich_name, ss_method)],
-                    max_epochs_num=config["simulator"]["max_epochs_num"],
-                )
-                rep_results.extend(investigated_case_results)
-            except BaseException as e:
-                base_name = utils.get_case_name_base(proto, p, budget[1], ss_method, net.rich_name)
-                print(f"\nExperiment failed for case: {base_name}--ver-{ver}")
-                raise e
-        
         # aggregate results for given repetition number and save them to a csv file
-        result_handler.save_results(rep_results, out_dir / f"results--ver-{ver}.csv")
+        if results_writer is not None:
+            results_writer.close()
+        if criterion is not None:
+            result_handler.save_results(rep_records, out_dir / f"realisations--ver-{ver}.csv")
+
+    if results_store is not None:
+        results_store.close()
+    if summary is not None:
+        result_handler.save_summary(summary, out_dir / result_handler.SUMMARY_FILE)
 
     # compress global logs and config
     if compress_to_zip:
@@ -1,32 +1,145 @@
 """A script with defined single simulation step."""
 
 import warnings
-from itertools import accumulate
+from typing import Any
 
 import network_diffusion as nd
 import numpy as np
 
 from src.params_handler import Network
-from src.result_handler import SimulationPartialResult
-from src.simulator.torch_micm import TorchMICModel, TorchMICSimulator
+from src.result_handler import RaggedArray, SimulationPartialResult
+from src.simulator.engine import SimulationEngine
+from src.simulator.torch_compact import TorchCompactMICSimulator
+from src.simulator.torch_micm import TorchMICSimulator
+from src.simulator.torch_packing import TorchPackedMICSimulator, pack_networks
+
+
+def compute_gains(
+    exposed_nb: np.ndarray, seeds_nb: np.ndarray, actors_nb: np.ndarray
+) -> np.ndarray:
+    """
+    Compute gains of many simulations at once to reflect relative spreading coverage.
+
+    :raises ZeroDivisionError: if in any simulation all actors are seeds (as for a single one)
+    """
+    max_available_gain = np.asarray(actors_nb) - np.asarray(seeds_nb)  # TODO: move to nd
+    if (max_available_gain == 0).any():
+        raise ZeroDivisionError("Gain is undefined if all actors are seeds!")
+    obtained_gain = np.asarray(exposed_nb) - np.asarray(seeds_nb)
+    return 100 * obtained_gain / max_available_gain
+
+
+def compute_areas(
+    expositions: RaggedArray, seeds_nb: np.ndarray, actors_nb: np.ndarray
+) -> np.ndarray:
+    """
+    Compute normalised AuCs from expositions records of many simulations at once.
+
+    Areas are computed as by `np.trapezoid`, but in one pass over records of all simulations. For
+    records shorter than two samples NaNs are returned.
+    """
+    lengths = expositions.lengths
+    starts = expositions.offsets[:-1]
+    rows = np.repeat(np.arange(len(expositions)), lengths)
+    steps = np.arange(len(expositions.values)) - np.repeat(starts, lengths)
+
+    # cumulated expositions scaled with seeds discarded, and steps spaced evenly within [0, 1]
+    cumsum = np.cumsum(expositions.values, dtype=np.int64)
+    cumsum = cumsum - np.repeat(np.concatenate([[0], cumsum])[starts], lengths)
+    seeds_nb = np.asarray(seeds_nb)[rows]
+    cumsum_scaled = (cumsum - seeds_nb) / (np.asarray(actors_nb)[rows] - seeds_nb)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cumsum_steps = steps * (1 / (lengths - 1))[rows]
+    cumsum_steps[expositions.offsets[1:][lengths > 0] - 1] = 1.
+
+    # sum trapezoids between consecutive samples of each record
+    is_left = steps < np.repeat(lengths - 1, lengths)
+    traps = (
+        (cumsum_steps[1:] - cumsum_steps[:-1])
+        * (cumsum_scaled[1:] + cumsum_scaled[:-1]) / 2.
+    )[is_left[:-1]]
+    areas = np.bincount(rows[is_left], weights=traps, minlength=len(expositions))
+    return np.where(lengths < 2, np.nan, areas)
 
 
 def compute_gain(exposed_nb: int, seeds_nb: int, actors_nb: int) -> float:
     """Compute gain from simulation to reflect relative spreading coverage."""
-    max_available_gain = actors_nb - seeds_nb  # TODO: move to nd
-    obtained_gain = exposed_nb - seeds_nb
-    return 100 * obtained_gain / max_available_gain
+    return compute_gains(exposed_nb, seeds_nb, actors_nb).item()
 
 
 def compute_area(expositions_rec: list[int], seeds_nb: int, actors_nb: int) -> float | None:
     """Compute normalised AuC from expositions record while seed set impact is discarded."""
-    cumsum = np.array(list(accumulate(expositions_rec)))  # TODO: move to nd
-    if len(cumsum) < 2:
+    if len(expositions_rec) < 2:
         warnings.warn("cumulated distribution must contain at least two samples.")
         return None
-    cumsum_scaled = (cumsum - seeds_nb) / (actors_nb - seeds_nb)
-    cumsum_steps = np.linspace(0, 1, len(cumsum_scaled))
-    return np.trapezoid(cumsum_scaled, cumsum_steps)
+    return compute_areas(
+        RaggedArray.from_lists([expositions_rec]), seeds_nb=[seeds_nb], actors_nb=[actors_nb]
+    ).item()
+
+
+def get_seed_set(ranking: list[nd.MLNetworkActor], budget: tuple[float, float]) -> set[Any]:
+    """Select ids of actors from the top of the ranking to fit the seed budget."""
+    seed_set_size = int(len(ranking) * budget[1] / 100)
+    return {actor.actor_id for actor in ranking[:seed_set_size]}
+
+
+def get_n_steps(net_pt: nd.MultilayerNetworkTorch, max_epochs_num: int) -> int:
+    """Get a limit of simulation steps; for a negative value, it is derived from the net's size."""
+    optimal_steps = len(net_pt.actors_map) * len(net_pt.layers_order)
+    return optimal_steps if max_epochs_num < 0 else int(max_epochs_num)
+
+
+def logs_to_spr(
+    logs: dict[str, Any],
+    seed_set: set[Any],
+    seed_set_size: int,
+    actors_nb: int,
+    ranking_ref: str | None = None,
+) -> SimulationPartialResult:
+    """
+    Compute metrics of the simulation from its logs and wrap them into the result.
+
+    If the simulation was run on a pruned network, actors that were not reachable from seeds are
+    counted as not exposed, so that the result refers to the full set of actors. If a reference to
+    the ranking is given, it's stored instead of ids of seeds (they're on the top of the ranking).
+    """
+    return logs_to_sprs([logs], [seed_set], [seed_set_size], [actors_nb], [ranking_ref])[0]
+
+
+def logs_to_sprs(
+    logs: list[dict[str, Any]],
+    seed_sets: list[set[Any]],
+    seed_set_sizes: list[int],
+    actors_nbs: list[int],
+    ranking_refs: list[str | None],
+) -> list[SimulationPartialResult]:
+    """Compute metrics of many simulations at once (see `logs_to_spr`) and wrap them in results."""
+    gains = compute_gains(
+        exposed_nb=[sim_logs["exposed"] for sim_logs in logs],
+        seeds_nb=seed_set_sizes,
+        actors_nb=actors_nbs,
+    )
+    expositions = RaggedArray.from_lists([sim_logs["expositions_rec"] for sim_logs in logs])
+    if (expositions.lengths < 2).any():
+        warnings.warn("cumulated distribution must contain at least two samples.")
+    areas = compute_areas(expositions=expositions, seeds_nb=seed_set_sizes, actors_nb=actors_nbs)
+    return [
+        SimulationPartialResult(
+            seed_ids=ranking_ref or ";".join(sorted([str(s) for s in seed_set])),
+            gain=gain,
+            area=None if np.isnan(area) else area,
+            simulation_length=sim_logs["simulation_length"],
+            seed_nb=len(seed_set),
+            exposed_nb=sim_logs["exposed"],
+            unexposed_nb=(
+                None if sim_logs["not_exposed"] is None else actors_nb - sim_logs["exposed"]
+            ),
+            expositions_rec=";".join([str(r) for r in sim_logs["expositions_rec"]]),
+        )
+        for sim_logs, seed_set, actors_nb, ranking_ref, gain, area in zip(
+            logs, seed_sets, actors_nbs, ranking_refs, gains.tolist(), areas.tolist()
+        )
+    ]
 
 
 def experiment_step(
@@ -36,6 +149,8 @@ def experiment_step(
     net: Network,
     ranking: list[nd.MLNetworkActor],
     max_epochs_num: int,
+    engine: SimulationEngine | None = None,
+    ranking_ref: str | None = None,
 ) -> SimulationPartialResult:
     """
     Basic esperimental step to simulate spreading single time under MICM for given parameters.
@@ -45,45 +160,106 @@ def experiment_step(
     :param budget: proportion of inactive to active actors at the beginning of simulation
     :param net: network to simulate spreading in
     :param ranking: ranking list to select seed set from
+    :param engine: optional features of the simulation engine (none by default)
+    :param ranking_ref: if given, it's stored in the result instead of ids of seeds
 
     :return: basic results from the experiment
     """
 
+    engine = SimulationEngine() if engine is None else engine
+
     # initialise spreading model and prepare data for simulation
-    micm = TorchMICModel(protocol=protocol, probability=p)
-    seed_set_size = int(len(ranking) * budget[1] / 100)
-    seed_set = {actor.actor_id for actor in ranking[:seed_set_size]}
+    seed_set = get_seed_set(ranking, budget)
     net_pt = net.n_graph_pt
-    optimal_steps = len(net_pt.actors_map) * len(net_pt.layers_order)
+    sim_net_pt = engine.prune(net_pt, seed_set)
+    micm = engine.get_model(protocol=protocol, p=p, net=sim_net_pt)
 
     # run experiment and obtain logs
-    experiment = TorchMICSimulator(
-        model=micm,
-        net=net_pt,
-        n_steps=optimal_steps if max_epochs_num < 0 else int(max_epochs_num),
-        seed_set=seed_set,
-        device=net_pt.device,
-        debug=True,
-    )
+    if engine.compact:
+        experiment = TorchCompactMICSimulator(
+            model=micm,
+            net=engine.get_compact_network(sim_net_pt),
+            n_steps=get_n_steps(net_pt, max_epochs_num),
+            seed_set=seed_set,
+            device=net_pt.device,
+            debug=True,
+        )
+    else:
+        experiment = TorchMICSimulator(
+            model=micm,
+            net=sim_net_pt,
+            n_steps=get_n_steps(net_pt, max_epochs_num),
+            seed_set=seed_set,
+            device=net_pt.device,
+            debug=True,
+        )
     logs = experiment.perform_propagation()
-    gain = compute_gain(
-        exposed_nb=logs["exposed"],
-        seeds_nb=seed_set_size,
-        actors_nb=len(net_pt.actors_map)
-    )
-    area = compute_area(
-        expositions_rec=logs["expositions_rec"],
-        seeds_nb=seed_set_size,
+    if engine.random_chunks is not None:
+        engine.random_chunks.record_cascade(logs["simulation_length"])
+    return logs_to_spr(
+        logs=logs,
+        seed_set=seed_set,
+        seed_set_size=int(len(ranking) * budget[1] / 100),
         actors_nb=len(net_pt.actors_map),
+        ranking_ref=ranking_ref,
+    )
+
+
+def packed_experiment_step(
+    protocol: str,
+    p: float,
+    budgets: list[tuple[float, float]],
+    nets: list[Network],
+    rankings: list[list[nd.MLNetworkActor]],
+    max_epochs_num: int,
+    engine: SimulationEngine | None = None,
+    ranking_refs: list[str] | None = None,
+) -> list[SimulationPartialResult]:
+    """
+    Simulate spreading under MICM in many networks at once by packing them into a single one.
+
+    Each network is a separate block of the block-diagonal adjacency tensor, hence, cascades in
+    the blocks are independent and equivalent to running `experiment_step` for each of them.
+
+    :param protocol: protocol function 
+    :param p: activation probability
+    :param budgets: seed budgets to select seed sets for consecutive networks
+    :param nets: networks to simulate spreading in
+    :param rankings: rankings to select seed sets from for consecutive networks
+    :param engine: optional features of the simulation engine (none by default)
+    :param ranking_refs: if given, they're stored in the results instead of ids of seeds
+
+    :return: basic results from the experiment ordered as provided networks
+    """
+
+    engine = SimulationEngine() if engine is None else engine
+
+    # initialise spreading model and prepare data for simulation
+    seed_sets = [get_seed_set(ranking, budget) for ranking, budget in zip(rankings, budgets)]
+    packed_net = pack_networks(
+        [engine.prune(net.n_graph_pt, seed_set) for net, seed_set in zip(nets, seed_sets)]
     )
+    micm = engine.get_model(protocol=protocol, p=p, net=packed_net.net)
 
-    return SimulationPartialResult(
-        seed_ids=";".join(sorted([str(s) for s in seed_set])),
-        gain=gain,
-        area=area,
-        simulation_length=logs["simulation_length"],
-        seed_nb=len(seed_set),
-        exposed_nb=logs["exposed"],
-        unexposed_nb=logs["not_exposed"],
-        expositions_rec=";".join([str(r) for r in logs["expositions_rec"]]),
+    # run experiment and obtain logs
+    experiment = TorchPackedMICSimulator(
+        model=micm,
+        packed_net=packed_net,
+        n_steps=[get_n_steps(net.n_graph_pt, max_epochs_num) for net in nets],
+        seed_sets=seed_sets,
+        device=packed_net.net.device,
+    )
+    blocks_logs = experiment.perform_propagation()
+    if engine.random_chunks is not None:
+        engine.random_chunks.record_cascade(
+            max([logs["simulation_length"] or 0 for logs in blocks_logs]) or None
+        )
+    return logs_to_sprs(
+        logs=blocks_logs,
+        seed_sets=seed_sets,
+        seed_set_sizes=[
+            int(len(ranking) * budget[1] / 100) for ranking, budget in zip(rankings, budgets)
+        ],
+        actors_nbs=[len(net.n_graph_pt.actors_map) for net in nets],
+        ranking_refs=ranking_refs or [None] * len(nets),
     )
@@ -0,0 +1,148 @@
+"""Compact node-indexed representation of networks and MICM operating on it."""
+
+from dataclasses import dataclass, replace
+from typing import Any
+
+import network_diffusion as nd
+import torch
+from bidict import bidict
+
+from src.simulator.torch_micm import ActorsPresence, TorchMICModel, TorchMICSimulator
+
+
+@dataclass(frozen=True)
+class CompactNetwork:
+    actors_map: bidict  # ids of actors mapped to their indices, as in the source network
+    nodes_actors: torch.Tensor  # indices of actors for consecutive existing nodes
+    edges_src: torch.Tensor  # indices of edges' sources among nodes
+    edges_dst: torch.Tensor  # indices of edges' targets among nodes
+    actors_layers_nb: torch.Tensor  # nb. of layers each actor exists in
+    actors_first_node: torch.Tensor  # index of the node of each actor in its first layer
+
+    @classmethod
+    def from_net(cls, net: nd.MultilayerNetworkTorch) -> "CompactNetwork":
+        """
+        Convert the network, so that only nodes present in layers are stored.
+
+        Nodes are ordered by layers and then by actors. Edges keep the order of values of the
+        adjacency tensor, hence random numbers drawn for them match those of `TorchMICModel`.
+        """
+        present = net.nodes_mask == 0
+        nodes_idcs = torch.full(present.shape, -1, dtype=torch.long, device=present.device)
+        nodes_idcs[present] = torch.arange(int(present.sum()), device=present.device)
+        _, nodes_actors = present.nonzero(as_tuple=True)
+        adj_indices = net.adjacency_tensor.indices()
+        edges_src = nodes_idcs[adj_indices[0], adj_indices[1]]
+        edges_dst = nodes_idcs[adj_indices[0], adj_indices[2]]
+        assert (edges_src >= 0).all() and (edges_dst >= 0).all(), "edges of absent nodes!"
+        presence = ActorsPresence.from_net(net)
+        actors_range = torch.arange(len(net.actors_map), device=present.device)
+        return cls(
+            actors_map=net.actors_map,
+            nodes_actors=nodes_actors,
+            edges_src=edges_src,
+            edges_dst=edges_dst,
+            actors_layers_nb=presence.layers_nb,
+            actors_first_node=nodes_idcs[presence.first_layer, actors_range],
+        )
+
+    @property
+    def device(self) -> torch.device:
+        return self.nodes_actors.device
+
+    def to(self, device: str | torch.device) -> "CompactNetwork":
+        """Get the network with tensors stored on the given device."""
+        return replace(
+            self,
+            nodes_actors=self.nodes_actors.to(device),
+            edges_src=self.edges_src.to(device),
+            edges_dst=self.edges_dst.to(device),
+            actors_layers_nb=self.actors_layers_nb.to(device),
+            actors_first_node=self.actors_first_node.to(device),
+        )
+
+
+class TorchMICModelCompact(TorchMICModel):
+    """
+    Multilayer Independent Cascade Model operating on a compact representation of the network.
+
+    States are stored as a vector over existing nodes, so no memory is spent on padding of actors
+    absent in layers. Random numbers are drawn in the same way as in the default model, hence both
+    of them produce the same results for the same state of the random numbers generator.
+    """
+
+    def __init__(self, protocol: str, probability: float) -> None:
+        """
+        Create the object.
+
+        :param protocol: logical operator that determines how to activate actor, see
+            `TorchMICModel` for details
+        :param probability: threshold parameter which activate actor
+        """
+        super().__init__(protocol=protocol, probability=probability)
+        self.and_protocol = protocol == "AND"
+
+    def simulation_step(self, net: CompactNetwork, S0: torch.Tensor) -> torch.Tensor:
+        """
+        Perform a single simulation step on the compact network.
+
+        :param net: a network which is a medium of the diffusion
+        :param S0: initial vector of nodes' states (0 - inactive, 1 - active, -1 - activated)
+        :return: updated vector with nodes' states
+        """
+        rand = self.draw_random(len(net.edges_src), net.device)
+        live_edges = (rand < self.probability) & (S0[net.edges_src] > 0) & (S0[net.edges_dst] == 0)
+        receivers = net.nodes_actors[net.edges_dst[live_edges].unique()]
+        actors, layers_nb = receivers.unique(return_counts=True)
+        if self.and_protocol:
+            actors = actors[layers_nb == net.actors_layers_nb[actors]]
+        S1_aggregated = torch.zeros(len(net.actors_map), device=net.device)
+        S1_aggregated[actors] = 1.
+        S0_decayed = self.decay_active_nodes(S0)
+        return S1_aggregated[net.nodes_actors] + S0_decayed
+
+
+class TorchCompactMICSimulator(TorchMICSimulator):
+    """Simulator for TorchMICModelCompact."""
+
+    def __init__(
+        self,
+        model: TorchMICModelCompact,
+        net: CompactNetwork,
+        n_steps: int,
+        seed_set: set[Any],
+        device: str | torch.device,
+        debug: bool = False
+    ) -> None:
+        """
+        Create the object.
+
+        :param model: a spreading model
+        :param net: a compact network to simulate in
+        :param n_steps: a limit of simulation steps
+        :param seed_set: a set of initially active actors
+        """
+        self.validate_device(device)
+        self.model = model
+        self.net = net.to(device)
+        self.n_steps = n_steps
+        self.seed_set = seed_set
+        self.debug = debug
+        self.device = device
+
+    def create_states_tensor(self, net: CompactNetwork, seed_set: set[Any]) -> torch.Tensor:
+        """
+        Create vector of nodes' states with 1. marked for nodes of seed actors.
+
+        :param net: a compact network to create the states vector for
+        :param seed_set: a set of initially active actors (ids of actors given in the original form)
+        """
+        seed_set_mapped = torch.tensor(
+            [net.actors_map[seed] for seed in seed_set], dtype=torch.long, device=net.device
+        )
+        return torch.isin(net.nodes_actors, seed_set_mapped).to(torch.float)
+
+    def S_nodes_to_actors(self, S: torch.Tensor) -> torch.Tensor:
+        """Convert vector of nodes' states to a vector of actors' states."""
+        S_actors = S[self.net.actors_first_node]
+        return torch.where(self.net.actors_layers_nb > 0, S_actors, torch.zeros_like(S_actors))
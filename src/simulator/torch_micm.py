@@ -1,68 +1,175 @@
 """`torch`-based Multilayer Independent Cascade Model."""
 
+from dataclasses import dataclass
 from typing import Any
 
 import torch
 import network_diffusion as nd
 
 
-class TorchMICModel:
-    """Multilayer Independent Cascade Model implemented in PyTorch."""
+@dataclass(frozen=True)
+class ActorsPresence:
+    """Precomputed membership of actors in layers of the network."""
+    layers_nb: torch.Tensor  # nb. of layers each actor exists in
+    first_layer: torch.Tensor  # index of the first layer each actor exists in
 
-    def __init__(self, protocol: str, probability: float) -> None:
+    @classmethod
+    def from_net(cls, net: nd.MultilayerNetworkTorch) -> "ActorsPresence":
+        present = net.nodes_mask == 0
+        return cls(
+            layers_nb=present.sum(dim=0),
+            first_layer=present.to(torch.int8).argmax(dim=0),
+        )
+
+
+def get_receivers(S_raw: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Get actors that obtained positive impulses and numbers of layers they obtained them in.
+
+    :param S_raw: raw impulses obtained by the nodes as a sparse or a dense tensor
+    :return: indices of actors and numbers of their nodes that obtained positive impulses
+    """
+    if S_raw.is_sparse:
+        S_raw = S_raw.coalesce()
+        actor_idcs = S_raw.indices()[1][S_raw.values() > 0]
+    else:
+        _, actor_idcs = (S_raw > 0).nonzero(as_tuple=True)
+    return actor_idcs.unique(return_counts=True)
+
+
+class TorchMultilayerModel:
+    """
+    Base of spreading models implemented in PyTorch which aggregate impulses from the layers.
+
+    Subclasses implement `simulation_step`, which takes and returns tensors of nodes' states (0 -
+    inactive, 1 - active, -1 - activated, -inf - node does not exist), so that they can be run by
+    `TorchMICSimulator`.
+    """
+
+    def __init__(self, protocol: str) -> None:
         """
         Create the object.
 
         :param protocol: logical operator that determines how to activate actor can be OR (then 
             actor gets activated if it gets positive input in one layer) or AND (then actor gets 
             activated if it gets positive input in all layers)
-        :param probability: threshold parameter which activate actor (a random variable must be 
-            smaller than this param to result in activation)
         """
-        assert 0 <= probability <= 1, f"incorrect probability: {probability}!"
-        self.probability = probability
         if protocol == "AND":
             self.protocol = self.protocol_AND
         elif protocol == "OR":
             self.protocol = self.protocol_OR
         else:
             raise ValueError("Only AND & OR value are allowed!")
+        self._presence = None
 
-    @staticmethod
-    def protocol_AND(S_raw: torch.Tensor, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+    def get_presence(self, net: nd.MultilayerNetworkTorch) -> ActorsPresence:
+        """Get presence of actors in layers; compute it only for a net seen for the first time."""
+        if self._presence is None or self._presence[0] is not net:
+            self._presence = (net, ActorsPresence.from_net(net))
+        return self._presence[1]
+
+    def protocol_AND(self, S_raw: torch.Tensor, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
         """
         Aggregate positive impulses from the layers using AND strategy.
 
-        :param S_raw: raw impulses obtained by the nodes
+        Only actors that obtained any impulse are evaluated - they get activated if numbers of
+        their nodes with impulses equal numbers of layers they exist in. Actors which don't exist
+        in any layer are marked as activated, as the condition holds for them vacuously (they have
+        no nodes whose states could change, though).
+
+        :param S_raw: raw impulses obtained by the nodes (a sparse or a dense tensor)
         :param net: a network which is a medium for the diffusion
         :return: a tensor shaped as [1 x number of actors] with 1. denoting activated actors in this
             simulation step and 0. denoting actors that weren't activated
         """
-        return (S_raw + net.nodes_mask > 0).all(dim=0).to(torch.float)
+        receivers, layers_nb = get_receivers(S_raw)
+        presence = self.get_presence(net)
+        S_aggregated = (presence.layers_nb == 0).to(torch.float).to(S_raw.device)
+        S_aggregated[receivers[layers_nb == presence.layers_nb[receivers]]] = 1.
+        return S_aggregated
 
-    @staticmethod
-    def protocol_OR(S_raw: torch.Tensor, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+    def protocol_OR(self, S_raw: torch.Tensor, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
         """
         Aggregate positive impulses from the layers using OR strategy.
 
-        :param S_raw: raw impulses obtained by the nodes
+        :param S_raw: raw impulses obtained by the nodes (a sparse or a dense tensor)
         :param net: a network which is a medium for the diffusion
         :return: a tensor shaped as [1 x number of actors] with 1. denoting activated actors in this
             simulation step and 0. denoting actors that weren't activated
         """
-        return (S_raw > 0).any(dim=0).to(torch.float)
+        receivers, _ = get_receivers(S_raw)
+        S_aggregated = torch.zeros(S_raw.shape[1], device=S_raw.device)
+        S_aggregated[receivers] = 1.
+        return S_aggregated
+
+    @staticmethod
+    def decay_active_nodes(S: torch.Tensor) -> torch.Tensor:
+        """
+        Change states of nodes that are active to become activated (aka removed) - (1 -> -1).
+
+        :param S: a tensor of nodes' states (0 - inactive, 1 - active, -1 - activated, -inf - node
+            does not exist).
+        """
+        decayed_S = -1. * torch.abs(S)
+        decayed_S[decayed_S == -0.] = 0.
+        return decayed_S
+
+    def simulation_step(self, net: nd.MultilayerNetworkTorch, S0: torch.Tensor) -> torch.Tensor:
+        """
+        Perform a single simulation step.
+
+        :param net: a network wtihch is a medium of the diffusion
+        :param S0: initial tensor of nodes' states
+        :return: updated tensor with nodes' states
+        """
+        raise NotImplementedError
+
+
+class TorchMICModel(TorchMultilayerModel):
+    """Multilayer Independent Cascade Model implemented in PyTorch."""
+
+    def __init__(self, protocol: str, probability: float) -> None:
+        """
+        Create the object.
+
+        :param protocol: logical operator that determines how to activate actor can be OR (then 
+            actor gets activated if it gets positive input in one layer) or AND (then actor gets 
+            activated if it gets positive input in all layers)
+        :param probability: threshold parameter which activate actor (a random variable must be 
+            smaller than this param to result in activation)
+        """
+        assert 0 <= probability <= 1, f"incorrect probability: {probability}!"
+        super().__init__(protocol=protocol)
+        self.probability = probability
+        self.random_chunks = None
+
+    def draw_random(self, size: int, device: str | torch.device) -> torch.Tensor:
+        """
+        Draw uniform random numbers from chunks (if assigned) or from the global generator.
+
+        :param size: number of random numbers to draw
+        :param device: device to store random numbers on
+        :return: a vector of random numbers from [0, 1) as `float64`
+        """
+        if self.random_chunks is None:
+            return torch.rand(size, dtype=torch.float64, device=device)
+        return self.random_chunks.draw(size, device)
 
     @staticmethod
-    def draw_live_edges(A: torch.Tensor, p: float) -> torch.Tensor:
+    def draw_live_edges(
+        A: torch.Tensor, p: float, raw_signals: torch.Tensor | None = None
+    ) -> torch.Tensor:
         """
         Draw eges which transmit the state (i.e. their random weight < p).
 
         :param A: adjacency matrix as a sparse tensor shaped as `[nb layers x nb nodes x nb nodes]`
         :param p: threshold parameter which activate actor (a random variable must be smaller than
             this param to result in activation)
+        :param raw_signals: random numbers for edges of A; if not given, they are drawn here
         :return: a filtered sparse adjacency matrix with edges that drawn numbers < p
         """
-        raw_signals = torch.rand_like(A.values(), dtype=float)
+        if raw_signals is None:
+            raw_signals = torch.rand_like(A.values(), dtype=float)
         thre_signals = (raw_signals < p).to(float)
         T = torch.sparse_coo_tensor(indices=A.indices(), values=thre_signals, size=A.shape)
         # assert A.shape == T.shape, f"{A.shape} != {T.shape}"
@@ -79,31 +186,29 @@ class TorchMICModel:
         """Create a dense mask for T which discards signals to nodes which state != 0."""
         return torch.abs(torch.abs(S) - 1)
 
-    def get_active_nodes(self, T: torch.Tensor, S: torch.Tensor) -> torch.Tensor:
+    def get_impulses(self, T: torch.Tensor, S: torch.Tensor) -> torch.Tensor:
         """
-        Obtain newly active nodes (0 -> 1) in the current simulation step.
+        Obtain impulses received by inactive nodes in the current simulation step.
 
         :param T: a filtered sparse adjacency matrix with edges that drawn numbers < p.
         :param S: a dense tensor of nodes' states (0 - inactive, 1 - active, -1 - activated,
             -inf - node does not exist).
-        :return: a dense tensor shaped as S valued by 0s and 1s for newly activated nodes. 
+        :return: a sparse tensor shaped as S with numbers of impulses received by inactive nodes
         """
         S_f = self.mask_S_from(S)
         S_t = self.mask_S_to(S)
-        S_new = ((T * S_f).sum(dim=1) * S_t).to_dense()
-        return S_new
+        return (T * S_f).sum(dim=1) * S_t
 
-    @staticmethod
-    def decay_active_nodes(S: torch.Tensor) -> torch.Tensor:
+    def get_active_nodes(self, T: torch.Tensor, S: torch.Tensor) -> torch.Tensor:
         """
-        Change states of nodes that are active to become activated (aka removed) - (1 -> -1).
+        Obtain newly active nodes (0 -> 1) in the current simulation step.
 
-        :param S: a tensor of nodes' states (0 - inactive, 1 - active, -1 - activated, -inf - node
-            does not exist).
+        :param T: a filtered sparse adjacency matrix with edges that drawn numbers < p.
+        :param S: a dense tensor of nodes' states (0 - inactive, 1 - active, -1 - activated,
+            -inf - node does not exist).
+        :return: a dense tensor shaped as S valued by 0s and 1s for newly activated nodes. 
         """
-        decayed_S = -1. * torch.abs(S)
-        decayed_S[decayed_S == -0.] = 0.
-        return decayed_S
+        return self.get_impulses(T, S).to_dense()
 
     def simulation_step(self, net: nd.MultilayerNetworkTorch, S0: torch.Tensor) -> torch.Tensor:
         """
@@ -121,19 +226,20 @@ class TorchMICModel:
         :param S0: initial tensor of nodes' states (0 - inactive, 1 - active, -1 - activated, -inf - node does not exist)
         :return: updated tensor with nodes' states
         """
-        T = self.draw_live_edges(net.adjacency_tensor, self.probability)
-        S1_raw = self.get_active_nodes(T, S0)
+        A = net.adjacency_tensor
+        T = self.draw_live_edges(A, self.probability, self.draw_random(A._nnz(), A.device))
+        S1_raw = self.get_impulses(T, S0)
         S1_aggregated = self.protocol(S_raw=S1_raw, net=net)
         S0_decayed = self.decay_active_nodes(S0)
         return S1_aggregated + S0_decayed
 
 
 class TorchMICSimulator:
-    """Simulator for TorchMICModel."""
+    """Simulator for TorchMICModel (or another TorchMultilayerModel)."""
 
     def __init__(
         self,
-        model: TorchMICModel,
+        model: TorchMultilayerModel,
         net: nd.MultilayerNetworkTorch,
         n_steps: int,
         seed_set: set[Any],
@@ -154,6 +260,7 @@ class TorchMICSimulator:
         self.device = device
         self.validate_device(device)
         net.device = self.device
+        self.presence = ActorsPresence.from_net(net)
     
     @staticmethod
     def validate_device(device: str | torch.device) -> None:
@@ -201,12 +308,14 @@ class TorchMICSimulator:
             return True
         return False
 
-    @staticmethod
-    def S_nodes_to_actors(S: torch.Tensor) -> torch.Tensor:
-        """Convert tensor of nodes' states to a vector of actors' states."""
-        _S = torch.clone(S)
-        _S[_S == -1 * float("inf")] = 0.
-        return _S.sum(dim=0).clamp(-1, 1)
+    def S_nodes_to_actors(self, S: torch.Tensor) -> torch.Tensor:
+        """
+        Convert tensor of nodes' states to a vector of actors' states.
+
+        States of actor's nodes are equal, so the state is read from the first layer it exists in.
+        """
+        S_actors = S.gather(0, self.presence.first_layer.unsqueeze(0)).squeeze(0)
+        return torch.where(self.presence.layers_nb > 0, S_actors, torch.zeros_like(S_actors))
 
     def count_states(self, S: torch.Tensor) -> dict[int, int]:
         """Count actors not_exposed (0), exposed (-1) and active (1)."""
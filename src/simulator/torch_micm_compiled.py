@@ -0,0 +1,147 @@
+"""Compiled variant of the simulation step of `torch`-based Multilayer Independent Cascade Model."""
+
+import warnings
+from functools import cache
+from typing import Callable
+
+import network_diffusion as nd
+import torch
+
+from src.simulator.torch_micm import TorchMICModel
+
+
+def step_kernel(
+    rand: torch.Tensor,
+    src: torch.Tensor,
+    dst: torch.Tensor,
+    S0: torch.Tensor,
+    p: torch.Tensor,
+    S1_raw: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Compute raw impulses obtained by the nodes in the simulation step of MICM.
+
+    It's equivalent to `TorchMICModel.get_active_nodes`, but the sparse tensor of live edges is
+    replaced by indexing states of edges' ends, what allows to fuse this part of the step.
+
+    :param rand: random numbers drawn for each edge of the adjacency tensor
+    :param src: indices of edges' sources in flattened tensor of nodes' states
+    :param dst: indices of edges' targets in flattened tensor of nodes' states
+    :param S0: tensor of nodes' states (0 - inactive, 1 - active, -1 - activated, -inf - node does
+        not exist)
+    :param p: activation probability as 0-dim tensor
+    :param S1_raw: a flat buffer for impulses sized as the tensor of nodes' states; it's
+        overwritten
+    :return: a dense tensor shaped as S0 with numbers of impulses obtained by inactive nodes
+    """
+    impulses = ((rand < p) & (S0.reshape(-1)[src] > 0)).to(S1_raw.dtype)
+    S1_raw.zero_().index_add_(0, dst, impulses).mul_(S0.reshape(-1) == 0)
+    return S1_raw.view(S0.shape)
+
+
+@cache
+def get_step_kernels() -> list[tuple[str, Callable[..., torch.Tensor]]]:
+    """
+    Compile `step_kernel` with available methods.
+
+    Kernels are ordered from the preferred one: compiled by `torch.compile`, by TorchScript, and
+    the eager one, which is always available. The list is cached, so that compilation happens once
+    per process, and kernels failing at runtime are removed from it for all models.
+
+    :return: names of kernels and kernels themselves
+    """
+    kernels = []
+    try:
+        kernels.append(("torch.compile", torch.compile(step_kernel, dynamic=True)))
+    except Exception as e:
+        warnings.warn(f"torch.compile is unavailable ({e}).")
+    try:
+        kernels.append(("TorchScript", torch.jit.script(step_kernel)))
+    except Exception as e:
+        warnings.warn(f"TorchScript is unavailable ({e}).")
+    kernels.append(("eager", step_kernel))
+    return kernels
+
+
+def run_step_kernel(*args: torch.Tensor) -> torch.Tensor:
+    """
+    Run the preferred kernel computing impulses (see `step_kernel` for arguments).
+
+    If the kernel fails, it's dropped with a warning and the next one is run. The eager kernel is
+    never dropped, so its errors are raised.
+    """
+    kernels = get_step_kernels()
+    while True:
+        name, kernel = kernels[0]
+        try:
+            return kernel(*args)
+        except Exception as e:
+            if kernel is step_kernel:
+                raise e
+            if kernels[0][1] is kernel:
+                kernels.pop(0)
+                warnings.warn(f"Simulation step by {name} failed ({e}), using {kernels[0][0]}.")
+
+
+class TorchMICModelCompiled(TorchMICModel):
+    """
+    Multilayer Independent Cascade Model with a compiled simulation step.
+
+    Indices of edges and buffers for random numbers and impulses are allocated once per network
+    and reused across steps. Only impulses are computed by the compiled kernel, while they are
+    aggregated with protocols of the eager model. Random numbers are drawn in the same way as in
+    the eager model, hence both of them produce the same results for the same state of the random
+    numbers generator.
+    """
+
+    def __init__(self, protocol: str, probability: float) -> None:
+        """
+        Create the object.
+
+        :param protocol: logical operator that determines how to activate actor, see
+            `TorchMICModel` for details
+        :param probability: threshold parameter which activate actor
+        """
+        super().__init__(protocol=protocol, probability=probability)
+        self._buffers = None
+
+    def get_buffers(
+        self, net: nd.MultilayerNetworkTorch
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Get buffers for the given network; create them if the network is seen for the first time.
+
+        :return: flat indices of edges' sources and targets, a buffer for random numbers, the
+            activation probability as a tensor, and a flat buffer for impulses obtained by nodes
+        """
+        if self._buffers is None or self._buffers[0] is not net:
+            indices = net.adjacency_tensor.indices()
+            actors_nb = len(net.actors_map)
+            src = indices[0] * actors_nb + indices[1]
+            dst = indices[0] * actors_nb + indices[2]
+            rand = torch.empty(len(src), dtype=torch.float64, device=src.device)
+            p = torch.tensor(self.probability, dtype=torch.float64, device=src.device)
+            S1_raw = torch.empty(net.nodes_mask.numel(), dtype=torch.float64, device=src.device)
+            self._buffers = (net, src, dst, rand, p, S1_raw)
+        return self._buffers[1:]
+
+    def simulation_step(self, net: nd.MultilayerNetworkTorch, S0: torch.Tensor) -> torch.Tensor:
+        """
+        Perform a single simulation step with the compiled kernel.
+
+        If the kernel can't be executed, the next available one is used from then on (see
+        `run_step_kernel`).
+
+        :param net: a network wtihch is a medium of the diffusion
+        :param S0: initial tensor of nodes' states
+        :return: updated tensor with nodes' states
+        """
+        src, dst, rand, p, S1_raw = self.get_buffers(net)
+        if self.random_chunks is None:
+            rand.uniform_()
+        else:
+            rand = self.random_chunks.draw(len(rand), rand.device)
+        S1_raw = run_step_kernel(rand, src, dst, S0, p, S1_raw)
+        S1_aggregated = self.protocol(S_raw=S1_raw, net=net)
+        S0_decayed = self.decay_active_nodes(S0)
+        return S1_aggregated + S0_decayed
@@ -0,0 +1,89 @@
+"""Variant of `torch`-based Multilayer Independent Cascade Model for dense networks."""
+
+import network_diffusion as nd
+import torch
+
+from src.simulator.torch_micm import TorchMICModel
+
+
+def get_density(net: nd.MultilayerNetworkTorch) -> float:
+    """
+    Compute density of the network as the maximum of densities of its layers.
+
+    A density of a layer is a fraction of existing edges among all possible ones between nodes that
+    exist in it (i.e. were not added artificially). The dense model stores and multiplies the same
+    `[actors x actors]` matrix for each layer, hence a single dense layer makes it worthwhile,
+    whereas the density of the whole network would be lowered by sparse or small layers.
+    """
+    nodes_nb = (net.nodes_mask == 0).sum(dim=1).to(torch.float64)
+    possible_edges_nb = nodes_nb * (nodes_nb - 1)
+    edges_nb = torch.bincount(
+        net.adjacency_tensor._indices()[0], minlength=len(net.layers_order)
+    ).to(torch.float64)
+    layers_densities = edges_nb[possible_edges_nb > 0] / possible_edges_nb[possible_edges_nb > 0]
+    if len(layers_densities) == 0:
+        return 0.
+    return layers_densities.max().item()
+
+
+def to_dense_adjacency(net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+    """Convert sparse adjacency tensor of the network into a dense boolean one."""
+    return net.adjacency_tensor.to_dense() != 0
+
+
+class TorchMICModelDense(TorchMICModel):
+    """
+    Multilayer Independent Cascade Model operating on a dense adjacency tensor.
+
+    For dense networks, indices of the sparse representation cost more than the dense tensor.
+    This model draws live edges only for rows of active actors and propagates impulses with the
+    batched matrix product of active nodes and live edges. Each edge transmits the state with
+    the same probability as in `TorchMICModel`, but random numbers are drawn in a different way,
+    hence results are equal to the ones of the sparse model only in distribution.
+    """
+
+    def __init__(self, protocol: str, probability: float, adjacency: torch.Tensor) -> None:
+        """
+        Create the object.
+
+        :param protocol: logical operator that determines how to activate actor, see
+            `TorchMICModel` for details
+        :param probability: threshold parameter which activate actor
+        :param adjacency: dense boolean adjacency tensor shaped as `[nb layers x nb nodes x nb
+            nodes]` of the network to simulate in
+        """
+        super().__init__(protocol=protocol, probability=probability)
+        self.adjacency = adjacency
+
+    def get_active_nodes_dense(self, S: torch.Tensor) -> torch.Tensor:
+        """
+        Obtain impulses received by inactive nodes in the current simulation step.
+
+        :param S: a dense tensor of nodes' states (0 - inactive, 1 - active, -1 - activated,
+            -inf - node does not exist).
+        :return: a dense tensor shaped as S with numbers of impulses received by inactive nodes
+        """
+        S_active = S > 0
+        active_actors = S_active.any(dim=0).nonzero().squeeze(1)
+        A_active = self.adjacency[:, active_actors, :]
+        if self.random_chunks is None:
+            rand = torch.rand(A_active.shape, device=A_active.device)
+        else:
+            rand = self.random_chunks.draw(A_active.numel(), A_active.device).view(A_active.shape)
+        T_active = A_active & (rand < self.probability)
+        S_from = S_active[:, active_actors].to(torch.float).unsqueeze(1)
+        S_raw = torch.bmm(S_from, T_active.to(torch.float)).squeeze(1)
+        return S_raw * (S == 0)
+
+    def simulation_step(self, net: nd.MultilayerNetworkTorch, S0: torch.Tensor) -> torch.Tensor:
+        """
+        Perform a single simulation step on the dense adjacency tensor.
+
+        :param net: a network wtihch is a medium of the diffusion
+        :param S0: initial tensor of nodes' states
+        :return: updated tensor with nodes' states
+        """
+        S1_raw = self.get_active_nodes_dense(S0)
+        S1_aggregated = self.protocol(S_raw=S1_raw, net=net)
+        S0_decayed = self.decay_active_nodes(S0)
+        return S1_aggregated + S0_decayed
@@ -0,0 +1,107 @@
+"""`torch`-based Multilayer Linear Threshold Model."""
+
+import network_diffusion as nd
+import torch
+
+from src.simulator.torch_micm import TorchMultilayerModel
+
+
+class TorchMLTModel(TorchMultilayerModel):
+    """
+    Multilayer Linear Threshold Model implemented in PyTorch.
+
+    A node gets a positive impulse if a weighted fraction of its active neighbours in the layer
+    exceeds the threshold (as in `nd.models.MLTModel`). Impulses are aggregated from layers with
+    AND or OR protocol. The model follows the contract of `TorchMultilayerModel.simulation_step`,
+    i.e. newly activated nodes are marked with 1. and then decayed to -1., but here decayed nodes
+    keep influencing their neighbours. Hence, the model runs with the same simulators as MICM.
+    Besides states shaped as `[nb layers x nb actors]`, the step accepts batches of them shaped as
+    `[batch size x nb layers x nb actors]`.
+    """
+
+    def __init__(self, protocol: str, threshold: float | torch.Tensor) -> None:
+        """
+        Create the object.
+
+        :param protocol: logical operator that determines how to activate actor can be OR (then
+            actor gets activated if it gets positive input in one layer) or AND (then actor gets
+            activated if it gets positive input in all layers)
+        :param threshold: a fraction of active neighbours which has to be exceeded to activate the
+            node; a tensor broadcastable to states allows to use thresholds per node or per batch
+        """
+        if isinstance(threshold, torch.Tensor):
+            assert ((0 <= threshold) & (threshold <= 1)).all(), "incorrect thresholds!"
+        else:
+            assert 0 <= threshold <= 1, f"incorrect threshold: {threshold}!"
+        super().__init__(protocol=protocol)
+        self.threshold = threshold
+        self.and_protocol = protocol == "AND"
+        self._edges = None
+
+    def get_edges(
+        self, net: nd.MultilayerNetworkTorch
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Get edges of the network; extract them only for a net seen for the first time.
+
+        :return: flat indices of edges' sources and targets in the tensor of states, weights of
+            edges, and total weights of edges incoming to the nodes (flattened as well)
+        """
+        if self._edges is None or self._edges[0] is not net:
+            indices = net.adjacency_tensor.indices()
+            actors_nb = len(net.actors_map)
+            src = indices[0] * actors_nb + indices[1]
+            dst = indices[0] * actors_nb + indices[2]
+            weights = net.adjacency_tensor.values().to(torch.float)
+            in_weights = torch.zeros(net.nodes_mask.numel(), device=weights.device)
+            in_weights = in_weights.index_add_(0, dst, weights)
+            self._edges = (net, src, dst, weights, in_weights)
+        return self._edges[1:]
+
+    def get_impulses(self, net: nd.MultilayerNetworkTorch, S: torch.Tensor) -> torch.Tensor:
+        """
+        Obtain positive impulses received by inactive nodes in the current simulation step.
+
+        :param net: a network which is a medium of the diffusion
+        :param S: a dense tensor of nodes' states (0 - inactive, 1 - active, -1 - activated,
+            -inf - node does not exist) shaped as `[nb layers x nb actors]` or batched
+        :return: a boolean tensor shaped as S with True for nodes which got positive impulses
+        """
+        src, dst, weights, in_weights = self.get_edges(net)
+        S_flat = S.reshape(-1, net.nodes_mask.numel())
+        influence = torch.zeros_like(S_flat).index_add_(
+            1, dst, (S_flat[:, src].abs() == 1).to(S_flat.dtype) * weights
+        )
+        fraction = influence / in_weights.clamp(min=torch.finfo(in_weights.dtype).tiny)
+        return (fraction.view(S.shape) > self.threshold) & (S == 0)
+
+    def aggregate_impulses(
+        self, S_raw: torch.Tensor, net: nd.MultilayerNetworkTorch
+    ) -> torch.Tensor:
+        """
+        Aggregate positive impulses from the layers using the protocol of the model.
+
+        :param S_raw: a boolean tensor of positive impulses shaped as states (can be batched)
+        :param net: a network which is a medium for the diffusion
+        :return: a tensor shaped as `[(batch size) x 1 x nb actors]` with 1. denoting activated
+            actors in this simulation step and 0. denoting actors that weren't activated
+        """
+        layers_nb = S_raw.sum(dim=-2, keepdim=True)
+        if self.and_protocol:
+            activated = (layers_nb > 0) & (layers_nb == self.get_presence(net).layers_nb)
+        else:
+            activated = layers_nb > 0
+        return activated.to(torch.float)
+
+    def simulation_step(self, net: nd.MultilayerNetworkTorch, S0: torch.Tensor) -> torch.Tensor:
+        """
+        Perform a single simulation step.
+
+        :param net: a network wtihch is a medium of the diffusion
+        :param S0: initial tensor of nodes' states (can be batched)
+        :return: updated tensor with nodes' states
+        """
+        S1_raw = self.get_impulses(net, S0)
+        S1_aggregated = self.aggregate_impulses(S1_raw, net)
+        S0_decayed = self.decay_active_nodes(S0)
+        return S1_aggregated + S0_decayed
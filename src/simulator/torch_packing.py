@@ -0,0 +1,167 @@
+"""Packing of many small networks into a single block-diagonal one to simulate them at once."""
+
+from dataclasses import dataclass
+from typing import Any
+
+import network_diffusion as nd
+import torch
+from bidict import bidict
+
+from src.simulator.torch_micm import TorchMICSimulator, TorchMultilayerModel
+
+
+@dataclass(frozen=True)
+class PackedNetwork:
+    net: nd.MultilayerNetworkTorch  # block-diagonal network with actors ided as (block, actor_id)
+    actors_blocks: torch.Tensor  # indices of blocks the actors of `net` belong to
+    blocks_nb: int  # nb. of packed networks
+
+
+def pack_networks(nets: list[nd.MultilayerNetworkTorch]) -> PackedNetwork:
+    """
+    Pack networks into a single one with a block-diagonal adjacency tensor.
+
+    Layers of the packed networks share the same axis, i.e. the i-th layer of the packed network
+    is made from the i-th layers of all networks. If a network has fewer layers than the others,
+    its actors are marked as artificially added (in `nodes_mask`) in the missing layers.
+
+    :param nets: networks to pack, they have to be stored on the same device
+    :return: the packed network and an assignment of its actors to the blocks
+    """
+    layers_nb = max([len(net.layers_order) for net in nets])
+    actors_nb = sum([len(net.actors_map) for net in nets])
+    device = nets[0].device
+
+    adj_indices, adj_values, actors_blocks = [], [], []
+    actors_map = bidict()
+    nodes_mask = torch.ones([layers_nb, actors_nb], device=device)
+    offset = 0
+    for block_idx, net in enumerate(nets):
+        block_size = len(net.actors_map)
+        block_indices = net.adjacency_tensor.indices().clone()
+        block_indices[1:] += offset
+        adj_indices.append(block_indices)
+        adj_values.append(net.adjacency_tensor.values())
+        nodes_mask[:len(net.layers_order), offset:offset + block_size] = net.nodes_mask
+        actors_map.update(
+            {(block_idx, a_id): a_idx + offset for a_id, a_idx in net.actors_map.items()}
+        )
+        actors_blocks.append(torch.full([block_size], block_idx, dtype=torch.long, device=device))
+        offset += block_size
+
+    adjacency_tensor = torch.sparse_coo_tensor(
+        indices=torch.cat(adj_indices, dim=1),
+        values=torch.cat(adj_values),
+        size=[layers_nb, actors_nb, actors_nb],
+    ).coalesce()
+    packed_net = nd.MultilayerNetworkTorch(
+        adjacency_tensor=adjacency_tensor,
+        layers_order=[f"l{l_idx}" for l_idx in range(layers_nb)],
+        actors_map=actors_map,
+        nodes_mask=nodes_mask,
+    )
+    return PackedNetwork(
+        net=packed_net, actors_blocks=torch.cat(actors_blocks), blocks_nb=len(nets)
+    )
+
+
+class TorchPackedMICSimulator(TorchMICSimulator):
+    """Simulator for TorchMICModel which runs independent cascades in blocks of a packed network."""
+
+    def __init__(
+        self,
+        model: TorchMultilayerModel,
+        packed_net: PackedNetwork,
+        n_steps: list[int],
+        seed_sets: list[set[Any]],
+        device: str | torch.device,
+        debug: bool = False
+    ) -> None:
+        """
+        Create the object.
+
+        :param model: a spreading model
+        :param packed_net: networks packed into a single one
+        :param n_steps: limits of simulation steps for consecutive blocks
+        :param seed_sets: sets of initially active actors for consecutive blocks
+        """
+        assert len(n_steps) == len(seed_sets) == packed_net.blocks_nb
+        super().__init__(
+            model=model,
+            net=packed_net.net,
+            n_steps=max(n_steps),
+            seed_set={
+                (block_idx, seed)
+                for block_idx, seed_set in enumerate(seed_sets)
+                for seed in seed_set
+            },
+            device=device,
+            debug=debug,
+        )
+        self.blocks_n_steps = n_steps
+        self.blocks_seed_sets = seed_sets
+        self.actors_blocks = packed_net.actors_blocks.to(device)
+        self.blocks_nb = packed_net.blocks_nb
+
+    def count_states_blockwise(self, S: torch.Tensor) -> list[dict[int, int]]:
+        """Count actors not_exposed (0), exposed (-1) and active (1) in each block."""
+        S_actors = self.S_nodes_to_actors(S).to(torch.long)
+        counts = torch.bincount(
+            self.actors_blocks * 3 + S_actors + 1, minlength=self.blocks_nb * 3
+        ).view(self.blocks_nb, 3).tolist()
+        return [{-1: cnt[0], 0: cnt[1], 1: cnt[2]} for cnt in counts]
+
+    def is_steady_state_blockwise(self, S_i: torch.Tensor, S_j: torch.Tensor) -> list[bool]:
+        """Check which blocks reached a steady state between consecutive states' tensors."""
+        changed_actors = (S_i != S_j).any(dim=0)
+        changed_blocks = torch.bincount(
+            self.actors_blocks[changed_actors], minlength=self.blocks_nb
+        )
+        return (changed_blocks == 0).tolist()
+
+    def perform_propagation(self) -> list[dict[str, Any]]:
+        """Perform propagation and return a list of dictionaries with global results per block."""
+        blocks_logs = [
+            {
+                "simulation_length": None,
+                "exposed": None,
+                "not_exposed": None,
+                "peak_infected": 1,
+                "peak_iteration": 0,
+                "expositions_rec": [len(seed_set)],
+            }
+            for seed_set in self.blocks_seed_sets
+        ]
+        running_blocks = {
+            block_idx for block_idx in range(self.blocks_nb) if self.blocks_n_steps[block_idx] > 1
+        }
+
+        S_i = self.create_states_tensor(self.net, self.seed_set)
+
+        for j in range(1, self.n_steps):
+
+            S_j = self.model.simulation_step(self.net, S_i)
+            step_results = self.count_states_blockwise(S_j)
+            steady_blocks = self.is_steady_state_blockwise(S_i, S_j)
+
+            for block_idx in sorted(running_blocks):
+                block_logs, step_result = blocks_logs[block_idx], step_results[block_idx]
+
+                if step_result[1] > block_logs["peak_infected"]:
+                    block_logs["peak_infected"] = step_result[1]
+                    block_logs["peak_iteration"] = j
+
+                block_logs["expositions_rec"].append(step_result[1])
+
+                if steady_blocks[block_idx] or j == self.blocks_n_steps[block_idx] - 1:
+                    block_logs["simulation_length"] = j + 1
+                    block_logs["exposed"] = step_result[-1] + step_result[1]
+                    block_logs["not_exposed"] = step_result[0]
+                    running_blocks.remove(block_idx)
+
+            if len(running_blocks) == 0:
+                break
+
+            S_i = S_j
+
+        return blocks_logs
@@ -0,0 +1,134 @@
+"""Pruning of networks to components reachable from seeds before the simulation."""
+
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+import network_diffusion as nd
+import torch
+from bidict import bidict
+from scipy.sparse import coo_array
+from scipy.sparse.csgraph import connected_components
+
+
+class ReachabilityPruner:
+    """
+    Compactor of networks to the multilayer component reachable from a seed set.
+
+    Under MICM a cascade can't leave connected components (computed on a network flattened across
+    layers) which contain seeds. Hence, the simulation can be run on the compacted subnetwork
+    without affecting its outcome. Components are computed once per network and the most recently
+    used subnetworks are cached. Networks are not referenced by the cache, so that they can be
+    freed, and their entries are dropped as soon as it happens (then their ids can be reused).
+    """
+
+    def __init__(self, max_cached_subnets: int = 32) -> None:
+        """
+        Create the object.
+
+        :param max_cached_subnets: a number of compacted subnetworks stored for reuse
+        """
+        self.max_cached_subnets = max_cached_subnets
+        self._components: dict[int, torch.Tensor] = {}  # keyed by ids of alive networks
+        self._subnets: OrderedDict[tuple[int, tuple[int, ...]], nd.MultilayerNetworkTorch] = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def get_components(net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+        """
+        Label actors with connected components of the network flattened across layers.
+
+        :param net: a network to find components in
+        :return: a tensor shaped as [nb actors] with component labels of consecutive actors
+        """
+        actors_nb = len(net.actors_map)
+        indices = net.adjacency_tensor.indices().cpu().numpy()
+        flat_adj = coo_array(
+            ([True] * indices.shape[1], (indices[1], indices[2])), shape=(actors_nb, actors_nb)
+        )
+        _, labels = connected_components(flat_adj, directed=True, connection="weak")
+        return torch.from_numpy(labels).to(net.device)
+
+    def get_components_cached(self, net: nd.MultilayerNetworkTorch) -> torch.Tensor:
+        """Get labels of actors' components; compute them only for a net seen for the 1st time."""
+        net_key = id(net)
+        if net_key not in self._components:
+            self._components[net_key] = self.get_components(net)
+            weakref.finalize(net, self._forget, net_key)
+        return self._components[net_key]
+
+    def _forget(self, net_key: int) -> None:
+        """Drop components and subnetworks of the network which has been freed."""
+        self._components.pop(net_key, None)
+        for subnet_key in [key for key in list(self._subnets) if key[0] == net_key]:
+            del self._subnets[subnet_key]
+
+    @staticmethod
+    def compact(net: nd.MultilayerNetworkTorch, keep: torch.Tensor) -> nd.MultilayerNetworkTorch:
+        """
+        Create a subnetwork induced by the given actors.
+
+        :param net: a network to compact
+        :param keep: a boolean mask shaped as [nb actors] marking actors to preserve; it's expected
+            to cover whole components so that no edge connects kept and removed actors
+        :return: the compacted network with original ids of actors
+        """
+        kept_idcs = keep.nonzero().squeeze(1)
+        new_idcs = torch.full([len(keep)], -1, dtype=torch.long, device=keep.device)
+        new_idcs[kept_idcs] = torch.arange(len(kept_idcs), device=keep.device)
+
+        adj_indices = net.adjacency_tensor.indices()
+        kept_edges = keep[adj_indices[1]]
+        sub_indices = torch.stack(
+            [
+                adj_indices[0][kept_edges],
+                new_idcs[adj_indices[1][kept_edges]],
+                new_idcs[adj_indices[2][kept_edges]],
+            ]
+        )
+        sub_adjacency = torch.sparse_coo_tensor(
+            indices=sub_indices,
+            values=net.adjacency_tensor.values()[kept_edges],
+            size=[len(net.layers_order), len(kept_idcs), len(kept_idcs)],
+        ).coalesce()
+
+        actors_idcs = net.actors_map.inverse
+        sub_actors_map = bidict(
+            {actors_idcs[old_idx]: new_idx for new_idx, old_idx in enumerate(kept_idcs.tolist())}
+        )
+        return nd.MultilayerNetworkTorch(
+            adjacency_tensor=sub_adjacency,
+            layers_order=net.layers_order.copy(),
+            actors_map=sub_actors_map,
+            nodes_mask=net.nodes_mask[:, kept_idcs],
+        )
+
+    def prune(
+        self, net: nd.MultilayerNetworkTorch, seed_set: set[Any]
+    ) -> nd.MultilayerNetworkTorch:
+        """
+        Get the subnetwork reachable from the seed set.
+
+        :param net: a network to prune
+        :param seed_set: a set of initially active actors (ids of actors given in the original form)
+        :return: the compacted network or the input one if all its actors are reachable
+        """
+        if len(seed_set) == 0:
+            return net
+        labels = self.get_components_cached(net)
+        seed_idcs = torch.tensor([net.actors_map[seed] for seed in seed_set], dtype=torch.long)
+        seed_components = torch.unique(labels[seed_idcs.to(labels.device)])
+        if len(seed_components) == int(labels.max().item()) + 1:
+            return net
+
+        subnet_key = (id(net), tuple(seed_components.tolist()))
+        if subnet_key in self._subnets:
+            self._subnets.move_to_end(subnet_key)
+            return self._subnets[subnet_key]
+
+        subnet = self.compact(net, torch.isin(labels, seed_components))
+        self._subnets[subnet_key] = subnet
+        if len(self._subnets) > self.max_cached_subnets:
+            self._subnets.popitem(last=False)
+        return subnet
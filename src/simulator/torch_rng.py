@@ -0,0 +1,61 @@
+"""Random numbers for the simulation drawn in large chunks from a dedicated generator."""
+
+import hashlib
+
+import torch
+
+
+def get_case_seed(case_name: str) -> int:
+    """Derive a seed for the generator of the case from its name in a deterministic way."""
+    digest = hashlib.sha256(case_name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & (2 ** 63 - 1)
+
+
+class RandomChunks:
+    """
+    Source of uniform random numbers drawn in chunks which cover many simulation steps.
+
+    A chunk is sized as a number of random numbers requested by the step times the expected length
+    of the cascade times a number of realisations the chunk should serve. The expected length is a
+    mean of lengths of cascades simulated so far. Numbers are returned as views of the chunk, and
+    when the chunk can't serve a request, the rest of it is discarded and a new one is drawn.
+    """
+
+    def __init__(self, seed: int, realisations: int = 1, expected_steps: float = 8.) -> None:
+        """
+        Create the object.
+
+        :param seed: a seed of the generator
+        :param realisations: a number of realisations a single chunk is sized for
+        :param expected_steps: an initial guess of the cascade's length
+        """
+        assert realisations > 0, f"incorrect number of realisations: {realisations}!"
+        self.seed = seed
+        self.realisations = realisations
+        self.expected_steps = expected_steps
+        self.cascades_nb = 0
+        self._generator = None
+        self._chunk = None
+        self._pos = 0
+
+    def draw(self, size: int, device: str | torch.device) -> torch.Tensor:
+        """Get `size` random numbers from [0, 1) as a view of the current chunk."""
+        if self._generator is None:
+            self._generator = torch.Generator(device=device)
+            self._generator.manual_seed(self.seed)
+        if self._chunk is None or self._pos + size > len(self._chunk):
+            chunk_size = max(size, int(size * self.expected_steps * self.realisations))
+            self._chunk = torch.rand(
+                chunk_size, dtype=torch.float64, device=device, generator=self._generator
+            )
+            self._pos = 0
+        sample = self._chunk[self._pos:self._pos + size]
+        self._pos += size
+        return sample
+
+    def record_cascade(self, length: int | None) -> None:
+        """Update the expected length of the cascade with the one of a finished simulation."""
+        if length is None:
+            return
+        self.cascades_nb += 1
+        self.expected_steps += (length - self.expected_steps) / self.cascades_nb
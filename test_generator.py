@@ -0,0 +1,159 @@
+"""Tests of the runner of the generator and of streaming generated networks to simulations."""
+
+import queue
+
+import network_diffusion as nd
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from src import generate_simulate, params_handler
+from src.generator import (
+    generate_into_queue,
+    get_generated_network,
+    get_networks_names,
+    run_experiments,
+)
+from src.loaders.net_loader import MLNABCD_PREFIX
+
+
+class StubProducer:
+    """Stand-in for the process generating networks."""
+
+    def __init__(self, alive: bool) -> None:
+        self.alive = alive
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+
+@pytest.fixture
+def tcase_generator_config():
+    return {
+        "run": {"rng_seed": 43},
+        "mln_config": {
+            "n": 200,
+            "edges_cor": "scripts/configs/example_generate/edges.csv",
+            "layer_params": "scripts/configs/example_generate/layers.csv",
+            "d_max_iter": 1000,
+            "c_max_iter": 1000,
+            "t": 100,
+            "eps": 0.05,
+            "d": 2,
+            "edges_filename": "edges.dat",
+            "communities_filename": "communities.dat",
+        },
+        "generator": {"series": "series_0", "repetitions": 3, "backend": "numpy"},
+    }
+
+
+def test_generated_networks_from_queue(tcase_generator_config):
+    networks_queue = queue.Queue()
+    generate_into_queue(tcase_generator_config, None, 2, networks_queue)
+    producer = StubProducer(alive=True)
+    networks_names = get_networks_names(tcase_generator_config, range(3))
+    for expected_repetition in range(3):
+        repetition, edges = get_generated_network(networks_queue, producer)
+        assert repetition == expected_repetition
+        net = params_handler.create_generated_networks(
+            series="series_0", networks_edges={networks_names[repetition][0]: edges}, device="cpu"
+        )[0]
+        assert net.n_type == MLNABCD_PREFIX
+        assert net.n_name == f"series_0-edges_{repetition}"
+
+        # the tensor network built from edges equals the converted one up to the order of actors
+        converted = nd.MultilayerNetworkTorch.from_mln(net.n_graph_nx)
+        assert net.n_graph_pt.layers_order == converted.layers_order
+        assert set(net.n_graph_pt.actors_map) == set(converted.actors_map)
+        assert net.n_graph_pt.adjacency_tensor._nnz() == converted.adjacency_tensor._nnz()
+        order = [converted.actors_map[a_id] for a_id in net.n_graph_pt.actors_map]
+        assert torch.equal(converted.nodes_mask[:, order], net.n_graph_pt.nodes_mask)
+    assert networks_queue.empty()
+
+
+def test_generated_network_from_stub_producer():
+    networks_queue = queue.Queue()
+    edges = np.array([[1, 2, 1], [2, 3, 1], [1, 3, 2], [4, 4, 2]])
+    networks_queue.put((7, edges))
+    repetition, queued_edges = get_generated_network(networks_queue, StubProducer(alive=True))
+    assert repetition == 7 and queued_edges is edges
+    net = params_handler.create_generated_networks(
+        series="series_1", networks_edges={"edges_7": edges}, device="cpu"
+    )[0]
+    assert (net.n_type, net.n_name) == (MLNABCD_PREFIX, "series_1-edges_7")
+    assert set(net.n_graph_pt.actors_map) == {1, 2, 3}  # the actor with a self-loop only is dropped
+
+
+def test_dead_producer_raises():
+    with pytest.raises(RuntimeError):
+        get_generated_network(queue.Queue(), StubProducer(alive=False), timeout=0.01)
+
+
+@pytest.mark.parametrize("workers, batch_size", [(1, 4), (3, None)])
+def test_networks_independent_of_workers(workers, batch_size, tcase_generator_config, tmp_path):
+    files = {}
+    for run_name, run_workers, run_batch_size in [
+        ("reference", 1, None), ("tested", workers, batch_size)
+    ]:
+        tcase_generator_config["generator"].update(
+            {
+                "repetitions": 5,
+                "out_dir": str(tmp_path / run_name),
+                "workers": run_workers,
+                "batch_size": run_batch_size,
+            }
+        )
+        run_experiments(tcase_generator_config)
+        files[run_name] = {
+            path.name: path.read_bytes() for path in (tmp_path / run_name).iterdir()
+        }
+    assert len(files["reference"]) == 10
+    assert files["reference"] == files["tested"]
+    assert files["reference"]["edges_0.dat"] != files["reference"]["edges_1.dat"]
+
+
+def test_no_workers_raises(tcase_generator_config, tmp_path):
+    tcase_generator_config["generator"].update({"out_dir": str(tmp_path), "workers": 0})
+    with pytest.raises(ValueError):
+        run_experiments(tcase_generator_config)
+
+
+def test_results_written_while_networks_streamed(
+    tcase_generator_config, tmp_path, monkeypatch
+):
+    config = {
+        **tcase_generator_config,
+        "run": {"experiment_type": "generate_simulate", "rng_seed": 43, "device": "cpu"},
+        "parameter_space": {
+            "protocols": ["OR"],
+            "probabs": [0.5],
+            "seed_budgets": [10],
+            "ss_methods": ["deg_c"],
+        },
+        "simulator": {"max_epochs_num": 10, "repetitions": 2},
+        "io": {"ranking_path": None, "compress_to_zip": False, "out_dir": str(tmp_path)},
+    }
+
+    # sizes of results files are read each time the next network is taken from the queue
+    files_sizes = []
+    get_network = generate_simulate.get_generated_network
+
+    def get_network_and_sizes(*args, **kwargs):
+        files_sizes.append(
+            [
+                (tmp_path / f"results--ver-43_{rep}.csv").stat().st_size
+                if (tmp_path / f"results--ver-43_{rep}.csv").exists() else 0
+                for rep in [1, 2]
+            ]
+        )
+        return get_network(*args, **kwargs)
+
+    monkeypatch.setattr(generate_simulate, "get_generated_network", get_network_and_sizes)
+
+    generate_simulate.run_experiments(config)
+    assert len(files_sizes) == 3
+    for sizes, next_sizes in zip(files_sizes[:-1], files_sizes[1:]):
+        assert all(next_size > size for size, next_size in zip(sizes, next_sizes))
+    results_df = pd.read_csv(tmp_path / "results--ver-43_1.csv")
+    assert results_df["network_name"].tolist() == [f"series_0-edges_{idx}" for idx in range(3)]
@@ -0,0 +1,72 @@
+"""Tests of the NumPy generator of MLNABCD networks against properties measured by config_finder."""
+
+import numpy as np
+import pytest
+
+from src.loaders.net_loader import _prepare_network
+from src.mln_abcd.mln_config import MLNConfig
+from src.mln_abcd.numpy_generator import MLNABCDNumpyGenerator
+
+
+@pytest.fixture
+def tcase_mln_config():
+    return MLNConfig.from_yaml(
+        {
+            "seed": 43,
+            "n": 1000,
+            "edges_cor": "scripts/configs/example_generate/edges.csv",
+            "layer_params": "scripts/configs/example_generate/layers.csv",
+            "d_max_iter": 1000,
+            "c_max_iter": 1000,
+            "t": 100,
+            "eps": 0.05,
+            "d": 2,
+            "edges_filename": "edges.dat",
+            "communities_filename": "communities.dat",
+        }
+    )
+
+
+def test_generated_network_follows_config(tcase_mln_config):
+    pytest.importorskip("powerlaw")  # dependencies of config_finder
+    pytest.importorskip("sklearn")
+    from src.mln_abcd.config_finder import config_model
+
+    network = MLNABCDNumpyGenerator().generate_networks(tcase_mln_config, 1)[0]
+    net = _prepare_network(network.to_mln())
+    communities = network.get_communities()
+    layer_params = tcase_mln_config.layer_params
+
+    edges_cor = config_model.get_edges_cor(net)
+    assert np.allclose(edges_cor.to_numpy(), tcase_mln_config.edges_cor.to_numpy(), atol=0.02)
+
+    # degrees are correlated with labels of actors as strongly as given by tau
+    tau = config_model.get_tau(net, alpha=None)
+    assert np.all(np.diff([tau[l_name] for l_name in sorted(net.layers)]) < 0)
+
+    for (l_name, l_graph), (_, params) in zip(sorted(net.layers.items()), layer_params.iterrows()):
+        q = config_model.get_q(l_graph, tcase_mln_config.n)
+        assert q == pytest.approx(params["q"], abs=0.02)
+
+        # noise is measured for communities of the generator, as Louvain merges small ones
+        l_communities = communities.loc[
+            (communities["layer"] == int(l_name)) & (communities["community"] != -1), "community"
+        ]
+        partitions = [
+            set(l_communities.index[l_communities == community] % tcase_mln_config.n + 1)
+            for community in l_communities.unique()
+        ]
+        xi = config_model._avg_partitions_noise(l_graph, partitions)
+        assert xi == pytest.approx(params["xi"], abs=0.1)
+        sizes = l_communities.value_counts()
+        assert sizes.min() >= params["s"] and sizes.max() <= params["S"]
+
+
+def test_generated_networks_reproducible(tcase_mln_config):
+    generator = MLNABCDNumpyGenerator()
+    networks_1 = generator.generate_networks(tcase_mln_config, 2, seeds=[1, 2])
+    networks_2 = generator.generate_networks(tcase_mln_config, 2, seeds=[1, 2])
+    for network_1, network_2 in zip(networks_1, networks_2):
+        assert np.array_equal(network_1.edges, network_2.edges)
+        assert np.array_equal(network_1.communities, network_2.communities)
+    assert not np.array_equal(networks_1[0].edges, networks_1[1].edges)
@@ -7,11 +7,13 @@
 from pathlib import Path
 import os
 
+import numpy as np
 import pandas as pd
 import pytest
 
+from src.result_handler import RaggedArray
 from src.simulator import simulate
-from src.simulator.simulation_step import compute_gain, compute_area
+from src.simulator.simulation_step import compute_areas, compute_gain, compute_gains
 from src.utils import set_rng_seed
 
 
@@ -55,21 +57,26 @@ def compare_results(gt_dir: Path, test_dir: Path, csv_names: list[str]) -> None:
 
 
 def check_integrity(test_df: pd.DataFrame) -> None:
-    test_df["er_temp"] = test_df["expositions_rec"].map(lambda x: x.split(";")).map(lambda x: [int(xx) for xx in x])
-    test_df["g_temp"] = test_df.apply(
-        lambda row: compute_gain(row["exposed_nb"], row["seed_nb"], (row["exposed_nb"] + row["unexposed_nb"])),
-        axis=1
+    expositions = RaggedArray.from_column(test_df["expositions_rec"].astype(str))
+    actors_nb = (test_df["exposed_nb"] + test_df["unexposed_nb"]).to_numpy()
+    g_temp = compute_gains(test_df["exposed_nb"].to_numpy(), test_df["seed_nb"].to_numpy(), actors_nb)
+    a_temp = compute_areas(expositions, test_df["seed_nb"].to_numpy(), actors_nb)
+    er_cumsum = np.concatenate([[0], np.cumsum(expositions.values)])
+    assert test_df["seed_nb"].equals(test_df["seed_ids"].astype(str).str.count(";") + 1)
+    np.testing.assert_array_equal(test_df["seed_nb"], expositions.values[expositions.offsets[:-1]])
+    np.testing.assert_array_equal(test_df["simulation_length"], expositions.lengths)
+    np.testing.assert_array_equal(
+        test_df["exposed_nb"], er_cumsum[expositions.offsets[1:]] - er_cumsum[expositions.offsets[:-1]]
     )
-    test_df["a_temp"] = test_df.apply(
-        lambda row: compute_area(row["er_temp"], row["seed_nb"], (row["exposed_nb"] + row["unexposed_nb"])),
-        axis=1
-    )
-    assert test_df["seed_nb"].equals(test_df["seed_ids"].map(lambda x: x.split(";")).map(lambda x: len(x)))
-    assert test_df["seed_nb"].equals(test_df["er_temp"].map(lambda x: x[0]))
-    assert test_df["simulation_length"].equals(test_df["er_temp"].map(lambda x: len(x)))
-    assert test_df["exposed_nb"].equals(test_df["er_temp"].map(lambda x: sum(x)))
-    assert test_df["gain"].round(3).equals(test_df["g_temp"].round(3))
-    assert test_df["area"].round(3).equals(test_df["a_temp"].round(3))
+    np.testing.assert_allclose(test_df["gain"], g_temp, rtol=1e-5)
+    np.testing.assert_allclose(test_df["area"], a_temp, rtol=1e-5)
+
+
+def test_gains_with_all_actors_seeds_raise():
+    with pytest.raises(ZeroDivisionError):
+        compute_gains(np.array([5, 10]), np.array([2, 10]), np.array([10, 10]))
+    with pytest.raises(ZeroDivisionError):
+        compute_gain(10, 10, 10)
 
 
 @pytest.mark.parametrize(
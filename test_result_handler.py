@@ -0,0 +1,244 @@
+"""Tests of writing and reading results of simulations."""
+
+import json
+from dataclasses import fields, replace
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aux.results_aggregates import (
+    AggregatesCache,
+    get_cases_aggregates,
+    get_metrics_df,
+    get_summary_cases_aggregates,
+    stream_cases_aggregates,
+)
+from src.aux.results_tables import CASE_COLUMNS, RelativeMetrics, get_store_metrics_df
+from src.aux.results_slicer import ResultsSlicer
+from src.result_handler import (
+    RANKINGS_DIR,
+    CaseAggregates,
+    ResultsWriter,
+    SimulationFullResult,
+    get_ranking_ref,
+    merge_summaries,
+    read_results,
+    read_results_chunks,
+    read_summary,
+    save_results,
+    save_summary,
+    update_summary,
+    zip_detailed_logs,
+)
+from src.results_store import ResultsStore
+
+
+@pytest.fixture
+def tcase_results():
+    gt_df = pd.read_csv(Path(__file__).parent / "data/test/results--ver-1959_1.csv")
+    return [SimulationFullResult(**record) for record in gt_df.to_dict("records")]
+
+
+@pytest.mark.parametrize("results_format", ["csv", "parquet"])
+@pytest.mark.parametrize("buffer_size", [None, 1, 7, 1000])
+def test_streamed_csv_equals_saved_at_once(results_format, buffer_size, tcase_results, tmp_path):
+    if results_format == "parquet":
+        pytest.importorskip("pyarrow")
+    save_results(tcase_results, tmp_path / "saved.csv")
+    with ResultsWriter(
+        tmp_path / "streamed.csv", results_format=results_format, buffer_size=buffer_size
+    ) as writer:
+        for idx in range(0, len(tcase_results), 5):
+            writer.write(tcase_results[idx:idx + 5])
+    streamed_path = tmp_path / f"streamed.{results_format}"
+    if results_format == "csv":
+        assert (tmp_path / "saved.csv").read_text() == streamed_path.read_text()
+
+    read_df = read_results(streamed_path)
+    # types of columns in Parquet follow the dataclass, while they're inferred from CSV
+    pd.testing.assert_frame_equal(read_df, read_results(tmp_path / "saved.csv"), check_dtype=False)
+    assert read_df["expositions_rec"].map(sum).equals(read_df["exposed_nb"])
+    assert read_df["seed_ids"].map(len).equals(read_df["seed_nb"])
+    chunks = list(read_results_chunks(streamed_path, chunk_size=7, columns=["gain", "area"]))
+    assert max([len(chunk) for chunk in chunks]) == 7
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), read_df[["gain", "area"]]
+    )
+
+
+@pytest.mark.parametrize("zipped", [False, True])
+def test_seed_ids_expanded_from_ranking(zipped, tcase_results, tmp_path):
+    rankings_dir = tmp_path / RANKINGS_DIR
+    rankings_dir.mkdir()
+    ranking = [{"actor_id": a_id, "layers": ["l1"]} for a_id in [7, 3, 11, 5, 2]]
+    with open(rankings_dir / "ss-deg_c--net-toy--ver-0_1.json", "w") as f:
+        json.dump(ranking, f)
+    if zipped:
+        zip_detailed_logs([rankings_dir], rm_logged_dirs=True)
+    results = [
+        replace(result, seed_ids=get_ranking_ref("ss-deg_c--net-toy--ver-0_1"), seed_nb=seed_nb)
+        for result, seed_nb in zip(tcase_results[:3], [1, 3, 5])
+    ]
+    save_results(results, tmp_path / "results--ver-0_1.csv")
+    read_df = read_results(tmp_path / "results--ver-0_1.csv")
+    assert read_df["seed_ids"].tolist() == [["7"], ["11", "3", "7"], ["11", "2", "3", "5", "7"]]
+
+
+def test_store_slices_equal_loaded_results(tcase_results, tmp_path):
+    mlnabcd_results = [
+        replace(result, network_type="mlnabcd", network_name=f"series_1-{result.network_name}")
+        for result in tcase_results
+    ]
+    save_results([*tcase_results, *mlnabcd_results], tmp_path / "results--ver-1959_1.csv")
+    in_memory = ResultsSlicer([tmp_path / "results--ver-1959_1.csv"], "series_1", True)
+    with ResultsStore(tmp_path / "results.db") as store:
+        store.import_results(tmp_path / "results--ver-1959_1.csv")
+        queried = ResultsSlicer([], "series_1", True, results_store=store)
+        assert list(queried.get_combinations()) == list(in_memory.get_combinations())
+        assert list(queried.get_net_types()) == list(in_memory.get_net_types())
+        for case, net_type in product(in_memory.get_combinations(), in_memory.get_net_types()):
+            mem_slice = in_memory.get_slice(*case, net_type=net_type).reset_index(drop=True)
+            mem_slice = mem_slice.astype({c: object for c in ResultsSlicer.categorical_columns})
+            db_slice = queried.get_slice(*case, net_type=net_type)
+            pd.testing.assert_frame_equal(db_slice[mem_slice.columns], mem_slice, check_dtype=False)
+            if len(mem_slice) > 0:
+                np.testing.assert_equal(
+                    queried.mean_expositions_rec(db_slice),
+                    in_memory.mean_expositions_rec(in_memory.get_slice(*case, net_type=net_type)),
+                )
+
+
+def test_mean_expositions_recs_equal_padded(tcase_results, tmp_path):
+    save_results(tcase_results, tmp_path / "results--ver-1959_1.csv")
+    slicer = ResultsSlicer([tmp_path / "results--ver-1959_1.csv"], "smallreal")
+    expositions_recs = slicer.mean_expositions_recs()
+    for case, net_type in product(slicer.get_combinations(), slicer.get_net_types()):
+        slice_df = read_results(tmp_path / "results--ver-1959_1.csv").iloc[
+            slicer.get_slice(*case, net_type=net_type).index
+        ]
+        if len(slice_df) == 0:
+            continue
+        max_len = slice_df["expositions_rec"].map(len).max()
+        padded = np.array([rec + [0] * (max_len - len(rec)) for rec in slice_df["expositions_rec"]])
+        exp_rec = expositions_recs[(*case, net_type)]
+        np.testing.assert_array_equal(exp_rec["avg"], padded.mean(axis=0).round(3))
+        np.testing.assert_array_equal(exp_rec["std"], padded.std(axis=0).round(3))
+        np.testing.assert_array_equal(exp_rec["cdf"], padded.mean(axis=0).cumsum().round(3))
+
+        # curves of the slice are matched by rows of results also if the slice is reordered
+        sorted_rec = slicer.mean_expositions_rec(
+            slicer.get_slice(*case, net_type=net_type).sort_values("gain")
+        )
+        np.testing.assert_array_equal(sorted_rec["avg"], exp_rec["avg"])
+        with pytest.raises(ValueError):
+            slicer.mean_expositions_rec(
+                slicer.get_slice(*case, net_type=net_type).reset_index(drop=True)
+            )
+
+
+def test_incremental_aggregates_equal_full(tcase_results, tmp_path):
+    paths = [tmp_path / f"results--ver-1959_{rep}.csv" for rep in range(1, 4)]
+    save_results(tcase_results, paths[0])
+    save_results(tcase_results[::2], paths[1])
+    save_results([r for r in tcase_results if r.protocol == "AND"], paths[2])
+    cache = AggregatesCache(tmp_path / "aggregates.pkl")
+    assert len(cache.update(paths[:2])) > 0
+    cache.save()
+
+    cache = AggregatesCache(tmp_path / "aggregates.pkl")
+    assert cache.update(paths[:2]) == set()
+    affected = cache.update(paths)
+    assert affected and all(case[0] == "AND" for case in affected)
+
+    full = ResultsSlicer(paths, "smallreal")
+    expositions_recs = full.mean_expositions_recs()
+    for case, case_aggregates in cache.get_aggregates().items():
+        slice_df = full.get_slice(*case)
+        np.testing.assert_allclose(
+            list(case_aggregates.get_metrics().values()),
+            [slice_df["gain"].mean(), slice_df["gain"].std(), slice_df["area"].mean(),
+             slice_df["area"].std()],
+            rtol=1e-6,
+        )
+        for key, value in case_aggregates.get_expositions_rec().items():
+            np.testing.assert_allclose(value, expositions_recs[case][key], atol=1e-3)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 10, 1000])
+def test_streamed_aggregates_equal_loaded(chunk_size, tcase_results, tmp_path):
+    paths = [tmp_path / f"results--ver-1959_{rep}.csv" for rep in range(1, 3)]
+    save_results(tcase_results, paths[0])
+    save_results(
+        [replace(r, network_type="mlnabcd", network_name=f"series_1-{r.network_name}")
+         for r in tcase_results[::3]],
+        paths[1],
+    )
+    loaded_aggregates = get_cases_aggregates(ResultsSlicer(paths, "series_1"))
+    streamed_aggregates = stream_cases_aggregates(paths, chunk_size)
+    assert streamed_aggregates.keys() == loaded_aggregates.keys()
+    for case, case_aggregates in streamed_aggregates.items():
+        for field in fields(CaseAggregates):
+            np.testing.assert_allclose(
+                getattr(case_aggregates, field.name),
+                getattr(loaded_aggregates[case], field.name),
+                rtol=1e-9,
+                atol=1e-9,
+            )
+
+
+def test_summary_equals_aggregated_results(tcase_results, tmp_path):
+    summaries = [{}, {}]
+    for idx in range(0, len(tcase_results), 7):
+        update_summary(summaries[idx % 2], tcase_results[idx:idx + 7])
+    save_summary(summaries[0], tmp_path / "summary_0.csv")
+    save_summary(summaries[1], tmp_path / "summary_1.csv")
+    summary = merge_summaries(
+        [read_summary(tmp_path / "summary_0.csv"), read_summary(tmp_path / "summary_1.csv")]
+    )
+
+    save_results(tcase_results, tmp_path / "results--ver-1959_1.csv")
+    results_aggregates = get_cases_aggregates(
+        ResultsSlicer([tmp_path / "results--ver-1959_1.csv"], "smallreal")
+    )
+    summary_aggregates = get_summary_cases_aggregates(summary)
+    assert summary_aggregates.keys() == results_aggregates.keys()
+    for case, case_aggregates in summary_aggregates.items():
+        for field in fields(CaseAggregates):
+            np.testing.assert_allclose(
+                getattr(case_aggregates, field.name),
+                getattr(results_aggregates[case], field.name),
+                rtol=1e-9,
+                atol=1e-9,
+            )
+
+
+def test_relative_tables_from_store(tcase_results, tmp_path):
+    results = [
+        replace(result, network_type="mlnabcd", network_name=f"series_{idx}-{result.network_name}")
+        for idx in range(1, 4)
+        for result in tcase_results
+        if idx < 3 or result.protocol == "AND"
+    ]
+    save_results(results, tmp_path / "results--ver-1959_1.csv")
+    with ResultsStore(tmp_path / "results.db") as store:
+        store.import_results(tmp_path / "results--ver-1959_1.csv")
+        metrics_df = get_store_metrics_df(store)
+    cases_aggregates = get_cases_aggregates(
+        ResultsSlicer([tmp_path / "results--ver-1959_1.csv"], "series_1")
+    )
+    pd.testing.assert_frame_equal(metrics_df, get_metrics_df(cases_aggregates), check_dtype=False)
+
+    required_types = ("series_3", "series_1", "series_2")
+    relative_metrics = RelativeMetrics(metrics_df, "series_1")
+    relative_df = relative_metrics.get_relative(required_types)
+    assert set(relative_df["protocol"]) == {"AND"}
+    baseline = relative_df.loc[relative_df["net_type"] == "series_1"].set_index(CASE_COLUMNS)
+    for _, row in relative_df.iterrows():
+        reference = baseline.loc[tuple(row[CASE_COLUMNS]), "gain_avg"]
+        np.testing.assert_allclose(row["gain_avg_rel"], (row["gain_avg"] - reference) / reference)
+    table = relative_metrics.get_table(required_types, "probab", protocol="AND")
+    assert list(table.columns) == [("gain_avg_rel", net_type) for net_type in required_types]
+    assert relative_metrics.get_relative(required_types) is relative_df
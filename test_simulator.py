@@ -0,0 +1,477 @@
+"""Tests of the simulator: parity between variants of the engine and the reference eager model."""
+
+import gc
+import warnings
+from dataclasses import replace
+from itertools import cycle
+from math import inf, sqrt
+
+import network_diffusion as nd
+import numpy as np
+import pytest
+import torch
+from bidict import bidict
+
+from src.loaders.net_loader import _prepare_network, load_network
+from src.mln_abcd.julia_reader import edges_to_mlnt, load_edgelist
+from src.params_handler import Network
+from src.result_handler import SimulationFullResult, SimulationRealisationsRecord
+from src.simulator import adaptive_runner, torch_micm_compiled
+from src.simulator.torch_compact import (
+    CompactNetwork, TorchCompactMICSimulator, TorchMICModelCompact
+)
+from src.simulator.torch_micm import TorchMICModel, TorchMICSimulator
+from src.simulator.torch_micm_compiled import TorchMICModelCompiled
+from src.simulator.torch_micm_dense import TorchMICModelDense, get_density, to_dense_adjacency
+from src.simulator.torch_mltm import TorchMLTModel
+from src.simulator.engine import SimulationEngine
+from src.simulator.simulation_step import experiment_step, logs_to_spr
+from src.simulator.torch_packing import TorchPackedMICSimulator, pack_networks
+from src.simulator.torch_pruning import ReachabilityPruner
+from src.simulator.torch_rng import RandomChunks, get_case_seed
+from src.utils import set_rng_seed
+
+
+def load_network_pt(net_type: str, net_name: str) -> nd.MultilayerNetworkTorch:
+    net_graph = list(load_network(net_type=net_type, net_name=net_name).values())[0]
+    return nd.MultilayerNetworkTorch.from_mln(net_graph)
+
+
+@pytest.fixture
+def tcase_toy_network():
+    return load_network_pt("smallreal", "toy_network")
+
+
+@pytest.fixture
+def tcase_l2_course_network():
+    return load_network_pt("smallreal", "l2_course_net_1")
+
+
+def run_propagation(model: TorchMICModel, net: nd.MultilayerNetworkTorch, seed: int) -> dict:
+    set_rng_seed(seed)
+    seed_set = set(list(net.actors_map.keys())[:2])
+    simulator = TorchMICSimulator(model, net, n_steps=20, seed_set=seed_set, device="cpu")
+    return simulator.perform_propagation()
+
+
+@pytest.mark.parametrize("tcase_net", ["tcase_toy_network", "tcase_l2_course_network"])
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("probability", [0.9, 0.5, 0.1])
+def test_compiled_step_parity(tcase_net, protocol, probability, request):
+    net = request.getfixturevalue(tcase_net)
+    S0 = TorchMICSimulator(
+        TorchMICModel(protocol, probability), net, n_steps=1, seed_set=set(), device="cpu"
+    ).create_states_tensor(net, set(list(net.actors_map.keys())[:3]))
+    set_rng_seed(43)
+    S1_eager = TorchMICModel(protocol, probability).simulation_step(net, S0)
+    set_rng_seed(43)
+    compiled_model = TorchMICModelCompiled(protocol, probability)
+    S1_compiled = compiled_model.simulation_step(net, S0)
+    assert torch.equal(S1_eager, S1_compiled)
+    impulses_buffer = compiled_model.get_buffers(net)[-1]
+    compiled_model.simulation_step(net, S1_compiled)
+    assert compiled_model.get_buffers(net)[-1] is impulses_buffer
+    for seed in range(5):
+        logs_eager = run_propagation(TorchMICModel(protocol, probability), net, seed)
+        logs_compiled = run_propagation(TorchMICModelCompiled(protocol, probability), net, seed)
+        assert logs_eager == logs_compiled
+
+
+def test_compiled_step_fallback(tcase_toy_network, monkeypatch):
+    def raise_error(*args):
+        raise RuntimeError("unsupported")
+
+    kernels = [
+        ("torch.compile", lambda *args: raise_error()),
+        ("TorchScript", lambda *args: raise_error()),
+        ("eager", torch_micm_compiled.step_kernel),
+    ]
+    monkeypatch.setattr(torch_micm_compiled, "get_step_kernels", lambda: kernels)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        for seed in range(3):
+            logs_eager = run_propagation(TorchMICModel("OR", 0.5), tcase_toy_network, seed)
+            logs_compiled = run_propagation(
+                TorchMICModelCompiled("OR", 0.5), tcase_toy_network, seed
+            )
+            assert logs_eager == logs_compiled
+
+    # each failing kernel is dropped once, with a single warning, for all models
+    assert [name for name, _ in kernels] == ["eager"]
+    assert [str(warning.message) for warning in caught] == [
+        "Simulation step by torch.compile failed (unsupported), using TorchScript.",
+        "Simulation step by TorchScript failed (unsupported), using eager.",
+    ]
+
+
+@pytest.mark.parametrize("tcase_net", ["tcase_toy_network", "tcase_l2_course_network"])
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("probability", [1., 0.])
+def test_dense_model_parity(tcase_net, protocol, probability, request):
+    net = request.getfixturevalue(tcase_net)
+    dense_model = TorchMICModelDense(protocol, probability, adjacency=to_dense_adjacency(net))
+    logs_sparse = run_propagation(TorchMICModel(protocol, probability), net, 43)
+    logs_dense = run_propagation(dense_model, net, 43)
+    assert logs_sparse == logs_dense
+
+
+@pytest.mark.parametrize("net_form", ["dense", "compact"])
+def test_converted_nets_cache(net_form):
+    # networks are loaded here, since fixtures are referenced by pytest until the end of the test
+    toy_net = load_network_pt("smallreal", "toy_network")
+    l2_net = load_network_pt("smallreal", "l2_course_net_1")
+    engine = SimulationEngine(max_cached_nets=1)
+    get_converted, convert, cache = {
+        "dense": (engine.get_dense_adjacency, to_dense_adjacency, engine._dense_adjacencies),
+        "compact": (engine.get_compact_network, CompactNetwork.from_net, engine._compact_nets),
+    }[net_form]
+    converted = get_converted(toy_net)
+    if net_form == "dense":
+        assert torch.equal(converted, convert(toy_net))
+    else:
+        assert torch.equal(converted.edges_src, convert(toy_net).edges_src)
+        assert torch.equal(converted.edges_dst, convert(toy_net).edges_dst)
+    assert get_converted(toy_net) is converted
+    get_converted(l2_net)
+    assert len(cache) == 1
+    assert get_converted(toy_net) is not converted
+
+    # the cache doesn't keep networks alive
+    del toy_net, l2_net
+    gc.collect()
+    assert len(cache) == 0
+
+
+def test_density_of_mixed_network():
+    def create_net(layers_edges: list[list[tuple[int, int]]], layers_actors: list[int]):
+        indices = torch.tensor(
+            [[l_idx, *edge] for l_idx, edges in enumerate(layers_edges) for edge in edges]
+        ).T
+        nodes_mask = torch.ones([len(layers_actors), 20])
+        for l_idx, actors_nb in enumerate(layers_actors):
+            nodes_mask[l_idx, :actors_nb] = 0.
+        return nd.MultilayerNetworkTorch(
+            adjacency_tensor=torch.sparse_coo_tensor(
+                indices, torch.ones(indices.shape[1]), size=[len(layers_actors), 20, 20]
+            ).coalesce(),
+            layers_order=[f"l{l_idx}" for l_idx in range(len(layers_actors))],
+            actors_map=bidict({a_id: a_id for a_id in range(20)}),
+            nodes_mask=nodes_mask,
+        )
+
+    # a complete layer of 5 actors, a path over 20 actors, and an empty layer (which is skipped)
+    complete_edges = [(src, dst) for src in range(5) for dst in range(5) if src != dst]
+    path_edges = [(src, src + 1) for src in range(19)]
+    mixed_net = create_net([complete_edges, path_edges, []], [5, 20, 0])
+    sparse_net = create_net([path_edges, []], [20, 0])
+    assert get_density(mixed_net) == 1.  # while 39 / 400 edges exist in the whole network
+    assert get_density(sparse_net) == 19 / 380
+    engine = SimulationEngine(dense_threshold=0.5)
+    assert isinstance(engine.get_model("OR", 0.5, mixed_net), TorchMICModelDense)
+    assert not isinstance(engine.get_model("OR", 0.5, sparse_net), TorchMICModelDense)
+
+
+@pytest.mark.parametrize("tcase_net", ["tcase_toy_network", "tcase_l2_course_network"])
+@pytest.mark.parametrize("absent_actor", [False, True])
+def test_scatter_aggregation_parity(tcase_net, absent_actor, request):
+    net = request.getfixturevalue(tcase_net)
+    if absent_actor:  # an actor which doesn't exist in any layer is activated by AND (as by `all`)
+        nodes_mask = net.nodes_mask.clone()
+        nodes_mask[:, 0] = 1.
+        net = nd.MultilayerNetworkTorch(
+            adjacency_tensor=net.adjacency_tensor,
+            layers_order=net.layers_order,
+            actors_map=net.actors_map,
+            nodes_mask=nodes_mask,
+        )
+    model = TorchMICModel("AND", 0.5)
+    set_rng_seed(43)
+    for _ in range(20):
+        S_raw = (torch.rand(net.nodes_mask.shape) < 0.8).to(torch.float) * (1 - net.nodes_mask)
+        S_and = (S_raw + net.nodes_mask > 0).all(dim=0).to(torch.float)
+        S_or = (S_raw > 0).any(dim=0).to(torch.float)
+        assert torch.equal(model.protocol_AND(S_raw, net), S_and)
+        assert torch.equal(model.protocol_AND(S_raw.to_sparse(), net), S_and)
+        assert torch.equal(model.protocol_OR(S_raw, net), S_or)
+        assert torch.equal(model.protocol_OR(S_raw.to_sparse(), net), S_or)
+
+
+@pytest.mark.parametrize("tcase_net", ["tcase_toy_network", "tcase_l2_course_network"])
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("probability", [0.9, 0.5, 0.1])
+def test_compact_network_parity(tcase_net, protocol, probability, request):
+    net = request.getfixturevalue(tcase_net)
+    compact_net = CompactNetwork.from_net(net)
+    seed_set = set(list(net.actors_map.keys())[:2])
+    for seed in range(5):
+        logs_default = run_propagation(TorchMICModel(protocol, probability), net, seed)
+        set_rng_seed(seed)
+        logs_compact = TorchCompactMICSimulator(
+            TorchMICModelCompact(protocol, probability),
+            compact_net,
+            n_steps=20,
+            seed_set=seed_set,
+            device="cpu",
+        ).perform_propagation()
+        assert logs_default == logs_compact
+
+
+@pytest.mark.parametrize("block_idx", [0, 1])
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("probability", [1., 0.])
+def test_pruning_parity(
+    block_idx, protocol, probability, tcase_toy_network, tcase_l2_course_network
+):
+    # fixture networks are connected, hence, they're packed into a network of two components
+    net = pack_networks([tcase_toy_network, tcase_l2_course_network]).net
+    seed_set = {a_id for a_id in net.actors_map if a_id[0] == block_idx}
+    seed_set = set(sorted(seed_set)[:2])
+    pruner = ReachabilityPruner()
+    pruned_net = pruner.prune(net, seed_set)
+    assert len(pruned_net.actors_map) == len(
+        [tcase_toy_network, tcase_l2_course_network][block_idx].actors_map
+    )
+    assert pruner.prune(net, seed_set) is pruned_net
+    sprs = []
+    for sim_net in [net, pruned_net]:
+        logs = TorchMICSimulator(
+            TorchMICModel(protocol, probability), sim_net, n_steps=20, seed_set=seed_set,
+            device="cpu", debug=True,
+        ).perform_propagation()
+        sprs.append(logs_to_spr(logs, seed_set, len(seed_set), len(net.actors_map)))
+    assert sprs[0] == sprs[1]
+
+    # the cache doesn't keep networks alive
+    del net, pruned_net
+    gc.collect()
+    assert len(pruner._components) == 0 and len(pruner._subnets) == 0
+
+
+@pytest.mark.parametrize("model_class", [TorchMICModel, TorchMICModelCompiled])
+def test_random_chunks_reproducibility(model_class, tcase_l2_course_network):
+    logs = []
+    for case_name in ["case_a", "case_a", "case_b"]:
+        model = model_class("OR", 0.5)
+        model.random_chunks = RandomChunks(get_case_seed(case_name), realisations=2)
+        case_logs = []
+        for seed in range(5):
+            case_logs.append(run_propagation(model, tcase_l2_course_network, seed))
+            model.random_chunks.record_cascade(case_logs[-1]["simulation_length"])
+        logs.append(case_logs)
+    assert logs[0] == logs[1]
+    assert logs[0] != logs[2]
+
+
+def test_random_chunks_shared_by_cases(tcase_l2_course_network):
+    net_mln = list(load_network(net_type="smallreal", net_name="l2_course_net_1").values())[0]
+    net = Network("smallreal", "l2_course_net_1", tcase_l2_course_network, net_mln)
+    ranking = sorted(net_mln.get_actors(), key=lambda actor: str(actor.actor_id))
+    results, chunks = [], []
+    for _ in range(2):
+        engine = SimulationEngine(rng_chunk_realisations=4).for_stream("net--ver-1")
+        results.append([])
+        for p in [0.9, 0.5, 0.1, 0.9, 0.5, 0.1]:
+            results[-1].append(experiment_step("OR", p, (0, 10), net, ranking, 20, engine))
+            chunks.append(engine.random_chunks._chunk)
+    assert results[0] == results[1]
+
+    # cascades of consecutive cases consume the same chunk instead of drawing their own ones
+    assert len({id(chunk) for chunk in chunks[:6]}) < 6
+
+
+def reference_mltm_step(net: nd.MultilayerNetwork, active: set, protocol: str, mi: float) -> set:
+    activated = set()
+    for actor in net.get_actors():
+        if actor.actor_id in active:
+            continue
+        impulses = []
+        for l_name in actor.layers:
+            l_graph = net.layers[l_name]
+            weights = {n: w for _, n, w in l_graph.edges(actor.actor_id, data="weight", default=1)}
+            active_weight = sum([w for n, w in weights.items() if n in active])
+            impulses.append(len(weights) > 0 and active_weight / sum(weights.values()) > mi)
+        if (all if protocol == "AND" else any)(impulses):
+            activated.add(actor.actor_id)
+    return active | activated
+
+
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("threshold", [0., 0.2, 0.5])
+def test_mltm_reference(protocol, threshold):
+    net_mln = list(load_network(net_type="smallreal", net_name="l2_course_net_1").values())[0]
+    net = nd.MultilayerNetworkTorch.from_mln(net_mln)
+    seed_set = set(list(net.actors_map.keys())[:3])
+    model = TorchMLTModel(protocol, threshold)
+    simulator = TorchMICSimulator(model, net, n_steps=20, seed_set=seed_set, device="cpu")
+    S, active = simulator.create_states_tensor(net, seed_set), seed_set
+    for _ in range(10):
+        S = model.simulation_step(net, S)
+        active = reference_mltm_step(net_mln, active, protocol, threshold)
+        S_actors = simulator.S_nodes_to_actors(S)
+        assert {a_id for a_id, a_idx in net.actors_map.items() if S_actors[a_idx] != 0} == active
+
+
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+def test_mltm_batched_and_packed(protocol, tcase_toy_network, tcase_l2_course_network):
+    nets = [tcase_toy_network, tcase_l2_course_network]
+    seed_sets = [set(list(net.actors_map.keys())[:2]) for net in nets]
+    simulator = TorchMICSimulator(
+        TorchMLTModel(protocol, 0.3), nets[1], n_steps=1, seed_set=set(), device="cpu"
+    )
+    S0 = torch.stack(
+        [
+            simulator.create_states_tensor(nets[1], set(list(nets[1].actors_map.keys())[i:i + 3]))
+            for i in range(4)
+        ]
+    )
+    S1 = TorchMLTModel(protocol, 0.3).simulation_step(nets[1], S0)
+    for S0_i, S1_i in zip(S0, S1):
+        assert torch.equal(TorchMLTModel(protocol, 0.3).simulation_step(nets[1], S0_i), S1_i)
+    logs_packed = TorchPackedMICSimulator(
+        TorchMLTModel(protocol, 0.3),
+        pack_networks(nets),
+        n_steps=[20, 20],
+        seed_sets=seed_sets,
+        device="cpu",
+    ).perform_propagation()
+    for net, seed_set, logs in zip(nets, seed_sets, logs_packed):
+        assert TorchMICSimulator(
+            TorchMLTModel(protocol, 0.3), net, n_steps=20, seed_set=seed_set, device="cpu"
+        ).perform_propagation() == logs
+
+
+@pytest.mark.parametrize("protocol", ["OR", "AND"])
+@pytest.mark.parametrize("probability", [1., 0.])
+@pytest.mark.parametrize("n_steps", [[20, 20], [3, 20], [20, 2], [1, 5]])
+def test_micm_packed_parity(
+    protocol, probability, n_steps, tcase_toy_network, tcase_l2_course_network
+):
+    nets = [tcase_toy_network, tcase_l2_course_network]
+    seed_sets = [set(list(net.actors_map.keys())[:2]) for net in nets]
+    logs_packed = TorchPackedMICSimulator(
+        TorchMICModel(protocol, probability),
+        pack_networks(nets),
+        n_steps=n_steps,
+        seed_sets=seed_sets,
+        device="cpu",
+    ).perform_propagation()
+    for net, net_n_steps, seed_set, logs in zip(nets, n_steps, seed_sets, logs_packed):
+        assert TorchMICSimulator(
+            TorchMICModel(protocol, probability),
+            net,
+            n_steps=net_n_steps,
+            seed_set=seed_set,
+            device="cpu",
+        ).perform_propagation() == logs
+
+
+def test_mlnt_from_edges_equals_converted(tmp_path):
+    rng = np.random.default_rng(43)
+    edges = np.concatenate(
+        [
+            np.column_stack([rng.integers(1, 60, size), rng.integers(1, 60, size), [layer] * size])
+            for layer, size in [(2, 80), (1, 120), (3, 10)]
+        ]
+        + [[[61, 61, 3]]]
+    )
+    np.savetxt(tmp_path / "edges.dat", edges, fmt="%d", delimiter="\t")
+    converted = nd.MultilayerNetworkTorch.from_mln(
+        _prepare_network(load_edgelist(tmp_path / "edges.dat"))
+    )
+    built = edges_to_mlnt(edges)
+    assert built.layers_order == converted.layers_order
+    assert built.actors_map.keys() == converted.actors_map.keys()
+    order = torch.tensor([converted.actors_map[a_id] for a_id in built.actors_map])
+    built_idx = built.adjacency_tensor.indices()
+    reordered = torch.sparse_coo_tensor(
+        torch.stack([built_idx[0], order[built_idx[1]], order[built_idx[2]]]),
+        built.adjacency_tensor.values(),
+        size=converted.adjacency_tensor.shape,
+    ).coalesce()
+    assert torch.equal(reordered.indices(), converted.adjacency_tensor.indices())
+    assert torch.equal(reordered.values(), converted.adjacency_tensor.values())
+    assert torch.equal(converted.nodes_mask[:, order], built.nodes_mask)
+
+
+def run_adaptive_case(
+    monkeypatch: pytest.MonkeyPatch,
+    criterion: adaptive_runner.StoppingCriterion,
+    gains: list[float],
+    areas: list[float | None],
+) -> tuple[list[SimulationFullResult], SimulationRealisationsRecord, list[int]]:
+    """Run the adaptive case whose realisations yield the given gains and areas (in cycle)."""
+    template = SimulationFullResult(
+        seed_ids="1", gain=0., area=0., simulation_length=1, seed_nb=1, exposed_nb=1,
+        unexposed_nb=0, expositions_rec="1", network_type="t", network_name="n", ss_method="s",
+        seed_budget=1., protocol="OR", probab=1.,
+    )
+    metrics = cycle(zip(gains, areas))
+    monkeypatch.setattr(
+        adaptive_runner.ranking_runner,
+        "handle_step",
+        lambda **_: [replace(template, **dict(zip(["gain", "area"], next(metrics))))],
+    )
+    checks_lengths = []  # nb. of gains the interval is computed for at consecutive checks
+    ci_half_width = adaptive_runner.ci_half_width
+    monkeypatch.setattr(
+        adaptive_runner,
+        "ci_half_width",
+        lambda values, confidence: (
+            checks_lengths.append(len(values)) or ci_half_width(values, confidence)
+        ),
+    )
+    case_results, case_record = adaptive_runner.handle_step(
+        proto="OR",
+        p=1.,
+        budget=(0., 1.),
+        ss_method="s",
+        net=Network("t", "n", None, None),
+        ranking=[],
+        max_epochs_num=1,
+        criterion=criterion,
+    )
+    return case_results, case_record, checks_lengths[::2]
+
+
+def test_ci_half_width():
+    assert adaptive_runner.ci_half_width([], 0.95) == inf
+    assert adaptive_runner.ci_half_width([3.], 0.95) == inf
+    assert adaptive_runner.ci_half_width([2., 2., 2.], 0.95) == 0.
+    assert adaptive_runner.ci_half_width([1., 2., 3.], 0.95) == pytest.approx(1.959964 / sqrt(3))
+    assert adaptive_runner.ci_half_width([1., 2., 3.], 0.99) == pytest.approx(2.575829 / sqrt(3))
+
+
+def test_adaptive_case_stops_when_both_intervals_met(monkeypatch):
+    criterion = adaptive_runner.StoppingCriterion(
+        batch_size=4, max_realisations=100, gain_ci=0.5, area_ci=0.5
+    )
+
+    # half-width of gains is ~0.57 after 4 realisations and ~0.37 after 8 of them
+    case_results, case_record, checks = run_adaptive_case(
+        monkeypatch, criterion, gains=[0., 1.], areas=[0.5, 0.5]
+    )
+    assert checks == [4, 8]
+    assert len(case_results) == case_record.realisations_nb == 8
+    assert case_record.converged
+    assert case_record.gain_ci <= 0.5 and case_record.area_ci == 0.
+
+    # the interval of areas is computed only for realisations which produced the area, i.e. it's
+    # ~0.44 for 6 of them after 12 realisations (taking missing ones as 0 would stop after 8)
+    case_results, case_record, checks = run_adaptive_case(
+        monkeypatch, criterion, gains=[0.5, 0.5, 0.5, 0.5], areas=[0., 1., None, None]
+    )
+    assert checks == [4, 8, 12]
+    assert case_record.realisations_nb == 12 and case_record.converged
+
+
+def test_adaptive_case_capped(monkeypatch):
+    criterion = adaptive_runner.StoppingCriterion(
+        batch_size=4, max_realisations=10, gain_ci=0.01, area_ci=0.01
+    )
+    case_results, case_record, checks = run_adaptive_case(
+        monkeypatch, criterion, gains=[0., 1.], areas=[0., 1.]
+    )
+    assert checks == [4, 8, 10]  # the last batch is cut to the cap
+    assert len(case_results) == case_record.realisations_nb == 10
+    assert not case_record.converged
+    assert case_record.gain_ci == pytest.approx(adaptive_runner.ci_half_width([0., 1.] * 5, 0.95))